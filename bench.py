@@ -0,0 +1,453 @@
+"""studyBot 부하 벤치마크.
+
+가짜 디스코드 객체(길드/채널/멤버/메시지)로 bot.py 의 핸들러를 직접 호출해
+on_message, 벌점 처리, 리마인더, 랭킹 명령의 처리량과 지연 백분위수를 잽니다.
+
+    python bench.py --store json --guilds 1000 --participants 50 --days 365
+    python bench.py --store mongo --compare bench_results/<이전 결과>.json
+
+--store json 은 DATA_JOURNAL / DATA_FLUSH_MS 환경변수를 그대로 따르고,
+--store sqlite 는 임시 디렉터리의 SQLite(WAL) 파일,
+--store mongo 는 MONGODB_URI(기본 mongodb://localhost:27017)의 로컬 mongod,
+--store mongomock 은 메모리 스탠드인(pip install mongomock-motor)을 사용합니다.
+--cold-start 를 주면 시드한 데이터를 새 저장소 인스턴스로 다시 열어 시작 시간(load + 라우팅 색인)과
+최대 메모리를 재고, json 저장소는 이전 형식(JSON 하나) 파일과도 비교합니다.
+--stress N 을 주면 참가자마다 같은 인증을 N번 동시에 보내면서 그 날짜의 벌점 정산과 수동 벌점을
+섞어 돌리고, 인증/벌점 유실·이중 반영과 잔액·통계 불일치 건수를 셉니다.
+결과는 bench_results/<커밋>-<저장소>.json 으로 저장됩니다.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+
+import bot
+
+# ---- 가짜 디스코드 객체 ----
+class FakeAvatar:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeMember:
+    bot = False
+    display_avatar = FakeAvatar()
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.display_name = f"member-{user_id}"
+        self.mention = f"<@{user_id}>"
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, embeds=None, **kwargs):
+        self.sent += 1
+
+class FakeGuild:
+    def __init__(self, guild_id: int, channel: FakeChannel, member_ids: list[int]):
+        self.id = guild_id
+        self.channel = channel
+        self._members = {m: FakeMember(m) for m in member_ids}
+        self.api_calls = 0
+
+    def get_channel(self, channel_id: int):
+        return self.channel if channel_id == self.channel.id else None
+
+    async def fetch_channel(self, channel_id: int):
+        self.api_calls += 1
+        return self.channel
+
+    def get_member(self, user_id: int):
+        return None  # 멤버 캐시가 비어 있는 상황(재시작 직후)을 가정
+
+    async def query_members(self, user_ids=None, limit=5, cache=False):
+        self.api_calls += 1
+        return [self._members[u] for u in user_ids if u in self._members]
+
+class FakeAttachment:
+    content_type = "image/png"
+    filename = "study.png"
+
+class FakeMessage:
+    def __init__(self, guild: FakeGuild, channel: FakeChannel, author: FakeMember, image: bool = True):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.attachments = [FakeAttachment()] if image else []
+        self.content = ""
+
+    async def add_reaction(self, emoji):
+        return
+
+    async def reply(self, embeds=None, **kwargs):
+        await self.channel.send(embeds=embeds)
+
+class FakeContext:
+    def __init__(self, guild: FakeGuild, author: FakeMember):
+        self.guild = guild
+        self.author = author
+        self.message = FakeMessage(guild, guild.channel, author, image=False)
+
+# ---- 저장소 준비 ----
+async def make_store(kind: str, workdir: str):
+    if kind == "json":
+        # DATA_JOURNAL / DATA_FLUSH_MS 등 봇과 같은 환경변수로 모드 선택
+        return bot.DataStore(os.path.join(workdir, "data.json"), journal=bot.DATA_JOURNAL,
+                             compact_interval=bot.DATA_COMPACT_INTERVAL, flush_interval=bot.DATA_FLUSH_MS / 1000)
+    if kind == "sqlite":
+        return bot.SqliteStore(os.path.join(workdir, "studybot.db"))
+    if kind == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.getenv("MONGODB_URI") or "mongodb://localhost:27017")
+        db = f"studybot_bench_{os.getpid()}"
+        await client.drop_database(db)
+        return bot.MongoStore(client, db)
+    if kind == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+        return bot.MongoStore(AsyncMongoMockClient(), "studybot_bench")
+    raise SystemExit(f"알 수 없는 저장소: {kind}")
+
+async def drop_store(store):
+    if isinstance(store, bot.MongoStore) and not type(store.client).__module__.startswith("mongomock"):
+        await store.client.drop_database(store.db.name)
+
+def history_dates(days: int) -> list[str]:
+    today = datetime.date.today()
+    return [(today - datetime.timedelta(days=i)).isoformat() for i in range(days, 0, -1)]
+
+async def seed(store, guilds: list[FakeGuild], participants: int, days: int, rate: float):
+    """길드 설정은 공개 API 로, 과거 인증 기록은 저장소 내부 형식으로 바로 채움 (시드 시간 단축)."""
+    rnd = random.Random(0)
+    dates = history_dates(days)
+    for g in guilds:
+        await store.set_channel(g.id, g.channel.id)
+        for uid in g._members:
+            await store.join(g.id, uid)
+    if isinstance(store, bot.DataStore):
+        for g in guilds:
+            subs = store._g(g.id)["submissions"]
+            for d in dates:
+                subs[d] = [str(u) for u in g._members if rnd.random() < rate]
+        await store.save()
+    elif isinstance(store, bot.SqliteStore):
+        rows = [
+            (g.id, d, u)
+            for g in guilds for d in dates for u in g._members if rnd.random() < rate
+        ]
+        await store._tx(lambda c: c.executemany("INSERT OR IGNORE INTO submissions VALUES (?, ?, ?)", rows))
+    else:
+        batch = []
+        for g in guilds:
+            for d in dates:
+                batch.extend(
+                    {"guild_id": str(g.id), "date": d, "user_id": str(u)}
+                    for u in g._members if rnd.random() < rate
+                )
+                if len(batch) >= 10000:
+                    await store.subs.insert_many(batch)
+                    batch = []
+        if batch:
+            await store.subs.insert_many(batch)
+
+def reopen_store(store):
+    """같은 데이터를 보는 새 인스턴스 (재시작 직후 상태)."""
+    if isinstance(store, bot.DataStore):
+        return bot.DataStore(store.path)
+    if isinstance(store, bot.SqliteStore):
+        return bot.SqliteStore(store.path)
+    return bot.MongoStore(store.client, store.db.name, store.coll.name, subs_coll_name=store.subs.name)
+
+async def measure_start(open_store, probe: tuple[int, int]) -> dict:
+    """load + 라우팅 색인까지의 시간, 첫 길드 접근 시간, 그 과정의 최대 메모리(두 번째 실행에서 측정)."""
+    t0 = time.perf_counter()
+    s = open_store()
+    await s.load()
+    await bot.RoutingIndex().warm(s)
+    ready_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await s.get_debt(*probe)
+    first_access_ms = (time.perf_counter() - t0) * 1000
+
+    tracemalloc.start()
+    s = open_store()
+    await s.load()
+    await bot.RoutingIndex().warm(s)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ready_s": ready_s, "first_access_ms": first_access_ms, "peak_mb": peak / 2**20}
+
+async def cold_start(store, workdir: str, probe: tuple[int, int]) -> dict:
+    await store.save()  # 저널 모드면 스냅샷으로 합쳐 둠
+    result = {"current": await measure_start(lambda: reopen_store(store), probe)}
+    if isinstance(store, bot.DataStore):
+        # 비교용: 같은 데이터를 이전 형식(전체 JSON 하나)으로
+        for gid in store._guild_ids():
+            store._g(gid)
+        legacy = os.path.join(workdir, "legacy.json")
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump(store.data, f, ensure_ascii=False, indent=2)
+        result["legacy_json"] = await measure_start(lambda: bot.DataStore(legacy), probe)
+    for name, r in result.items():
+        print(f"cold start {name:<12} ready={r['ready_s']:.3f}s first_access={r['first_access_ms']:.3f}ms "
+              f"peak={r['peak_mb']:.1f}MB")
+    return result
+
+async def stress(store, guilds: list[FakeGuild], date: str, dup: int, rnd: random.Random) -> dict:
+    """같은 사람의 중복 인증, 그 날짜의 벌점 정산(두 인스턴스에서 한 번씩), 수동 벌점을 길드 안에서 무작위
+    순서로 동시에 실행하고 유실/이중 반영이 없는지 확인. sqlite/mongo 는 두 번째 인스턴스(다른 프로세스
+    역할)도 섞어 씀."""
+    peer = store
+    if not isinstance(store, bot.DataStore):
+        peer = reopen_store(store)
+        await peer.load()
+    before = {(g.id, u): await store.get_stats(g.id, u) for g in guilds for u in g._members}
+    returns: dict[tuple[int, int], int] = {}
+
+    async def submit(s, gid, uid):
+        if await s.mark_submission(gid, date, uid):
+            returns[(gid, uid)] = returns.get((gid, uid), 0) + 1
+
+    calls = []
+    for g in guilds:
+        ops = [lambda s=s, g=g, u=u: submit(s, g.id, u)
+               for u in g._members if rnd.random() < 0.7 for s in rnd.choices((store, peer), k=dup)]
+        # 같은 날짜 정산을 두 인스턴스에서 경쟁시킴 (진 쪽이 원장을 남기면 '이중' 으로 잡힘)
+        for s in (store, peer):
+            ops.insert(rnd.randrange(len(ops) + 1), lambda s=s, g=g: s.apply_penalties_for_date(g.id, date))
+        ops.extend(lambda g=g, u=u: store.add_penalty(g.id, u, 500) for u in rnd.sample(list(g._members), 2))
+        rnd.shuffle(ops)
+        calls.extend(ops)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(fn() for fn in calls))
+    wall = time.perf_counter() - t0
+    await peer.flush()
+    await store.flush()
+
+    end = (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
+    month = date[:7]
+    result = {"calls": len(calls), "wall_s": wall, "lost": 0, "double": 0, "debt_mismatch": 0, "stats_mismatch": 0}
+    for g in guilds:
+        ledger = dict(await store.ledger_totals(g.id, "", "9999"))
+        for uid in g._members:
+            submitted = await store.has_submitted(g.id, date, uid)
+            penalized = any(e["kind"] == "penalty" for e in await store.ledger_entries(g.id, uid, date, end))
+            n = returns.get((g.id, uid), 0)
+            # 유실: 기록됐다고 알린 인증이 없거나 인증도 벌점도 없음. 이중: 인증과 벌점이 함께 있거나 True 를 두 번 받음
+            if (n and not submitted) or not (submitted or penalized):
+                result["lost"] += 1
+            elif (submitted and penalized) or n > 1:
+                result["double"] += 1
+            if await store.get_debt(g.id, uid) != ledger.get(str(uid), 0):
+                result["debt_mismatch"] += 1
+            old, new = before[(g.id, uid)]["months"].get(month, {}), (await store.get_stats(g.id, uid))["months"].get(month, {})
+            if (new.get("done", 0) - old.get("done", 0), new.get("missed", 0) - old.get("missed", 0)) != (int(submitted), int(penalized)):
+                result["stats_mismatch"] += 1
+    if isinstance(store, bot.MongoStore):
+        result["orphan_ledger"] = await settle_race(store, peer, guilds[0], end)
+    print(f"stress         n={len(calls):<7} {len(calls) / wall:>10.1f}/s lost={result['lost']} double={result['double']} "
+          f"debt_mismatch={result['debt_mismatch']} stats_mismatch={result['stats_mismatch']}"
+          + (f" orphan_ledger={result['orphan_ledger']}" if "orphan_ledger" in result else ""))
+    return result
+
+async def settle_race(store, peer, guild: FakeGuild, date: str) -> int:
+    """MongoStore 두 인스턴스의 정산 경합을 순서를 고정해 재현: store 가 인증 목록을 읽은 직후 peer 에서
+    인증이 확정되고 peer 가 먼저 정산함. 진 쪽이 원장을 남기면 인증한 사람에게 벌점 기록이 생김.
+    그런 기록 수(+ 잔액/원장 불일치 수)를 반환."""
+    uid = next(iter(guild._members))
+    real = store._submitted
+
+    async def submitted_then_race(guild_id, d):
+        seen = await real(guild_id, d)
+        store._submitted = real
+        await peer.mark_submission(guild_id, d, uid)
+        await peer.apply_penalties_for_date(guild_id, d)
+        return seen
+
+    store._submitted = submitted_then_race
+    try:
+        await store.apply_penalties_for_date(guild.id, date)
+    finally:
+        store._submitted = real
+    end = (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
+    bad = int(any(e["kind"] == "penalty" for e in await store.ledger_entries(guild.id, uid, date, end)))
+    bad += int(not await store.has_submitted(guild.id, date, uid))
+    ledger = dict(await store.ledger_totals(guild.id, "", "9999"))
+    for u in guild._members:
+        bad += int(await store.get_debt(guild.id, u) != ledger.get(str(u), 0))
+    return bad
+
+# ---- 측정 ----
+class Recorder:
+    def __init__(self):
+        self.ops: dict[str, dict] = {}
+
+    async def run(self, name: str, calls, concurrency: int):
+        """calls: 인자 없는 코루틴 함수 목록. 각 호출의 지연과 전체 처리량을 기록."""
+        sem = asyncio.Semaphore(concurrency)
+        latencies: list[float] = []
+
+        async def one(fn):
+            async with sem:
+                t0 = time.perf_counter()
+                await fn()
+                latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(fn) for fn in calls))
+        wall = time.perf_counter() - t0
+        self.ops[name] = {
+            "count": len(latencies),
+            "wall_s": wall,
+            "throughput_per_s": len(latencies) / wall if wall else 0.0,
+            "p50_ms": bot.percentile(latencies, 50) * 1000,
+            "p90_ms": bot.percentile(latencies, 90) * 1000,
+            "p99_ms": bot.percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies, default=0.0) * 1000,
+        }
+        r = self.ops[name]
+        print(f"{name:<14} n={r['count']:<7} {r['throughput_per_s']:>10.1f}/s "
+              f"p50={r['p50_ms']:.3f}ms p90={r['p90_ms']:.3f}ms p99={r['p99_ms']:.3f}ms")
+
+async def wait_outbox():
+    while bot.outbox._workers:
+        await asyncio.sleep(0.01)
+
+async def bench(args) -> dict:
+    async def _no_commands(message):
+        return
+    bot.bot.process_commands = _no_commands  # 명령 파싱은 discord.py 몫이라 측정에서 제외
+
+    workdir = tempfile.mkdtemp(prefix="studybot-bench-")
+    store = await make_store(args.store, workdir)
+    bot.store = store  # 핸들러들이 참조하는 모듈 전역 교체
+    bot.member_names = bot.MemberNameResolver()
+    bot.outbox = bot.Outbox()
+
+    guilds = []
+    for i in range(args.guilds):
+        gid = 10_000 + i
+        members = [1_000_000 + gid * 1000 + j for j in range(args.participants)]
+        guilds.append(FakeGuild(gid, FakeChannel(gid * 10), members))
+
+    t0 = time.perf_counter()
+    await store.load()
+    await seed(store, guilds, args.participants, args.days, args.rate)
+    seed_s = time.perf_counter() - t0
+    print(f"seed: {args.guilds} guilds × {args.participants} participants × {args.days} days ({seed_s:.1f}s)")
+
+    await bot.routes.warm(store)
+    rec = Recorder()
+    rnd = random.Random(1)
+    today = bot.submission_date(bot.normalize_schedule(None))
+
+    # 1) on_message: 인증 채널 이미지, 다른 채널 잡담, 비참가자 메시지를 섞어서
+    messages = []
+    for _ in range(args.messages):
+        g = rnd.choice(guilds)
+        roll = rnd.random()
+        if roll < 0.5:
+            author = g._members[rnd.choice(list(g._members))]
+            messages.append(FakeMessage(g, g.channel, author))
+        elif roll < 0.9:
+            author = g._members[rnd.choice(list(g._members))]
+            messages.append(FakeMessage(g, FakeChannel(1), author, image=False))
+        else:
+            messages.append(FakeMessage(g, g.channel, FakeMember(42)))
+    await rec.run("on_message", [lambda m=m: bot.on_message(m) for m in messages], args.concurrency)
+    await wait_outbox()
+
+    # 2) 리마인더 / 3) 벌점 처리: 스케줄러가 마감 시각에 하는 것과 같은 fan_out
+    await rec.run("reminder", [lambda g=g: bot._remind_guild(g, 10, today) for g in guilds], args.concurrency)
+    await wait_outbox()
+    await rec.run("daily_check", [lambda g=g: bot._penalize_guild(g, today) for g in guilds], args.concurrency)
+    await wait_outbox()
+
+    # 4) 랭킹 명령
+    ctxs = [FakeContext(g, FakeMember(42)) for g in rnd.sample(guilds, min(len(guilds), args.commands))]
+    await rec.run("leaderboard", [lambda c=c: bot.study_leaderboard.callback(c) for c in ctxs], args.concurrency)
+    await wait_outbox()
+
+    # 5) 동시성 점검: 아직 정산 안 된 다음 날짜로 (오늘 날짜는 위 daily_check 가 정산함)
+    tomorrow = (datetime.date.fromisoformat(today) + datetime.timedelta(days=1)).isoformat()
+    stressed = await stress(store, guilds, tomorrow, args.stress, rnd) if args.stress else None
+
+    cold = await cold_start(store, workdir, (guilds[0].id, next(iter(guilds[0]._members)))) if args.cold_start else None
+    await store.flush()
+    await drop_store(store)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "store": args.store,
+            "guilds": args.guilds,
+            "participants": args.participants,
+            "days": args.days,
+            "messages": args.messages,
+            "concurrency": args.concurrency,
+            "seed_s": seed_s,
+            "python": platform.python_version(),
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        "ops": rec.ops,
+        "cold_start": cold,
+        "stress": stressed,
+        "routes": dict(bot.routes.counters),
+        "outbox": dict(bot.outbox.counters),
+    }
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+def compare(current: dict, baseline: dict):
+    print(f"\n비교: {baseline['meta']['commit']} → {current['meta']['commit']}")
+    for name, cur in current["ops"].items():
+        old = baseline["ops"].get(name)
+        if not old:
+            continue
+        def delta(key):
+            return (cur[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"{name:<14} throughput {delta('throughput_per_s'):+6.1f}%  "
+              f"p50 {delta('p50_ms'):+6.1f}%  p99 {delta('p99_ms'):+6.1f}%")
+
+def main():
+    p = argparse.ArgumentParser(description="studyBot 핸들러 부하 벤치마크")
+    p.add_argument("--store", choices=["json", "sqlite", "mongo", "mongomock"], default="json")
+    p.add_argument("--guilds", type=int, default=100)
+    p.add_argument("--participants", type=int, default=20)
+    p.add_argument("--days", type=int, default=30, help="미리 채울 과거 인증 일수")
+    p.add_argument("--rate", type=float, default=0.8, help="과거 일별 인증 비율")
+    p.add_argument("--messages", type=int, default=5000)
+    p.add_argument("--commands", type=int, default=200, help="랭킹 명령 호출 수")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--cold-start", action="store_true", help="재시작 시간/메모리도 측정")
+    p.add_argument("--stress", type=int, default=0, metavar="N",
+                   help="참가자마다 같은 인증을 N번 동시에 보내며 벌점 정산과 경합시켜 유실/이중 반영 확인")
+    p.add_argument("--out", default="bench_results")
+    p.add_argument("--compare", help="비교할 이전 결과 JSON")
+    args = p.parse_args()
+
+    result = asyncio.run(bench(args))
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{result['meta']['commit']}-{args.store}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n저장: {path}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+if __name__ == "__main__":
+    sys.exit(main())
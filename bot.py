@@ -1,23 +1,48 @@
+import io
 import os
 import json
+import math
+import heapq
+import itertools
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import functools
+import contextlib
+import multiprocessing
 import asyncio
 import datetime
-from zoneinfo import ZoneInfo
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
+import aiohttp
 import discord
 from discord.ext import commands, tasks
 from dotenv import load_dotenv  # 추가
 from motor.motor_asyncio import AsyncIOMotorClient  # 추가
+from pymongo import ASCENDING, DeleteMany, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+try:  # 재사용 사진 검사(PHOTO_CHECK)에만 필요
+    from PIL import Image
+except ImportError:
+    Image = None
 
 # .env 로드 (프로젝트 루트의 .env 파일 자동 탐색)
 load_dotenv()
 
+log = logging.getLogger("studybot")
+
 DATA_FILE = os.path.join(os.path.dirname(__file__), "data.json")
 DEFAULT_TZ = ZoneInfo("Asia/Seoul")
 CHECK_TIME = datetime.time(hour=5, minute=0, tzinfo=DEFAULT_TZ)  # 매일 05:00(KST)
-REMINDER_TIME_1H = datetime.time(hour=4, minute=0, tzinfo=DEFAULT_TZ)   # 매일 04:00(KST)
-REMINDER_TIME_30M = datetime.time(hour=4, minute=30, tzinfo=DEFAULT_TZ) # 매일 04:30(KST)
-REMINDER_TIME_10M = datetime.time(hour=4, minute=50, tzinfo=DEFAULT_TZ) # 매일 04:50(KST)
+# 길드별 마감 설정 기본값: 마감 시각(현지), 타임존, 리마인더(마감 몇 분 전), 인증 확인 방식
+DEFAULT_SCHEDULE = {"tz": "Asia/Seoul", "cutoff": "05:00", "reminders": [60, 30, 10], "confirm": "reply"}
+# reply: 인증마다 확인 답장 / digest: 오늘 인증 현황 메시지 하나를 주기적으로 수정
+CONFIRM_MODES = ("reply", "digest")
 
 # 예쁘게 출력용 헬퍼
 COLOR_OK = 0x2ecc71
@@ -38,6 +63,18 @@ def today_str(tz: ZoneInfo = DEFAULT_TZ) -> str:
     return datetime.datetime.now(tz).date().isoformat()
 
 # 가독성 헬퍼
+def utc_now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+def log_task_failure(task: asyncio.Task):
+    """백그라운드 태스크의 done 콜백: 예외로 끝났으면 태스크 이름과 함께 기록 (안 그러면 조용히 사라짐)."""
+    if not task.cancelled() and task.exception() is not None:
+        log.error("background task %s failed", task.get_name(), exc_info=task.exception())
+
+def ledger_entry(amount: int, kind: str, date: str, entry_id: str | None = None) -> dict:
+    """원장 한 줄. kind: penalty(자동 벌점) / manual(!minus) / payment(납부) / refund(환급) / opening(도입 전 잔액)."""
+    return {"id": entry_id or uuid.uuid4().hex, "amount": int(amount), "kind": kind, "date": date, "ts": utc_now_iso()}
+
 def shorten(text: str, max_len: int = 20) -> str:
     return text if len(text) <= max_len else text[: max_len - 1] + "…"
 
@@ -58,344 +95,3018 @@ def make_table(headers: list[str], rows: list[list[str]], widths: list[int]) ->
 def yesterday_str(tz: ZoneInfo = DEFAULT_TZ) -> str:
     return (datetime.datetime.now(tz).date() - datetime.timedelta(days=1)).isoformat()
 
+def percentile(values: list[float], q: float) -> float:
+    """nearest-rank 백분위수 (q: 0~100)."""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, math.ceil(q / 100 * len(s)) - 1))
+    return s[k]
+
+def normalize_schedule(schedule: dict | None) -> dict:
+    s = dict(DEFAULT_SCHEDULE)
+    s.update({k: v for k, v in (schedule or {}).items() if v is not None})
+    s["reminders"] = sorted({int(m) for m in s["reminders"] if int(m) > 0}, reverse=True)
+    if s["confirm"] not in CONFIRM_MODES:
+        s["confirm"] = DEFAULT_SCHEDULE["confirm"]
+    return s
+
+def parse_hhmm(text: str) -> datetime.time:
+    h, m = text.split(":")
+    return datetime.time(hour=int(h), minute=int(m))
+
+def submission_date(schedule: dict, now: datetime.datetime | None = None) -> str:
+    """지금 올린 인증이 집계될 날짜. 마감 시각 이전이면 전날로 집계."""
+    tz = ZoneInfo(schedule["tz"])
+    local = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(tz)
+    d = local.date()
+    if local.time() < parse_hhmm(schedule["cutoff"]):
+        d -= datetime.timedelta(days=1)
+    return d.isoformat()
+
+def job_offset(job: str) -> int:
+    # "penalty" 는 마감 시각, "remind:<분>" 은 마감 <분> 전
+    return int(job.split(":", 1)[1]) if job.startswith("remind:") else 0
+
+def job_fire_time(schedule: dict, job: str, date: str) -> datetime.datetime:
+    """date 의 인증에 대한 job 발화 시각 (date 다음 날 마감 시각 기준)."""
+    tz = ZoneInfo(schedule["tz"])
+    day = datetime.date.fromisoformat(date) + datetime.timedelta(days=1)
+    deadline = datetime.datetime.combine(day, parse_hhmm(schedule["cutoff"]), tzinfo=tz)
+    return deadline - datetime.timedelta(minutes=job_offset(job))
+
+def unsettled_dates(last_settled: str | None, through: str, limit: int) -> list[str]:
+    """last_settled 다음 날부터 through 까지 (최대 limit 일). 정산 기록이 없으면 through 하루만."""
+    end = datetime.date.fromisoformat(through)
+    start = end - datetime.timedelta(days=max(limit, 1) - 1)
+    if last_settled is None:
+        start = end
+    else:
+        start = max(start, datetime.date.fromisoformat(last_settled) + datetime.timedelta(days=1))
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+def archive_cutoff(before: str, last_settled: str | None) -> str:
+    """길드별 보관 기준일. 아직 정산 안 된 날짜는 밀린 정산이 인증 기록을 읽어야 하므로 옮기지 않음.
+    정산 기록이 없으면 보충할 날짜도 없으므로 (unsettled_dates) before 그대로."""
+    if last_settled is None:
+        return before
+    after = (datetime.date.fromisoformat(last_settled) + datetime.timedelta(days=1)).isoformat()
+    return min(before, after)
+
+STREAK_FIELDS = ("streak", "best", "last", "total")
+
+def streak_fields(stats: dict | None) -> dict:
+    """연속 인증 기록 {streak(현재), best(최장), last(마지막 인증 날짜), total(누적)}. 없는 값은 기본값."""
+    s = {"streak": 0, "best": 0, "last": None, "total": 0}
+    s.update({k: v for k, v in (stats or {}).items() if k in s})
+    return s
+
+def advance_streak(stats: dict | None, date: str) -> dict:
+    """date 인증이 새로 기록된 뒤의 연속 기록. 마지막 인증보다 이전 날짜면 누적만 늘리고 연속은 그대로."""
+    s = streak_fields(stats)
+    s["total"] += 1
+    if (s["last"] or "") < date:
+        prev = (datetime.date.fromisoformat(date) - datetime.timedelta(days=1)).isoformat()
+        s["streak"] = s["streak"] + 1 if s["last"] == prev else 1
+        s["best"] = max(s["best"], s["streak"])
+        s["last"] = date
+    return s
+
+def miss_streak(stats: dict | None, date: str) -> dict:
+    """date 미인증으로 정산된 뒤의 연속 기록. 그 뒤 날짜에 이미 인증했다면(밀린 정산) 끊지 않음."""
+    s = streak_fields(stats)
+    if (s["last"] or "") < date:
+        s["streak"] = 0
+    return s
+
+def replay_stats(done_dates, missed_dates) -> tuple[dict, dict[str, dict]]:
+    """과거 인증/미인증 날짜로 통계를 처음부터 계산 (백필용). (연속 기록, {YYYY-MM: {done, missed}})"""
+    s, months = None, {}
+    events = sorted([(d, True) for d in set(done_dates)] + [(d, False) for d in set(missed_dates)])
+    for date, done in events:
+        s = advance_streak(s, date) if done else miss_streak(s, date)
+        months.setdefault(date[:7], {"done": 0, "missed": 0})["done" if done else "missed"] += 1
+    return streak_fields(s), months
+
+def schedule_jobs(schedule: dict) -> list[str]:
+    return ["penalty", *(f"remind:{m}" for m in schedule["reminders"])]
+
+def reminder_label(minutes: int) -> str:
+    return f"{minutes // 60}시간 전" if minutes % 60 == 0 else f"{minutes}분 전"
+
 def is_image_attachment(att: discord.Attachment) -> bool:
     if att.content_type and att.content_type.startswith("image/"):
         return True
     name = att.filename.lower()
     return name.endswith((".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".heic", ".heif"))
 
+_MISS = object()
+
+class Metrics:
+    """카운터/게이지/지연 히스토그램 레지스트리. Prometheus 텍스트 형식으로 내보냄."""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counters: dict[tuple, float] = {}
+        self.gauges: dict[tuple, float] = {}
+        self.histograms: dict[tuple, list] = {}  # key -> [버킷별 개수..., +Inf 개수, 합계]
+        self._collectors = []  # 내보내기 직전에 호출되어 게이지를 채우는 함수들
+        self._lag_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self._key(name, labels)
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+                break
+        else:
+            h[len(self.BUCKETS)] += 1
+        h[-1] += seconds
+
+    @contextlib.asynccontextmanager
+    async def timed(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(name.removesuffix("_seconds") + "_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    def quantile(self, name: str, q: float, **labels) -> float:
+        """버킷 경계 기준 근사 백분위수 (q: 0~1)."""
+        h = self.histograms.get(self._key(name, labels))
+        if not h:
+            return 0.0
+        total = sum(h[:-1])
+        seen = 0
+        for i, bound in enumerate(self.BUCKETS):
+            seen += h[i]
+            if seen >= q * total:
+                return bound
+        return float("inf")
+
+    def count(self, name: str, **labels) -> int:
+        h = self.histograms.get(self._key(name, labels))
+        return sum(h[:-1]) if h else 0
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            fn(self)
+
+        def fmt(labels, extra=()):
+            items = [*labels, *extra]
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+        lines = []
+        for (name, labels), v in sorted(self.counters.items()):
+            lines.append(f"{name}{fmt(labels)} {v}")
+        for (name, labels), v in sorted(self.gauges.items()):
+            lines.append(f"{name}{fmt(labels)} {v}")
+        for (name, labels), h in sorted(self.histograms.items()):
+            cumulative = 0
+            for i, bound in enumerate(self.BUCKETS):
+                cumulative += h[i]
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            cumulative += h[len(self.BUCKETS)]
+            lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {h[-1]}")
+            lines.append(f"{name}_count{fmt(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def start_lag_sampler(self, interval: float = 0.5):
+        """이벤트 루프 지연 측정을 백그라운드로 (한 번만). 태스크를 잡아 두고 예외는 로그로."""
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.create_task(self.sample_loop_lag(interval), name="event loop lag sampler")
+            self._lag_task.add_done_callback(log_task_failure)
+
+    async def sample_loop_lag(self, interval: float = 0.5):
+        """이벤트 루프 지연: interval 만큼 잠든 뒤 실제로 깨어난 시각과의 차이."""
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - t0 - interval)
+            self.observe("event_loop_lag_seconds", lag)
+            self.set("event_loop_lag_last_seconds", lag)
+
+    async def serve(self, host: str, port: int):
+        """GET /metrics 만 응답하는 최소 HTTP 서버."""
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request = await reader.readline()
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request.decode("latin-1").split()
+                if len(parts) >= 2 and parts[1] == "/metrics":
+                    body, status = self.render().encode(), "200 OK"
+                else:
+                    body, status = b"not found\n", "404 Not Found"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+metrics = Metrics()
+
+def instrument_store(store):
+    """저장소의 공개 async 메서드마다 호출 수/오류/지연을 기록하도록 인스턴스에 감쌈."""
+    backend = type(store).__name__
+    for name in dir(store):
+        method = getattr(store, name)
+        if name.startswith("_") or not asyncio.iscoroutinefunction(method):
+            continue
+
+        def wrap(fn, op):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                async with metrics.timed("store_op_seconds", backend=backend, op=op):
+                    return await fn(*args, **kwargs)
+            return wrapper
+
+        setattr(store, name, wrap(method, name))
+    return store
+
+class KeyedLock:
+    """키(길드)별 순서 보장 잠금. 같은 키의 작업은 들어온 순서대로 하나씩, 다른 키끼리는 동시에 실행.
+
+    기다리는 작업이 없어진 키의 잠금은 바로 정리하므로 길드 수만큼 쌓이지 않음."""
+
+    def __init__(self):
+        self._locks: dict = {}  # key -> [asyncio.Lock, 잡고 있거나 기다리는 작업 수]
+
+    @contextlib.asynccontextmanager
+    async def __call__(self, key):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:  # asyncio.Lock 은 기다린 순서대로 넘겨줌
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+class TTLCache:
+    """크기 제한(LRU)과 만료 시간(TTL)이 있는 메모리 캐시."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # key -> (만료 시각, 값)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=_MISS):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def peek(self, key, default=None):
+        # 적중률 집계 없이 조회 (쓰기 경로에서 캐시 갱신용)
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            return default
+        return item[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+class MemberNameResolver:
+    """user_id -> 서버 표시 이름. TTL 캐시를 먼저 보고, 캐시에 없는 id 는 길드별로 모아 한 번에 조회."""
+
+    QUERY_CHUNK = 100  # query_members 한 번에 보낼 수 있는 최대 id 수
+
+    def __init__(self, ttl: float = 600.0, maxsize: int = 10000):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: dict[tuple[int, str], asyncio.Future] = {}  # 조회 중인 id (중복 요청 방지)
+        self.api_calls = 0
+
+    async def resolve_many(self, guild: discord.Guild, user_ids) -> dict[str, str]:
+        names: dict[str, str] = {}
+        waits: dict[str, asyncio.Future] = {}
+        missing: list[str] = []
+        for uid in dict.fromkeys(str(u) for u in user_ids):
+            key = (guild.id, uid)
+            name = self.cache.get(key)
+            if name is not _MISS:
+                names[uid] = name
+                continue
+            member = guild.get_member(int(uid))
+            if member:
+                names[uid] = member.display_name
+                self.cache.set(key, member.display_name)
+            elif key in self._inflight:
+                waits[uid] = self._inflight[key]
+            else:
+                missing.append(uid)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futs = {uid: loop.create_future() for uid in missing}
+            for uid, fut in futs.items():
+                self._inflight[(guild.id, uid)] = fut
+            found: dict[str, str] = {}
+            try:
+                found = await self._fetch(guild, missing)
+            finally:
+                for uid, fut in futs.items():
+                    self._inflight.pop((guild.id, uid), None)
+                    if uid in found:
+                        self.cache.set((guild.id, uid), found[uid])
+                    fut.set_result(found.get(uid))
+            for uid in missing:
+                names[uid] = found.get(uid) or f"User {uid}"
+
+        for uid, fut in waits.items():
+            names[uid] = await fut or f"User {uid}"
+        return names
+
+    async def _fetch(self, guild: discord.Guild, user_ids: list[str]) -> dict[str, str]:
+        found: dict[str, str] = {}
+        for i in range(0, len(user_ids), self.QUERY_CHUNK):
+            chunk = [int(u) for u in user_ids[i:i + self.QUERY_CHUNK]]
+            self.api_calls += 1
+            try:
+                async with metrics.timed("discord_call_seconds", call="query_members"):
+                    members = await guild.query_members(user_ids=chunk, limit=self.QUERY_CHUNK, cache=True)
+            except (asyncio.TimeoutError, discord.ClientException):
+                continue  # 이름 대신 "User <id>" 로 표시
+            for m in members:
+                found[str(m.id)] = m.display_name
+        return found
+
+class RoutingIndex:
+    """guild -> 인증 채널/참가자를 메모리에 두고, 인증과 무관한 메시지는 저장소 조회 없이 거름."""
+
+    def __init__(self):
+        self.channels: dict[int, int] = {}           # guild_id -> 인증 채널 id
+        self.participants: dict[int, set[str]] = {}  # guild_id -> {user_id(str)}
+        self.schedules: dict[int, dict] = {}         # guild_id -> 마감 설정 (normalize_schedule)
+        self.counters = {
+            "no_channel": 0,       # 인증 채널이 없는 길드
+            "other_channel": 0,    # 인증 채널이 아닌 곳의 메시지
+            "no_image": 0,         # 이미지 첨부 없음
+            "not_participant": 0,  # 참가자가 아님
+            "accepted": 0,         # 저장소까지 간 메시지
+        }
+
+    async def warm(self, store, owns=lambda guild_id: True):
+        channels, participants, schedules = {}, {}, {}
+        async for guild_id, channel_id, members, schedule in store.iter_routes():
+            if not owns(guild_id):
+                continue  # 다른 샤드(프로세스)가 맡은 길드
+            if channel_id:
+                channels[guild_id] = channel_id
+            participants[guild_id] = set(members)
+            schedules[guild_id] = normalize_schedule(schedule)
+        self.channels, self.participants, self.schedules = channels, participants, schedules
+
+    def schedule(self, guild_id: int) -> dict:
+        return self.schedules.get(guild_id) or normalize_schedule(None)
+
+    def set_schedule(self, guild_id: int, schedule: dict):
+        self.schedules[guild_id] = normalize_schedule(schedule)
+
+    def set_channel(self, guild_id: int, channel_id: int):
+        self.channels[guild_id] = channel_id
+
+    def join(self, guild_id: int, user_id: int):
+        self.participants.setdefault(guild_id, set()).add(str(user_id))
+
+    def leave(self, guild_id: int, user_id: int):
+        self.participants.get(guild_id, set()).discard(str(user_id))
+
+    def accepts(self, message: discord.Message) -> bool:
+        """인증 처리 대상이면 True. 아니면 이유별 카운터만 올리고 False."""
+        channel_id = self.channels.get(message.guild.id)
+        if not channel_id:
+            reason = "no_channel"
+        elif message.channel.id != channel_id:
+            reason = "other_channel"
+        elif not any(is_image_attachment(att) for att in message.attachments):
+            reason = "no_image"
+        elif str(message.author.id) not in self.participants.get(message.guild.id, ()):
+            reason = "not_participant"
+        else:
+            self.counters["accepted"] += 1
+            return True
+        self.counters[reason] += 1
+        return False
+
+class _Outgoing:
+    __slots__ = ("kind", "channel", "embeds", "reference", "emoji", "coalesce", "future")
+
+    def __init__(self, kind: str, channel, embeds=None, reference=None, emoji=None, coalesce=False, future=None):
+        self.kind = kind            # "send" | "react" | "edit"
+        self.channel = channel
+        self.embeds = embeds or []
+        self.reference = reference  # 답장 대상 메시지 (또는 반응을 달/수정할 메시지)
+        self.emoji = emoji
+        self.coalesce = coalesce    # 밀렸을 때 다른 임베드와 한 메시지로 묶어도 되는지
+        self.future = future        # 결과가 필요한 호출: 보낸 메시지(또는 마지막 오류)로 끝남
+
+class Outbox:
+    """나가는 디스코드 호출을 채널별 큐로 보냄. 429/5xx 는 백오프 재시도, 밀리면 임베드를 묶어서 전송."""
+
+    MAX_EMBEDS = 10  # 메시지 하나에 넣을 수 있는 최대 임베드 수
+
+    def __init__(self, max_retries: int = 4, coalesce_after: int = 3, max_queue: int = 500):
+        self.max_retries = max_retries
+        self.coalesce_after = coalesce_after  # 큐에 이만큼 쌓여 있으면 묶어서 보냄
+        self.max_queue = max_queue            # 채널당 최대 대기 수 (넘치면 버림)
+        self._queues: dict[int, deque[_Outgoing]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self.counters = {"sent": 0, "retried": 0, "coalesced": 0, "dropped": 0}
+
+    def depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def send(self, channel, embed: discord.Embed, coalesce: bool = True):
+        self._enqueue(_Outgoing("send", channel, [embed], coalesce=coalesce))
+
+    def reply(self, message: discord.Message, embed: discord.Embed, coalesce: bool = False):
+        self._enqueue(_Outgoing("send", message.channel, [embed], reference=message, coalesce=coalesce))
+
+    def react(self, message: discord.Message, emoji: str):
+        self._enqueue(_Outgoing("react", message.channel, reference=message, emoji=emoji))
+
+    def post(self, channel, embed: discord.Embed) -> asyncio.Future:
+        """send 와 같지만 묶지 않고, 보낸 메시지로 끝나는 future 를 돌려줌 (나중에 edit 할 메시지용)."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Outgoing("send", channel, [embed], future=future))
+        return future
+
+    def edit(self, message: discord.Message, embed: discord.Embed) -> asyncio.Future:
+        """보낸 메시지의 임베드를 같은 채널 큐를 거쳐 수정. 실패하면 마지막 오류(NotFound 등)로 끝남."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Outgoing("edit", message.channel, [embed], reference=message, future=future))
+        return future
+
+    def _enqueue(self, item: _Outgoing):
+        q = self._queues.setdefault(item.channel.id, deque())
+        if len(q) >= self.max_queue:
+            self.counters["dropped"] += 1
+            log.warning("outbox: channel %s 큐가 가득 차 메시지를 버림", item.channel.id)
+            if item.future is not None:
+                item.future.set_exception(asyncio.QueueFull())
+            return
+        q.append(item)
+        if item.channel.id not in self._workers:
+            self._workers[item.channel.id] = asyncio.create_task(self._drain(item.channel.id))
+
+    async def _drain(self, channel_id: int):
+        q = self._queues[channel_id]
+        try:
+            while q:
+                item = q.popleft()
+                if item.kind == "send" and item.coalesce and len(q) >= self.coalesce_after:
+                    item = self._coalesce(item, q)
+                await self._deliver(item)
+        finally:
+            # while 조건 확인과 여기 사이엔 await 가 없으므로 새로 들어온 항목을 놓치지 않음
+            self._workers.pop(channel_id, None)
+            if not q:
+                self._queues.pop(channel_id, None)
+
+    def _coalesce(self, first: _Outgoing, q: deque) -> _Outgoing:
+        # 사이사이 끼어 있는 반응/일반 메시지는 순서 그대로 남기고, 묶을 수 있는 임베드만 모음
+        embeds = list(first.embeds)
+        rest = deque()
+        while q:
+            item = q.popleft()
+            if item.kind == "send" and item.coalesce and len(embeds) + len(item.embeds) <= self.MAX_EMBEDS:
+                embeds.extend(item.embeds)
+            else:
+                rest.append(item)
+        q.extend(rest)
+        if len(embeds) == len(first.embeds):
+            return first
+        self.counters["coalesced"] += len(embeds) - len(first.embeds)
+        return _Outgoing("send", first.channel, embeds)  # 여러 건을 묶으면 답장 대상 없이 채널에 전송
+
+    @staticmethod
+    def _retry_after(exc: discord.HTTPException, attempt: int) -> float:
+        headers = getattr(exc.response, "headers", None) or {}
+        for name in ("Retry-After", "X-RateLimit-Reset-After"):
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                continue
+        return min(30.0, 0.5 * 2 ** attempt)
+
+    async def _deliver(self, item: _Outgoing):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            call = item.kind if item.kind != "send" else "reply" if item.reference is not None else "send"
+            try:
+                async with metrics.timed("discord_call_seconds", call=call):
+                    if item.kind == "react":
+                        result = await item.reference.add_reaction(item.emoji)
+                    elif item.kind == "edit":
+                        result = await item.reference.edit(embeds=item.embeds)
+                    elif item.reference is not None:
+                        result = await item.reference.reply(embeds=item.embeds, mention_author=False)
+                    else:
+                        result = await item.channel.send(embeds=item.embeds)
+                self.counters["sent"] += 1
+                if item.future is not None and not item.future.done():
+                    item.future.set_result(result)
+                return
+            except discord.RateLimited as e:
+                error, delay = e, e.retry_after
+            except discord.HTTPException as e:
+                error = e
+                if e.status != 429 and e.status < 500:
+                    break  # 권한 없음/삭제된 메시지 등은 재시도해도 실패
+                delay = self._retry_after(e, attempt)
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                # 연결 끊김/타임아웃 같은 일시적인 네트워크 오류도 백오프 후 재시도
+                log.info("outbox: channel %s 네트워크 오류, 재시도 (%r)", item.channel.id, e)
+                error, delay = e, min(30.0, 0.5 * 2 ** attempt)
+            except Exception as e:
+                # 그 밖의 오류는 이 항목만 버리고 채널 큐는 계속 처리 (워커가 죽으면 뒤의 항목이 묶임)
+                log.exception("outbox: channel %s 전송 중 예상 못 한 오류 (%s)", item.channel.id, item.kind)
+                error = e
+                break
+            if attempt < self.max_retries:
+                self.counters["retried"] += 1
+                await asyncio.sleep(delay)
+        self.counters["dropped"] += 1
+        log.warning("outbox: channel %s 전송 실패 (%s)", item.channel.id, item.kind)
+        if item.future is not None and not item.future.done():
+            item.future.set_exception(error)
+
+class DigestBoard:
+    """digest 모드 길드의 '오늘 인증 현황' 임베드 하나를 제자리에서 수정.
+
+    인증마다 답장하는 대신 확인을 모아 두었다가 길드당 최대 interval 초에 한 번 보내거나 수정함.
+    보내기/수정도 outbox 의 채널 큐를 거치므로 같은 채널의 반응/답장과 순서가 지켜지고 재시도됨."""
+
+    MAX_LISTED = 80  # 임베드에 나열할 최대 인원 (나머지는 "외 N명")
+
+    def __init__(self, outbox: Outbox, interval: float = 10.0, keep_days: int = 7, seed=None):
+        self.outbox = outbox
+        self.interval = interval
+        self.keep_days = keep_days
+        # async (guild_id, date) -> 이미 인증한 user_id 목록. 새 현황판을 저장소 기록으로 채움 (재시작 대비)
+        self.seed = seed
+        self._boards: dict[int, dict] = {}  # guild_id -> {date, channel, message, users, total, last, task}
+        self.daily: dict[str, dict[str, int]] = {}  # 인증 날짜 -> {confirmed: 확인 수, calls: 보내기/수정 호출 수}
+
+    def saved(self, date: str) -> int:
+        """답장 방식이었다면 보냈을 호출 수 - 실제 호출 수."""
+        day = self.daily.get(date, {"confirmed": 0, "calls": 0})
+        return day["confirmed"] - day["calls"]
+
+    def add(self, message: discord.Message, date: str, total: int):
+        gid = message.guild.id
+        board = self._boards.get(gid)
+        if board is None or board["date"] != date or board["channel"].id != message.channel.id:
+            # 날짜(또는 인증 채널)가 바뀌면 새 메시지로 시작
+            board = self._boards[gid] = {"date": date, "channel": message.channel, "message": None,
+                                         "users": [], "total": 0, "last": 0.0, "task": None,
+                                         "seeded": self.seed is None}
+        board["users"].append(message.author.id)
+        board["total"] = total
+        self.daily.setdefault(date, {"confirmed": 0, "calls": 0})["confirmed"] += 1
+        for d in sorted(self.daily)[:-self.keep_days]:
+            del self.daily[d]
+        if board["task"] is None:
+            board["task"] = asyncio.create_task(self._run(board))
+
+    async def _seed(self, board: dict):
+        board["seeded"] = True
+        try:
+            seeded = await self.seed(board["channel"].guild.id, board["date"])
+        except Exception:
+            log.exception("digest: guild %s 인증 현황 불러오기 실패", board["channel"].guild.id)
+            return
+        # 기다리는 사이 add 된 사람은 이미 목록에 있으므로 빼고 앞에 붙임
+        known = set(board["users"])
+        board["users"][:0] = [uid for uid in seeded if uid not in known]
+
+    async def _run(self, board: dict):
+        try:
+            if not board["seeded"]:
+                await self._seed(board)
+            while True:
+                wait = board["last"] + self.interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)  # 이 사이에 들어온 확인은 다음 수정에 함께 반영
+                shown = len(board["users"])
+                retry = await self._publish(board)
+                board["last"] = time.monotonic()
+                # 확인 여부와 태스크 정리 사이엔 await 가 없으므로 새 확인을 놓치지 않음
+                if not retry and len(board["users"]) == shown:
+                    break
+        finally:
+            board["task"] = None
+
+    def _embed(self, board: dict) -> discord.Embed:
+        users = board["users"]
+        listed = " ".join(f"<@{uid}>" for uid in users[:self.MAX_LISTED])
+        if len(users) > self.MAX_LISTED:
+            listed += f" 외 {len(users) - self.MAX_LISTED}명"
+        embed = make_embed(
+            title=f"✅ 인증 현황 ({board['date']})",
+            description=f"인증 {len(users)}명 / 참가자 {board['total']}명\n{listed}",
+            color=COLOR_OK
+        )
+        embed.set_footer(text=f"최대 {self.interval:g}초마다 갱신")
+        return embed
+
+    async def _publish(self, board: dict) -> bool:
+        """현황 메시지를 보내거나 수정. 메시지가 지워져 다시 보내야 하면 True."""
+        embed = self._embed(board)
+        self.daily.setdefault(board["date"], {"confirmed": 0, "calls": 0})["calls"] += 1
+        try:
+            if board["message"] is None:
+                board["message"] = await self.outbox.post(board["channel"], embed)
+            else:
+                await self.outbox.edit(board["message"], embed)
+        except discord.NotFound:
+            board["message"] = None  # 누군가 현황 메시지를 지움 → 다음 회차에 새로 보냄
+            return True
+        except Exception as e:
+            # outbox 가 재시도까지 한 뒤 버린 경우. 다음 확인이 들어오면 다시 시도
+            log.warning("digest: guild %s 현황 갱신 실패 (%r)", board["channel"].guild.id, e)
+        return False
+
+# ---- 재사용 사진 검사 (선택 기능, Pillow 필요) ----
+def dhash_bytes(data: bytes, size: int = 8) -> int:
+    """이미지 바이트 → 64비트 차이 해시(dHash). 프로세스 풀에서 실행되므로 모듈 최상위 함수."""
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (size * 16, size * 16))  # JPEG 은 디코딩 단계에서 축소해 CPU 절약
+        small = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+        px = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return bits
+
+class BKTree:
+    """해밍 거리 기준 BK-트리. 거리 max_dist 이내의 해시를 전체 비교 없이 찾음."""
+
+    def __init__(self):
+        self.root = None  # [hash, item, {거리: 자식 노드}]
+        self.size = 0
+
+    def add(self, h: int, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [h, item, {}]
+            return
+        node = self.root
+        while True:
+            d = (h ^ node[0]).bit_count()
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, item, {}]
+                return
+            node = child
+
+    def search(self, h: int, max_dist: int) -> list[tuple[int, object]]:
+        found, stack = [], [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = (h ^ node[0]).bit_count()
+            if d <= max_dist:
+                found.append((d, node[1]))
+            # 삼각 부등식: 거리가 [d - max_dist, d + max_dist] 인 가지만 내려감
+            stack.extend(c for k, c in node[2].items() if d - max_dist <= k <= d + max_dist)
+        return found
+
+class PhotoIndex:
+    """길드 하나의 사진 해시 색인. 날짜별 BK-트리로 나눠 두고 오래된 날짜는 통째로 버림."""
+
+    def __init__(self, keep_days: int):
+        self.keep_days = keep_days
+        self.buckets: dict[str, BKTree] = {}  # 인증 날짜 -> 그날 올라온 사진들
+
+    def add(self, h: int, date: str, item):
+        self.buckets.setdefault(date, BKTree()).add(h, item)
+        oldest = (datetime.date.fromisoformat(date) - datetime.timedelta(days=self.keep_days)).isoformat()
+        for d in [d for d in self.buckets if d < oldest]:
+            del self.buckets[d]
+
+    def search(self, h: int, max_dist: int) -> list[tuple[int, object]]:
+        return [m for tree in self.buckets.values() for m in tree.search(h, max_dist)]
+
+    def __len__(self):
+        return sum(t.size for t in self.buckets.values())
+
+class PhotoVerifier:
+    """인증 사진을 제한된 동시성으로 내려받아 프로세스 풀에서 해시하고, 길드별 색인에서 재사용 여부 확인.
+
+    mode: off(끔) / flag(인증은 받고 경고만) / reject(재사용이면 인증 거부)."""
+
+    def __init__(self, mode: str = "off", max_distance: int = 6, keep_days: int = 30,
+                 fetch_concurrency: int = 4, workers: int = 2, max_bytes: int = 8 << 20, timeout: float = 10.0):
+        self.mode = mode if Image is not None else "off"
+        self.max_distance = max_distance
+        self.keep_days = keep_days
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._fetch = asyncio.Semaphore(fetch_concurrency)
+        self._pool: ProcessPoolExecutor | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.indexes: dict[int, PhotoIndex] = {}
+        self.counters = {"checked": 0, "duplicate": 0, "skipped": 0, "error": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def spawn(self, coro):
+        # flag 모드: 인증 처리와 별도로 뒤에서 검사 (태스크 참조를 잡아 둬야 GC 되지 않음)
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _hash(self, att) -> int | None:
+        if att.size and att.size > self.max_bytes:
+            self.counters["skipped"] += 1
+            return None
+        async with self._fetch:
+            async with metrics.timed("discord_call_seconds", call="attachment_read"):
+                data = await att.read()
+        if self._pool is None:
+            # fork 는 motor/sqlite 스레드가 도는 봇 프로세스를 그대로 복제하므로 spawn 으로 새로 띄움
+            # (작업 프로세스는 bot.py 를 모듈로만 불러오고 봇은 실행하지 않음)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        async with metrics.timed("photo_hash_seconds"):
+            return await asyncio.get_running_loop().run_in_executor(self._pool, dhash_bytes, data)
+
+    async def check(self, message: discord.Message, date: str) -> list[dict]:
+        """재사용으로 보이는 이전 사진 목록 (없으면 빈 목록). 실패/시간 초과면 통과로 처리."""
+        atts = [att for att in message.attachments if is_image_attachment(att)]
+        try:
+            hashes = await asyncio.wait_for(asyncio.gather(*(self._hash(att) for att in atts)), self.timeout)
+        except Exception as e:  # 다운로드 실패, 손상된 이미지, 시간 초과 등
+            self.counters["error"] += 1
+            log.warning("photo check failed (guild=%s message=%s): %r", message.guild.id, message.id, e)
+            return []
+        index = self.indexes.setdefault(message.guild.id, PhotoIndex(self.keep_days))
+        uid = str(message.author.id)
+        matches = []
+        for h in hashes:
+            if h is None:
+                continue
+            self.counters["checked"] += 1
+            for dist, prev in index.search(h, self.max_distance):
+                # 같은 사람이 같은 날 다시 올린 건 재사용이 아님
+                if prev["date"] != date or prev["user_id"] != uid:
+                    matches.append(dict(prev, distance=dist))
+            index.add(h, date, {"user_id": uid, "date": date, "url": message.jump_url})
+        if matches:
+            self.counters["duplicate"] += 1
+        return sorted(matches, key=lambda m: m["distance"])
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+# 스냅샷 형식: 첫 줄은 헤더(전역 값 + 길드별 라우팅 요약), 이후 한 줄에 길드 하나("<guild_id>\t<json>")
+SNAPSHOT_FORMAT = "studybot-jsonl/1"
+
 class DataStore:
-    def __init__(self, path: str):
+    def __init__(self, path: str, journal: bool = False, compact_interval: float = 300.0,
+                 flush_interval: float = 0.0):
         self.path = path
         self._lock = asyncio.Lock()
         self.data = {"guilds": {}}
+        # 지연 파싱: 시작 시엔 헤더만 해석하고 길드 줄은 문자열로 두었다가 처음 접근할 때 파싱
+        self._raw: dict[str, str] = {}           # guild_id -> 아직 파싱하지 않은 JSON 줄
+        self._routes: dict[str, list] = {}       # guild_id -> [channel_id, participants, schedule] (미파싱 길드)
+        self._loaded = False
+        # 저널 모드: 변경마다 한 줄씩 로그에 추가하고, 주기적으로 스냅샷(data.json)에 합침
+        self.journal = journal
+        self.journal_path = path + ".log"
+        self.compact_interval = compact_interval
+        self._seq = 0                 # 마지막으로 기록된 저널 레코드 번호
+        self._journal_fp = None
+        self._journal_buf: list[str] = []  # 아직 파일에 쓰지 않은 저널 줄
+        self._journal_records = 0     # 마지막 압축 이후 추가된 레코드 수
+        self._compactor: asyncio.Task | None = None
+        # 지연 기록(write-behind): 변경은 dirty 표시만 하고 flush_interval 초마다 한 번에 기록
+        self.flush_interval = flush_interval
+        self._dirty = False
+        self._wake = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+        self._leases: dict[str, tuple[str, float]] = {}  # 단일 프로세스 전용이라 메모리에만 보관
 
     async def load(self):
-        if not os.path.exists(self.path):
+        # 두 번째 호출(재연결 등)은 무시: 다시 읽으면 아직 기록 안 된 메모리 변경을 잃음
+        if self._loaded:
+            return
+        self._loaded = True
+        if os.path.exists(self.path):
+            async with self._lock:
+                self.data, self._raw, self._routes = await asyncio.to_thread(self._read_snapshot)
+                self._seq = int(self.data.pop("journal_seq", 0))
+        elif not self.journal:
             await self.save()
+        if self.journal:
+            # 재생한 로그(잘린 꼬리 포함)는 바로 스냅샷으로 정리
+            if await asyncio.to_thread(self._replay_journal) or not os.path.exists(self.path):
+                await self.compact()
+            self._open_journal()
+            if self._compactor is None:
+                self._compactor = asyncio.create_task(self._compact_loop())
+        if self.flush_interval and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+        if not self.data.get("ledger_opened"):
+            # 원장 도입 전 데이터: 현재 잔액을 기초(opening) 기록으로 옮김 (한 번만)
+            await self._commit("open_ledger", today_str(DEFAULT_TZ), utc_now_iso())
+        if not self.data.get("stats_built"):
+            # 통계 도입 전 데이터: 인증 기록과 원장으로 연속/월별 집계를 한 번 채움
+            await self.rebuild_stats()
+
+    async def save(self):
+        if self.journal:
+            await self.compact()
             return
         async with self._lock:
-            with open(self.path, "r", encoding="utf-8") as f:
-                try:
-                    self.data = json.load(f)
-                except json.JSONDecodeError:
-                    self.data = {"guilds": {}}
+            self._dirty = False
+            await asyncio.to_thread(self._write_snapshot, self._dump())
 
-    async def save(self):
+    async def flush(self):
+        """대기 중인 변경을 즉시 기록 (종료 시 호출)."""
+        async with self._lock:
+            if self._journal_buf and self._journal_fp is not None:
+                lines, self._journal_buf = self._journal_buf, []
+                try:
+                    if self.flush_interval:
+                        await asyncio.to_thread(self._write_lines, lines)
+                    else:
+                        self._write_lines(lines)  # 즉시 기록 모드에선 _append 와 같은 스레드에서
+                except Exception:
+                    # 못 쓴 줄은 되돌려 다음에 다시 (쓰다 만 줄과 붙지 않게 새 줄부터)
+                    self._journal_buf[:0] = ["\n", *lines]
+                    raise
+            if self._dirty and not self.journal:
+                self._dirty = False
+                try:
+                    await asyncio.to_thread(self._write_snapshot, self._dump())
+                except Exception:
+                    self._dirty = True
+                    raise
+
+    def _mark_dirty(self):
+        self._dirty = True
+        self._wake.set()
+
+    async def _flush_loop(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.flush_interval)  # 이 사이에 들어온 변경은 한 번에 기록
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # 변경은 dirty/대기 줄로 남아 있으니 다음 주기에 다시 기록
+                log.exception("data store: 기록 실패, %.1f초 뒤 재시도", self.flush_interval)
+                self._wake.set()
+
+    def _read_snapshot(self) -> tuple[dict, dict[str, str], dict[str, list]]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            text = f.read()
+        first, _, rest = text.partition("\n")
+        try:
+            header = json.loads(first)
+        except json.JSONDecodeError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") != SNAPSHOT_FORMAT:
+            # 이전 형식(전체가 JSON 하나): 한 번 전부 파싱하고 다음 저장부터 새 형식으로
+            try:
+                return json.loads(text), {}, {}
+            except json.JSONDecodeError:
+                return {"guilds": {}}, {}, {}
+        routes = header.pop("routes", {})
+        header.pop("format")
+        raw = {}
+        for line in rest.splitlines():
+            gid, sep, body = line.partition("\t")
+            if sep:
+                raw[gid] = body
+        return dict(header, guilds={}), raw, routes
+
+    def _dump(self) -> str:
+        # 직렬화는 이벤트 루프에서 (다른 변경과 섞이지 않도록), 파일 쓰기만 워커 스레드에서.
+        # 한 번도 접근하지 않은 길드는 읽은 줄을 그대로 다시 씀
+        guilds = self.data["guilds"]
+        routes = dict(self._routes)
+        for gid, g in guilds.items():
+            routes[gid] = [g.get("channel_id"), g.get("participants", []), g.get("schedule")]
+        header = {k: v for k, v in self.data.items() if k != "guilds"}
+        if self.journal:
+            header["journal_seq"] = self._seq
+        header.update(format=SNAPSHOT_FORMAT, routes=routes)
+        lines = [json.dumps(header, ensure_ascii=False, separators=(",", ":"))]
+        lines.extend(f"{gid}\t{json.dumps(g, ensure_ascii=False, separators=(',', ':'))}" for gid, g in guilds.items())
+        lines.extend(f"{gid}\t{body}" for gid, body in self._raw.items())
+        return "\n".join(lines) + "\n"
+
+    def _write_snapshot(self, text: str):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, self.path)
+
+    # ---- 저널 ----
+    def _segments(self) -> list[str]:
+        # 압축 도중 회전된 이전 로그(.old)가 있으면 먼저 재생
+        return [p for p in (self.journal_path + ".old", self.journal_path) if os.path.exists(p)]
+
+    def _replay_journal(self) -> bool:
+        replayed = False
+        for seg in self._segments():
+            with open(seg, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 쓰다 만 줄 (기록 실패 뒤 재시도분은 다음 줄부터 다시 있음)
+                    replayed = True
+                    if rec["s"] <= self._seq:
+                        continue  # 이미 스냅샷에 반영됨
+                    self._apply(rec["op"], *rec["a"])
+                    self._seq = rec["s"]
+        return replayed
+
+    def _open_journal(self):
+        if self._journal_fp is None:
+            self._journal_fp = open(self.journal_path, "a", encoding="utf-8")
+
+    def _write_lines(self, lines: list[str]):
+        self._journal_fp.writelines(lines)
+        self._journal_fp.flush()
+
+    def _append(self, op: str, args: tuple):
+        self._seq += 1
+        rec = {"s": self._seq, "op": op, "a": list(args)}
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._journal_records += 1
+        if self.flush_interval or self._journal_fp is None:
+            self._journal_buf.append(line)
+            self._mark_dirty()
+        else:
+            # 앞서 못 쓴 줄이 남아 있으면 순서대로 같이 기록
+            lines, self._journal_buf = [*self._journal_buf, line], []
+            try:
+                self._write_lines(lines)
+            except Exception:
+                self._journal_buf[:0] = ["\n", *lines]
+                raise
+
+    def _rotate_and_snapshot(self, fp, lines: list[str], text: str):
+        old = self.journal_path + ".old"
+        if fp is not None:
+            fp.writelines(lines)
+            fp.close()
+        if os.path.exists(self.journal_path):
+            os.replace(self.journal_path, old)
+        # 스냅샷이 기록된 뒤에만 이전 로그를 삭제 (그 전에 죽으면 .old 부터 재생)
+        try:
+            self._write_snapshot(text)
+        except Exception:
+            # 다음 압축이 .old 를 덮어쓰지 않게 로그 자리로 되돌림
+            if os.path.exists(old) and not os.path.exists(self.journal_path):
+                os.replace(old, self.journal_path)
+            raise
+        if os.path.exists(old):
+            os.remove(old)
+
+    async def compact(self):
+        """저널을 스냅샷으로 합치고 로그를 비움."""
         async with self._lock:
-            tmp = self.path + ".tmp"
-            with open(tmp, "w", encoding="utf-8") as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
-            os.replace(tmp, self.path)
+            lines, self._journal_buf = self._journal_buf, []
+            fp, self._journal_fp = self._journal_fp, None
+            text = self._dump()
+            records, self._journal_records = self._journal_records, 0
+            try:
+                await asyncio.to_thread(self._rotate_and_snapshot, fp, lines, text)
+            except Exception:
+                # 로그에 못 쓴 줄은 되돌리고, 다음 주기에 다시 압축
+                if fp is not None and not fp.closed:
+                    self._journal_buf[:0] = ["\n", *lines]
+                    try:
+                        fp.close()
+                    except OSError:
+                        pass
+                self._journal_records += max(records, 1)
+                self._open_journal()
+                raise
+            self._open_journal()
+            # 압축 중에 쌓인 기록은 새 로그로 (지연 기록 모드면 flush 루프가 처리)
+            if self._journal_buf and not self.flush_interval:
+                lines, self._journal_buf = self._journal_buf, []
+                self._write_lines(lines)
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            if self._journal_records:
+                try:
+                    await self.compact()
+                except Exception:
+                    log.exception("data store: 저널 압축 실패, %.0f초 뒤 재시도", self.compact_interval)
+
+    async def _commit(self, op: str, *args):
+        # 메모리 반영과 저널 기록 사이에 await 가 없어야 압축과 섞이지 않음
+        result = self._apply(op, *args)
+        if self.journal:
+            self._append(op, args)
+        elif self.flush_interval:
+            self._mark_dirty()
+        else:
+            await self.save()
+        return result
+
+    def _apply(self, op: str, *args):
+        return getattr(self, "_op_" + op)(*args)
 
     # 동기 → 비동기로 변경 (MongoStore와 인터페이스 통일)
     async def get_channel(self, guild_id: int) -> int | None:
         return self._g(guild_id).get("channel_id")
 
+    def _guild_ids(self) -> list[str]:
+        return [*self.data["guilds"], *self._raw]
+
     def _g(self, guild_id: int) -> dict:
-        g = self.data["guilds"].setdefault(str(guild_id), {
+        key = str(guild_id)
+        body = self._raw.pop(key, None)
+        if body is not None:
+            self._routes.pop(key, None)
+            self.data["guilds"][key] = json.loads(body)
+        g = self.data["guilds"].setdefault(key, {
             "channel_id": None,
             "participants": [],
-            "debt": {},          # user_id(str) -> int(원)
+            "debt": {},          # user_id(str) -> int(원), 원장과 같은 연산에서 함께 갱신되는 잔액
+            "ledger": {},        # user_id(str) -> [원장 기록, ...] (추가만 함)
             "submissions": {}    # date(YYYY-MM-DD) -> [user_id(str), ...]
         })
         return g
 
-    async def set_channel(self, guild_id: int, channel_id: int):
-        g = self._g(guild_id)
-        g["channel_id"] = channel_id
-        await self.save()
+    # ---- 변경 연산 (저널 재생 시에도 그대로 사용) ----
+    def _op_set_channel(self, guild_id: int, channel_id: int):
+        self._g(guild_id)["channel_id"] = channel_id
 
-    async def join(self, guild_id: int, user_id: int):
+    def _op_join(self, guild_id: int, user_id: int):
         g = self._g(guild_id)
         uid = str(user_id)
         if uid not in g["participants"]:
             g["participants"].append(uid)
         g["debt"].setdefault(uid, 0)
-        await self.save()
 
-    async def leave(self, guild_id: int, user_id: int):
+    def _op_leave(self, guild_id: int, user_id: int):
         g = self._g(guild_id)
         uid = str(user_id)
         if uid in g["participants"]:
             g["participants"].remove(uid)
-        await self.save()
 
-    async def is_participant(self, guild_id: int, user_id: int) -> bool:
-        return str(user_id) in self._g(guild_id)["participants"]
+    def _op_join_many(self, guild_id: int, user_ids: list[int]):
+        for user_id in user_ids:
+            self._op_join(guild_id, user_id)
 
-    async def has_submitted(self, guild_id: int, date: str, user_id: int) -> bool:
+    def _op_leave_many(self, guild_id: int, user_ids: list[int]):
         g = self._g(guild_id)
-        return str(user_id) in g["submissions"].get(date, [])
+        gone = {str(u) for u in user_ids}
+        g["participants"] = [uid for uid in g["participants"] if uid not in gone]
 
-    async def mark_submission(self, guild_id: int, date: str, user_id: int):
+    def _op_mark_submission(self, guild_id: int, date: str, user_id: int) -> bool:
         g = self._g(guild_id)
-        day = g["submissions"].setdefault(date, [])
         uid = str(user_id)
-        if uid not in day:
-            day.append(uid)
-            await self.save()
+        if (self._settled(g) or "") >= date or uid in g["submissions"].get(date, ()):
+            return False  # 이미 정산된 날짜이거나 이미 인증함
+        g["submissions"].setdefault(date, []).append(uid)
+        self._count(g, uid, date, True)
+        return True
 
-    async def apply_penalties_for_date(self, guild_id: int, date: str) -> list[tuple[str, int]]:
-        """전날(date)에 인증 안 한 참가자들에게 1000원씩 벌점 부과."""
+    def _count(self, g: dict, uid: str, date: str, done: bool):
+        # 연속/월별 출석 집계를 인증·정산과 같은 연산에서 증분 갱신 (조회는 읽기만)
+        prev = g.setdefault("stats", {}).get(uid, {})
+        s = advance_streak(prev, date) if done else miss_streak(prev, date)
+        key = "done" if done else "missed"
+        s["months"] = prev.get("months", {})
+        s["months"].setdefault(date[:7], {"done": 0, "missed": 0})[key] += 1
+        g["stats"][uid] = s
+        g.setdefault("trend", {}).setdefault(date[:7], {"done": 0, "missed": 0})[key] += 1
+
+    def _op_set_schedule(self, guild_id: int, schedule: dict):
+        self._g(guild_id)["schedule"] = schedule
+
+    def _op_claim_job(self, guild_id: int, job: str, date: str) -> bool:
+        runs = self._g(guild_id).setdefault("job_runs", {})  # job -> 마지막 실행 날짜
+        if runs.get(job, "") >= date:
+            return False
+        runs[job] = date
+        return True
+
+    def _op_archive_submissions(self, before: str) -> int:
+        moved = 0
+        for gid in self._guild_ids():
+            g = self._g(gid)
+            cutoff = archive_cutoff(before, self._settled(g))
+            archive = g.setdefault("archive", {})  # YYYY-MM -> {date: [user_id, ...]}
+            for date in [d for d in g["submissions"] if d < cutoff]:
+                archive.setdefault(date[:7], {})[date] = g["submissions"].pop(date)
+                moved += 1
+        return moved
+
+    def _post(self, g: dict, uid: str, entry: dict | None, amount: int):
+        # 원장 추가와 잔액 갱신을 한 연산 안에서 (entry 가 없으면 원장 도입 전 저널 기록)
+        if entry is not None:
+            g.setdefault("ledger", {}).setdefault(uid, []).append(entry)
+        g["debt"][uid] = g["debt"].get(uid, 0) + amount
+
+    @staticmethod
+    def _settled(g: dict) -> str | None:
+        # 정산 기준점 도입 전에는 penalty 작업 실행 기록이 같은 의미
+        return g.get("last_settled") or g.get("job_runs", {}).get("penalty")
+
+    def _op_apply_penalties(self, guild_id: int, date: str, ts: str | None = None) -> list[tuple[str, int]]:
         g = self._g(guild_id)
+        if (self._settled(g) or "") >= date:
+            return []  # 이미 정산된 날짜 (재실행/중복 호출)
+        g["last_settled"] = date  # 벌점 증감과 같은 연산에서 기준점 갱신
         participants = set(g["participants"])
         submitted = set(g["submissions"].get(date, []))
         missed = participants - submitted
         changed = []
         for uid in missed:
-            g["debt"][uid] = g["debt"].get(uid, 0) + 1000
+            entry = None
+            if ts is not None:
+                entry = {"id": f"penalty:{date}:{uid}", "amount": 1000, "kind": "penalty", "date": date, "ts": ts}
+            self._post(g, uid, entry, 1000)
+            self._count(g, uid, date, False)
             changed.append((uid, g["debt"][uid]))
-        await self.save()
         return changed
 
-    async def add_penalty(self, guild_id: int, user_id: int, amount: int = 1000) -> int:
-        """특정 사용자에게 amount만큼 벌점 부과하고 현재 총 벌점을 반환."""
+    def _op_add_penalty(self, guild_id: int, user_id: int, amount: int, entry: dict | None = None) -> int:
         g = self._g(guild_id)
         uid = str(user_id)
-        g["debt"][uid] = g["debt"].get(uid, 0) + amount
-        await self.save()
+        self._post(g, uid, entry, amount)
         return g["debt"][uid]
 
+    def _op_add_penalties_many(self, guild_id: int, user_ids: list[int], amount: int,
+                               entries: list[dict]) -> list[tuple[str, int]]:
+        return [(str(u), self._op_add_penalty(guild_id, u, amount, e)) for u, e in zip(user_ids, entries)]
+
+    def _op_open_ledger(self, date: str, ts: str):
+        for gid in self._guild_ids():
+            g = self._g(gid)
+            ledger = g.setdefault("ledger", {})
+            for uid, debt in g["debt"].items():
+                if debt and uid not in ledger:
+                    ledger[uid] = [{"id": f"opening:{uid}", "amount": debt, "kind": "opening", "date": date, "ts": ts}]
+        self.data["ledger_opened"] = True
+
+    def _op_rebuild_stats(self) -> int:
+        users = 0
+        for gid in self._guild_ids():
+            g = self._g(gid)
+            done: dict[str, list[str]] = {}
+            days = [*g["submissions"].items(), *(i for m in g.get("archive", {}).values() for i in m.items())]
+            for date, uids in days:
+                for uid in uids:
+                    done.setdefault(uid, []).append(date)
+            missed = {
+                uid: [e["date"] for e in entries if e["kind"] == "penalty"]
+                for uid, entries in g.get("ledger", {}).items()
+            }
+            g["stats"], g["trend"] = {}, {}
+            for uid in done.keys() | missed.keys():
+                s, months = replay_stats(done.get(uid, []), missed.get(uid, []))
+                g["stats"][uid] = dict(s, months=months)
+                for month, m in months.items():
+                    t = g["trend"].setdefault(month, {"done": 0, "missed": 0})
+                    t["done"] += m["done"]
+                    t["missed"] += m["missed"]
+                users += 1
+        self.data["stats_built"] = True
+        return users
+
+    async def set_channel(self, guild_id: int, channel_id: int):
+        await self._commit("set_channel", guild_id, channel_id)
+
+    async def join(self, guild_id: int, user_id: int):
+        await self._commit("join", guild_id, user_id)
+
+    async def leave(self, guild_id: int, user_id: int):
+        await self._commit("leave", guild_id, user_id)
+
+    # 여러 명을 한 번의 기록(저장/저널 한 줄)으로
+    async def join_many(self, guild_id: int, user_ids: list[int]):
+        await self._commit("join_many", guild_id, list(user_ids))
+
+    async def leave_many(self, guild_id: int, user_ids: list[int]):
+        await self._commit("leave_many", guild_id, list(user_ids))
+
+    async def add_penalties_many(self, guild_id: int, user_ids: list[int], amount: int = 1000,
+                                 kind: str = "manual", date: str | None = None) -> list[tuple[str, int]]:
+        """여러 사용자에게 amount 씩 부과하고 (user_id, 현재 벌점) 목록을 반환."""
+        date = date or today_str(DEFAULT_TZ)
+        entries = [ledger_entry(amount, kind, date) for _ in user_ids]
+        return await self._commit("add_penalties_many", guild_id, list(user_ids), int(amount), entries)
+
+    async def is_participant(self, guild_id: int, user_id: int) -> bool:
+        return str(user_id) in self._g(guild_id)["participants"]
+
+    async def iter_routes(self):
+        """(guild_id, channel_id, participants, schedule) 를 길드마다 하나씩."""
+        for gid, g in list(self.data["guilds"].items()):
+            yield int(gid), g.get("channel_id"), list(g.get("participants", [])), g.get("schedule")
+        # 아직 파싱하지 않은 길드는 헤더의 요약으로 (길드 본문을 읽지 않음)
+        for gid, (channel_id, participants, schedule) in list(self._routes.items()):
+            yield int(gid), channel_id, list(participants), schedule
+
+    async def get_schedule(self, guild_id: int) -> dict:
+        return normalize_schedule(self._g(guild_id).get("schedule"))
+
+    async def set_schedule(self, guild_id: int, schedule: dict):
+        await self._commit("set_schedule", guild_id, normalize_schedule(schedule))
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        holder = self._leases.get(key)
+        if holder and holder[0] != owner and holder[1] > time.time():
+            return False
+        self._leases[key] = (owner, time.time() + ttl)
+        return True
+
+    async def release_lease(self, key: str, owner: str):
+        if self._leases.get(key, ("",))[0] == owner:
+            del self._leases[key]
+
+    async def claim_job(self, guild_id: int, job: str, date: str) -> bool:
+        """(job, date) 를 처음 실행하는 경우에만 True. 같은 날짜의 중복 실행 방지."""
+        if self._g(guild_id).get("job_runs", {}).get(job, "") >= date:
+            return False
+        return await self._commit("claim_job", guild_id, job, date)
+
+    async def has_submitted(self, guild_id: int, date: str, user_id: int) -> bool:
+        g = self._g(guild_id)
+        return str(user_id) in g["submissions"].get(date, [])
+
+    async def mark_submission(self, guild_id: int, date: str, user_id: int) -> bool:
+        """새 인증이면 True. 이미 인증했거나 그 날짜가 이미 정산됐으면 False (저널에도 남기지 않음).
+
+        변경 연산은 await 없이 한 번에 적용되므로 같은 길드의 다른 변경과 섞이지 않음."""
+        g = self._g(guild_id)
+        if (self._settled(g) or "") >= date or str(user_id) in g["submissions"].get(date, ()):
+            return False
+        return await self._commit("mark_submission", guild_id, date, user_id)
+
+    async def last_settled(self, guild_id: int) -> str | None:
+        return self._settled(self._g(guild_id))
+
+    async def apply_penalties_for_date(self, guild_id: int, date: str) -> list[tuple[str, int]]:
+        """전날(date)에 인증 안 한 참가자들에게 1000원씩 벌점 부과. 이미 정산된 날짜면 아무것도 하지 않음."""
+        if (self._settled(self._g(guild_id)) or "") >= date:
+            return []
+        return await self._commit("apply_penalties", guild_id, date, utc_now_iso())
+
+    async def archive_submissions(self, before: str) -> int:
+        """before(YYYY-MM-DD) 이전 인증 기록을 월별 묶음(archive)으로 옮김. 아직 정산 안 된 날짜는 남김."""
+        return await self._commit("archive_submissions", before)
+
+    async def add_penalty(self, guild_id: int, user_id: int, amount: int = 1000, kind: str = "manual",
+                          date: str | None = None) -> int:
+        """특정 사용자에게 amount만큼 벌점 부과(납부/환급은 음수)하고 현재 총 벌점을 반환.
+
+        date 는 원장 날짜(길드 시간대의 오늘). 없으면 기본 시간대(KST) 기준."""
+        entry = ledger_entry(amount, kind, date or today_str(DEFAULT_TZ))
+        return await self._commit("add_penalty", guild_id, user_id, int(amount), entry)
+
+    async def ledger_entries(self, guild_id: int, user_id: int | None = None, start: str = "", end: str = "9999",
+                             limit: int = 50) -> list[dict]:
+        """원장 기록을 최신순으로. start <= date < end (YYYY-MM-DD 또는 YYYY-MM)."""
+        ledger = self._g(guild_id).get("ledger", {})
+        users = [str(user_id)] if user_id is not None else list(ledger)
+        rows = [
+            dict(e, user_id=uid)
+            for uid in users for e in ledger.get(uid, [])
+            if start <= e["date"] < end
+        ]
+        return heapq.nlargest(limit, rows, key=lambda e: (e["date"], e["ts"]))
+
+    async def ledger_totals(self, guild_id: int, start: str, end: str) -> list[tuple[str, int]]:
+        """기간(start <= date < end) 동안 사용자별 증감 합계 (월별 정산용), 큰 순."""
+        totals = {}
+        for uid, entries in self._g(guild_id).get("ledger", {}).items():
+            s = sum(e["amount"] for e in entries if start <= e["date"] < end)
+            if s:
+                totals[uid] = s
+        return sorted(totals.items(), key=lambda x: x[1], reverse=True)
+
     async def get_debt(self, guild_id: int, user_id: int) -> int:
         g = self._g(guild_id)
         return g["debt"].get(str(user_id), 0)
 
     async def leaderboard(self, guild_id: int, limit: int = 10) -> list[tuple[str, int]]:
-        g = self._g(guild_id)
-        items = list(g["debt"].items())
-        items.sort(key=lambda x: x[1], reverse=True)
-        return items[:limit]
+        return (await self.leaderboard_with_total(guild_id, limit))[0]
 
     async def total_debt(self, guild_id: int) -> int:
         g = self._g(guild_id)
         return sum(g["debt"].values())
 
+    async def leaderboard_with_total(self, guild_id: int, limit: int = 10) -> tuple[list[tuple[str, int]], int]:
+        # 전체 정렬 대신 힙으로 상위 limit 개만 (O(n log k))
+        debt = self._g(guild_id)["debt"]
+        return heapq.nlargest(limit, debt.items(), key=lambda x: x[1]), sum(debt.values())
+
     async def pending_for_date(self, guild_id: int, date: str) -> list[str]:
         g = self._g(guild_id)
         participants = set(g["participants"])
         submitted = set(g["submissions"].get(date, []))
         return sorted(participants - submitted)
 
+    async def get_stats(self, guild_id: int, user_id: int) -> dict:
+        """연속 인증 {streak, best, last, total} 과 월별 {YYYY-MM: {done, missed}} (months)."""
+        s = self._g(guild_id).get("stats", {}).get(str(user_id), {})
+        return dict(streak_fields(s), months={m: dict(v) for m, v in s.get("months", {}).items()})
+
+    async def attendance_trend(self, guild_id: int, limit: int = 3) -> list[tuple[str, int, int]]:
+        """길드 전체의 최근 limit 개월 (월, 인증, 미인증), 최신순."""
+        trend = self._g(guild_id).get("trend", {})
+        return [(m, trend[m]["done"], trend[m]["missed"]) for m in sorted(trend, reverse=True)[:limit]]
+
+    async def rebuild_stats(self) -> int:
+        """인증 기록(보관분 포함)과 원장의 미인증 벌점으로 통계를 다시 계산. 계산한 사용자 수를 반환."""
+        return await self._commit("rebuild_stats")
+
+class WriteAheadBuffer:
+    """변경 연산을 로컬 파일에 먼저 한 줄씩 기록(fsync)한 뒤 반환하는 대기열.
+
+    파일 쓰기와 fsync 는 이벤트 루프 밖에서 하고, 그 사이 들어온 기록은 다음 fsync 한 번에 함께 씀.
+    백그라운드 태스크가 앞에서부터 batch_size 개씩 apply(records) 로 반영하고, 실패하면 순서를 지킨 채
+    백오프 후 같은 묶음부터 다시 시도. 시작 시 파일에 남은 기록을 다시 올리므로 연산은 여러 번 적용돼도
+    결과가 같아야 함 (upsert / $addToSet / $pull / $set)."""
+
+    def __init__(self, path: str, apply, batch_size: int = 500, compact_after: int = 10000,
+                 max_backoff: float = 30.0):
+        self.path = path
+        self.apply = apply                # async (list[기록]) -> None
+        self.batch_size = batch_size
+        self.compact_after = compact_after  # 반영됐지만 파일에 남은 기록이 이만큼이면 파일을 다시 씀
+        self.max_backoff = max_backoff
+        self.queue: deque[dict] = deque()   # 아직 반영하지 않은 기록 {"s", "op", "a", "t"}
+        self._seq = 0            # 마지막으로 추가된 기록 번호
+        self.drained_seq = 0     # 여기까지 반영됨
+        self._stale = 0          # 반영됐지만 아직 파일에 남은 기록 수
+        self._fp = None
+        self._io = asyncio.Lock()  # 파일 쓰기/fsync 와 다시 쓰기를 한 번에 하나씩
+        self._unsynced: list[str] = []  # 대기열엔 올렸지만 아직 fsync 안 된 줄
+        self._synced_seq = 0     # 여기까지 파일에 fsync 됨
+        self._wake = asyncio.Event()
+        self._cond = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+        self.counters = {"appended": 0, "drained": 0, "batches": 0, "errors": 0}
+
+    def open(self) -> list[dict]:
+        """파일에 남은(이전 실행에서 반영 못 한) 기록을 대기열에 올리고 그 목록을 반환."""
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.queue.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # 쓰다 만 줄 (쓰기 실패 뒤 다시 쓴 기록은 다음 줄부터 있음)
+        if self.queue:
+            self._seq = self._synced_seq = self.queue[-1]["s"]
+            self.drained_seq = self.queue[0]["s"] - 1
+            self._rewrite(list(self.queue))  # 잘린 줄 정리
+        self._fp = open(self.path, "a", encoding="utf-8")
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain_loop())
+        if self.queue:
+            self._wake.set()
+        return list(self.queue)
+
+    def append(self, op: str, args: tuple) -> dict:
+        """기록을 대기열에 올리고 반환 (await 없음). 파일에 남았다고 보려면 sync(rec) 를 기다려야 함."""
+        self._seq += 1
+        rec = {"s": self._seq, "op": op, "a": list(args), "t": time.time()}
+        self._unsynced.append(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.queue.append(rec)
+        self.counters["appended"] += 1
+        self._wake.set()
+        return rec
+
+    async def sync(self, rec: dict):
+        """rec 까지 파일에 fsync 될 때까지 대기. 앞선 호출이 함께 기록했으면 바로 반환 (group commit)."""
+        async with self._io:
+            if self._synced_seq >= rec["s"]:
+                return
+            lines, self._unsynced = self._unsynced, []
+            seq = self._seq
+            try:
+                await asyncio.to_thread(self._write_synced, lines)
+            except Exception:
+                # 못 쓴 줄은 다음 호출이 다시 (쓰다 만 줄과 붙지 않게 새 줄부터)
+                self._unsynced[:0] = ["\n", *lines]
+                raise
+            self._synced_seq = seq
+
+    def _write_synced(self, lines: list[str]):
+        self._fp.writelines(lines)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def lag(self) -> float:
+        """가장 오래 기다린 기록의 대기 시간(초). 비어 있으면 0."""
+        return time.time() - self.queue[0]["t"] if self.queue else 0.0
+
+    async def wait_drained(self, timeout: float | None = None) -> bool:
+        """지금까지 추가된 기록이 모두 반영될 때까지 대기. 시간 안에 끝나지 않으면 False."""
+        target = self._seq
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self.drained_seq >= target), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def _rewrite(self, records: list[dict]):
+        # 남은 기록만 새 파일에 쓰고(fsync) 교체
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    async def _compact(self):
+        """반영된 기록을 파일에서 덜어냄. 아직 fsync 안 된 기록도 새 파일에 함께 씀."""
+        async with self._io:
+            records, seq, staged = list(self.queue), self._seq, len(self._unsynced)
+            self._fp.close()
+            try:
+                await asyncio.to_thread(self._rewrite, records)
+            finally:
+                self._fp = open(self.path, "a", encoding="utf-8")
+            del self._unsynced[:staged]  # 다시 쓰는 사이 들어온 줄은 남겨 둠
+            self._synced_seq = seq
+            self._stale = 0
+
+    async def _drain_loop(self):
+        backoff = 0.5
+        while True:
+            await self._wake.wait()
+            batch = list(itertools.islice(self.queue, self.batch_size))
+            if not batch:
+                self._wake.clear()
+                continue
+            try:
+                await self.apply(batch)
+            except Exception as e:  # 연결 끊김/시간 초과 등: 순서를 지키려고 같은 묶음부터 다시
+                self.counters["errors"] += 1
+                log.warning("write buffer: %d건 반영 실패, %.1fs 후 재시도 (%r)", len(batch), backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = 0.5
+            for _ in batch:
+                self.queue.popleft()
+            self.drained_seq = batch[-1]["s"]
+            self._stale += len(batch)
+            self.counters["drained"] += len(batch)
+            self.counters["batches"] += 1
+            # 비었으면 파일을 비우고, 계속 밀려 있어도 반영된 앞부분이 너무 쌓이면 다시 씀
+            if not self.queue or self._stale >= self.compact_after:
+                try:
+                    await self._compact()
+                except Exception:
+                    log.exception("write buffer: 파일 정리 실패 (다음 반영 뒤 다시)")
+            async with self._cond:
+                self._cond.notify_all()
+
+    async def close(self, timeout: float = 5.0):
+        """남은 기록을 잠깐 반영해 보고 파일을 닫음 (못 한 것은 다음 시작 때 이어서)."""
+        if self._fp is None:
+            return
+        await self.wait_drained(timeout)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._fp.close()
+        self._fp = None
+
 # MongoDB 저장소 추가
 class MongoStore:
-    def __init__(self, client: AsyncIOMotorClient, db_name: str = "studybot", coll_name: str = "guilds"):
+    def __init__(self, client: AsyncIOMotorClient, db_name: str = "studybot", coll_name: str = "guilds",
+                 cache_ttl: float = 60.0, cache_size: int = 4096, subs_coll_name: str = "submissions",
+                 buffer_path: str | None = None, buffer_batch: int = 500, buffer_read_timeout: float = 0.5):
         self.client = client
         self.db = client[db_name]
         self.coll = self.db[coll_name]
+        # 인증 기록은 길드 문서 밖에서 (guild_id, date, user_id) 한 건당 문서 하나로 보관
+        self.subs = self.db[subs_coll_name]
+        self.subs_archive = self.db[subs_coll_name + "_monthly"]  # 오래된 날짜의 월별 묶음
+        self.leases = self.db[coll_name + "_leases"]  # 여러 프로세스 사이의 작업 점유 (만료 시각 포함)
+        # 벌점 원장: 추가만 하는 기록. 잔액은 길드 문서의 debt.<uid> 에 함께 반영
+        self.ledger = self.db[coll_name + "_ledger"]
+        # 길드 설정/참가자(("g", gid))와 날짜별 인증자(("d", gid, date)) 캐시.
+        # 이 프로세스의 변경 연산이 직접 갱신하고, 다른 경로의 변경은 TTL 안에 반영됨
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # 로컬 선기록 버퍼(선택): 인증/참가/설정 변경을 파일에 먼저 남기고 바로 반환, 뒤에서 순서대로 반영.
+        # DB 가 느리거나 끊겨도 인증이 유실되지 않음
+        self.buffer = WriteAheadBuffer(buffer_path, self._apply_buffered, batch_size=buffer_batch) if buffer_path else None
+        self._buffered_subs: dict[tuple[str, str], set[str]] = {}  # (guild_id, date) -> 아직 반영 안 된 인증자
+        self.buffer_read_timeout = buffer_read_timeout  # 버퍼 모드에서 인증 여부 조회를 기다리는 최대 시간(초)
+        # 여러 번 왕복하는 길드 변경(인증 기록, 벌점 정산)은 길드별로 줄 세워 실행. 다른 길드끼리는 동시에
+        self._guild_locks = KeyedLock()
+        self._loaded = False
 
-    async def load(self):  # 인터페이스 맞춤 (무동작)
-        return
+    async def load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.buffer is not None:
+            for rec in self.buffer.open():  # 이전 실행에서 반영 못 한 변경부터
+                self._hold(rec)
+        await self.subs.create_index(
+            [("guild_id", ASCENDING), ("date", ASCENDING), ("user_id", ASCENDING)], unique=True
+        )
+        await self.subs_archive.create_index([("guild_id", ASCENDING), ("month", ASCENDING)])
+        await self.leases.create_index("expires_at", expireAfterSeconds=0)  # 만료된 점유는 자동 정리
+        await self.ledger.create_index([("guild_id", ASCENDING), ("user_id", ASCENDING), ("date", ASCENDING)])
+        await self.ledger.create_index([("guild_id", ASCENDING), ("date", ASCENDING)])
+        await self.migrate_embedded_submissions()
+        async for doc in self.coll.find({"pending_ledger": {"$exists": True}}, {"pending_ledger": 1}):
+            await self._flush_pending(doc["_id"], doc["pending_ledger"])  # 잔액 반영 직후 죽은 경우
+        await self.open_ledger()
+        if not await self.ledger.find_one({"_id": "__stats__"}, {"_id": 1}):
+            # 통계 도입 전 데이터: 원장과 같은 방식으로 표식을 남겨 한 번만 백필
+            await self.rebuild_stats()
+            await self.ledger.insert_one({"_id": "__stats__", "ts": utc_now_iso()})
 
     async def save(self):  # 인터페이스 맞춤 (무동작)
         return
 
-    async def _ensure_doc(self, guild_id: int):
-        await self.coll.update_one(
-            {"_id": str(guild_id)},
-            {"$setOnInsert": {
-                "channel_id": None,
-                "participants": [],
-                "debt": {},
-                "submissions": {}
-            }},
-            upsert=True
-        )
-
-    async def _get(self, guild_id: int) -> dict:
-        doc = await self.coll.find_one({"_id": str(guild_id)})
-        if not doc:
-            await self._ensure_doc(guild_id)
-            doc = await self.coll.find_one({"_id": str(guild_id)})
+    async def flush(self):
+        # 종료 전 버퍼를 잠깐 비워 봄 (못 비운 변경은 파일에 남아 다음 시작 때 이어서 반영)
+        await self.wait_drained(timeout=5.0)
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
+
+    async def wait_drained(self, timeout: float | None = None) -> bool:
+        """지금까지 버퍼에 받은 변경이 모두 DB 에 반영될 때까지 대기. 버퍼가 없으면 바로 True."""
+        return True if self.buffer is None else await self.buffer.wait_drained(timeout)
+
+    def buffer_stats(self) -> dict:
+        if self.buffer is None:
+            return {"depth": 0, "lag_seconds": 0.0}
+        return dict(self.buffer.counters, depth=self.buffer.depth(), lag_seconds=self.buffer.lag())
+
+    # ---- 변경 연산 (바로 실행하거나 버퍼를 거쳐 실행) ----
+    def _plan(self, op: str, args) -> tuple:
+        """변경 연산 → (컬렉션, 필터, 갱신). 모두 upsert 이고 여러 번 적용해도 결과가 같음."""
+        if op == "mark_submission":
+            guild_id, date, user_id = args
+            return self.subs, {"guild_id": str(guild_id), "date": date, "user_id": str(user_id)}, \
+                {"$setOnInsert": {"ts": datetime.datetime.now(datetime.timezone.utc)}}
+        guild_id, arg = args
+        if op == "set_channel":
+            update = {"$set": {"channel_id": arg}}
+        elif op == "set_schedule":
+            update = {"$set": {"schedule": normalize_schedule(arg)}}
+        elif op == "join_many":
+            uids = [str(u) for u in arg]
+            # $inc 0 은 벌점이 없을 때만 0 으로 만들고 기존 값은 건드리지 않음
+            update = {"$addToSet": {"participants": {"$each": uids}}, "$inc": {f"debt.{uid}": 0 for uid in uids}}
+        elif op == "leave_many":
+            update = {"$pull": {"participants": {"$in": [str(u) for u in arg]}}}
+        else:
+            raise ValueError(op)
+        return self.coll, {"_id": str(guild_id)}, update
+
+    async def _write(self, op: str, *args):
+        if self.buffer is not None:
+            rec = self.buffer.append(op, args)
+            self._hold(rec)
+            await self.buffer.sync(rec)
+            return
+        coll, query, update = self._plan(op, args)
+        await coll.update_one(query, update, upsert=True)
+
+    def _hold(self, rec: dict):
+        # 반영 전인 인증도 has_submitted / 리마인더 대상 계산에 보이도록
+        if rec["op"] == "mark_submission":
+            guild_id, date, user_id = rec["a"]
+            self._buffered_subs.setdefault((str(guild_id), date), set()).add(str(user_id))
+
+    async def _apply_buffered(self, records: list[dict]):
+        # 연속된 같은 컬렉션 연산은 순서를 지키는 bulk_write 하나로
+        plans = [(rec, *self._plan(rec["op"], rec["a"])) for rec in records]
+        for _, group in itertools.groupby(plans, key=lambda p: p[1].name):
+            group = list(group)
+            await group[0][1].bulk_write([UpdateOne(q, u, upsert=True) for _, _, q, u in group], ordered=True)
+            # 인증은 모두 확정 단계를 거침. 확정은 길드 문서의 counted 로 한 번만 세므로, 확정 도중 실패해
+            # 묶음 전체를 다시 시도해도(이번엔 upsert 가 기존 문서에 맞음) 빠지거나 두 번 세지 않음
+            for rec, *_ in group:
+                if rec["op"] == "mark_submission":
+                    await self._settle_buffered_submission(*rec["a"])
+        for rec in records:
+            if rec["op"] != "mark_submission":
+                self.cache.pop(("g", rec["a"][0]))  # 반영 전에 DB 에서 읽어 캐시한 설정/참가자는 버림
+                continue
+            guild_id, date, user_id = rec["a"]
+            pending = self._buffered_subs.get((str(guild_id), date))
+            if pending is not None:
+                pending.discard(str(user_id))
+                if not pending:
+                    del self._buffered_subs[(str(guild_id), date)]
+
+    async def migrate_embedded_submissions(self, batch_size: int = 1000) -> int:
+        """길드 문서 안의 submissions.<date> 를 인증 컬렉션으로 옮김. 여러 번 실행해도 안전."""
+        moved = 0
+        async for doc in self.coll.find({"submissions": {"$exists": True}}, {"submissions": 1}):
+            ops = []
+            for date, uids in doc.get("submissions", {}).items():
+                for uid in uids:
+                    ops.append(UpdateOne(
+                        {"guild_id": doc["_id"], "date": date, "user_id": uid},
+                        {"$setOnInsert": {"migrated": True}}, upsert=True
+                    ))
+            for i in range(0, len(ops), batch_size):
+                await self.subs.bulk_write(ops[i:i + batch_size], ordered=False)
+            # 옮긴 뒤에만 제거 (중간에 죽으면 다음 실행에서 다시 upsert)
+            await self.coll.update_one({"_id": doc["_id"]}, {"$unset": {"submissions": ""}})
+            moved += len(ops)
+        return moved
+
+    async def open_ledger(self) -> int:
+        """원장 도입 전 잔액을 기초(opening) 기록으로 옮김. 끝나면 표식 문서를 남겨 한 번만 실행."""
+        if await self.ledger.find_one({"_id": "__opened__"}, {"_id": 1}):
+            return 0
+        date, entries = today_str(DEFAULT_TZ), []
+        async for doc in self.coll.find({"debt": {"$exists": True}}, {"debt": 1}):
+            for uid, debt in doc["debt"].items():
+                if debt:
+                    entry = ledger_entry(debt, "opening", date, f"opening:{doc['_id']}:{uid}")
+                    entries.append(dict(entry, _id=entry.pop("id"), guild_id=doc["_id"], user_id=uid))
+        await self._insert_entries(entries)
+        await self.ledger.insert_one({"_id": "__opened__", "ts": utc_now_iso()})
+        return len(entries)
+
+    async def rebuild_stats(self, batch_size: int = 500) -> int:
+        """인증 기록(월별 보관분 포함)과 원장의 미인증 벌점으로 통계를 다시 계산. 계산한 사용자 수를 반환."""
+        done: dict[str, dict[str, list[str]]] = {}    # guild_id -> user_id -> 인증 날짜들
+        missed: dict[str, dict[str, list[str]]] = {}  # guild_id -> user_id -> 미인증 날짜들
+        pipeline = [{"$group": {"_id": {"g": "$guild_id", "u": "$user_id"}, "dates": {"$push": "$date"}}}]
+        async for row in self.subs.aggregate(pipeline):
+            done.setdefault(row["_id"]["g"], {}).setdefault(row["_id"]["u"], []).extend(row["dates"])
+        async for doc in self.subs_archive.find({}, {"guild_id": 1, "days": 1}):
+            users = done.setdefault(doc["guild_id"], {})
+            for date, uids in doc.get("days", {}).items():
+                for uid in uids:
+                    users.setdefault(uid, []).append(date)
+        async for e in self.ledger.find({"kind": "penalty"}, {"_id": 0, "guild_id": 1, "user_id": 1, "date": 1}):
+            missed.setdefault(e["guild_id"], {}).setdefault(e["user_id"], []).append(e["date"])
+        ops, users = [], 0
+        for gid in done.keys() | missed.keys():
+            stats, trend = {}, {}
+            for uid in done.get(gid, {}).keys() | missed.get(gid, {}).keys():
+                streak, months = replay_stats(done.get(gid, {}).get(uid, []), missed.get(gid, {}).get(uid, []))
+                stats[uid] = dict(streak, months=months)
+                for month, m in months.items():
+                    t = trend.setdefault(month, {"done": 0, "missed": 0})
+                    t["done"] += m["done"]
+                    t["missed"] += m["missed"]
+            ops.append(UpdateOne({"_id": gid}, {"$set": {"stats": stats, "trend": trend}}, upsert=True))
+            users += len(stats)
+        for i in range(0, len(ops), batch_size):
+            await self.coll.bulk_write(ops[i:i + batch_size], ordered=False)
+        return users
+
+    async def _insert_entries(self, entries: list[dict]):
+        # 결정적 _id 라 재실행 시 이미 있는 기록(중복 키)은 건너뜀
+        if not entries:
+            return
+        try:
+            await self.ledger.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+    async def _post(self, guild_id: int, batch: str, entries: list[dict], projection: dict,
+                    settle: str | None = None, extra: dict | None = None, expect: dict | None = None) -> dict | None:
+        """같은 묶음(batch)의 잔액 증감을 길드 문서에 정확히 한 번 반영하고 원장 기록을 넣음.
+
+        원장은 잔액 쓰기가 성공한 뒤에만 넣음: 같은 쓰기에서 pending_ledger.<batch> 에 남겨 두고, 넣은 뒤
+        지우며, 그 사이 죽으면 다음 정산이나 시작 시 마저 넣음 (원장 _id 가 고정이라 여러 번 넣어도 한 번).
+        길드 문서의 posted 목록(최근 64 묶음)에 batch 가 이미 있으면 다시 증감하지 않음. 정산 batch 의 중복은
+        기준점 조건이 따로 막고, 수동 부과는 호출마다 새 batch 라 다시 실행되지 않음. settle 이 있으면 정산
+        기준점(last_settled)이 그 날짜보다 앞일 때만 반영하고 같은 쓰기에서 기준점을 옮김. extra 는 같은
+        조건으로 함께 적용할 추가 갱신({"$set": ..., "$inc": ...}), expect 는 추가 조건 (읽은 뒤 바뀌지
+        않았어야 하는 필드). 이미 반영됐거나 조건이 맞지 않으면 None."""
+        gid = str(guild_id)
+        docs = []
+        inc: dict[str, int] = {}
+        for e in entries:
+            e = dict(e, guild_id=gid)
+            e["_id"] = e.pop("id")
+            docs.append(e)
+            inc[f"debt.{e['user_id']}"] = inc.get(f"debt.{e['user_id']}", 0) + e["amount"]
+        query = {"_id": gid, "posted": {"$ne": batch}, **(expect or {})}
+        update = {"$push": {"posted": {"$each": [batch], "$slice": -64}}}
+        if inc:
+            update["$inc"] = inc
+        if settle is not None:
+            query["$or"] = [{"last_settled": {"$exists": False}}, {"last_settled": {"$lt": settle}}]
+            update["$set"] = {"last_settled": settle}
+        if docs:
+            update.setdefault("$set", {})[f"pending_ledger.{batch}"] = docs
+        for op, fields in (extra or {}).items():
+            update.setdefault(op, {}).update(fields)
+        try:
+            doc = await self.coll.find_one_and_update(
+                query, update,
+                projection={"_id": 0, **projection},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None  # 이미 반영된 묶음 (문서는 있는데 조건이 안 맞아 upsert 가 삽입을 시도한 경우)
+        if docs:
+            await self._flush_pending(gid, {batch: docs})
+        return doc if doc is not None else await self._get(guild_id, projection)
+
+    async def _flush_pending(self, gid: str, pending: dict[str, list[dict]]):
+        # 잔액 쓰기가 남긴 원장 기록({batch: entries})을 넣고 표시를 지움 (여러 번 실행해도 안전)
+        await self._insert_entries([e for entries in pending.values() for e in entries])
+        await self.coll.update_one({"_id": gid}, {"$unset": {f"pending_ledger.{b}": "" for b in pending}})
+        await self.coll.update_one({"_id": gid, "pending_ledger": {}}, {"$unset": {"pending_ledger": ""}})
+
+    async def ledger_entries(self, guild_id: int, user_id: int | None = None, start: str = "", end: str = "9999",
+                             limit: int = 50) -> list[dict]:
+        """원장 기록을 최신순으로. start <= date < end (YYYY-MM-DD 또는 YYYY-MM)."""
+        query = {"guild_id": str(guild_id), "date": {"$gte": start, "$lt": end}}
+        if user_id is not None:
+            query["user_id"] = str(user_id)
+        cursor = self.ledger.find(query).sort([("date", -1), ("ts", -1)]).limit(limit)
+        return [dict(d, id=d.pop("_id")) async for d in cursor]
+
+    async def ledger_totals(self, guild_id: int, start: str, end: str) -> list[tuple[str, int]]:
+        """기간(start <= date < end) 동안 사용자별 증감 합계 (월별 정산용), 큰 순."""
+        pipeline = [
+            {"$match": {"guild_id": str(guild_id), "date": {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": "$user_id", "sum": {"$sum": "$amount"}}},
+            {"$match": {"sum": {"$ne": 0}}},
+            {"$sort": {"sum": -1}},
+        ]
+        return [(r["_id"], int(r["sum"])) async for r in self.ledger.aggregate(pipeline)]
+
+    async def archive_submissions(self, before: str, batch_size: int = 1000) -> int:
+        """before(YYYY-MM-DD) 이전 인증 기록을 (길드, 월) 문서 하나로 묶고 원본은 삭제. 아직 정산 안 된 날짜는 남김."""
+        pipeline = [
+            {"$match": {"date": {"$lt": before}}},
+            {"$group": {"_id": {"g": "$guild_id", "d": "$date"}, "users": {"$addToSet": "$user_id"}}},
+        ]
+        rows = [row async for row in self.subs.aggregate(pipeline)]
+        # 길드별 기준일: 정산 기준점은 앞으로만 움직이므로 여기서 읽은 값보다 늦게 보관할 일은 없음
+        gids = sorted({row["_id"]["g"] for row in rows})
+        cutoff = {gid: before for gid in gids}
+        async for doc in self.coll.find({"_id": {"$in": gids}}, {"last_settled": 1, "job_runs.penalty": 1}):
+            cutoff[doc["_id"]] = archive_cutoff(before, self._settled(doc))
+        ops = []
+        for row in rows:
+            gid, date = row["_id"]["g"], row["_id"]["d"]
+            if date >= cutoff[gid]:
+                continue
+            month = date[:7]
+            ops.append(UpdateOne(
+                {"_id": f"{gid}:{month}"},
+                {"$set": {"guild_id": gid, "month": month},
+                 "$addToSet": {f"days.{date}": {"$each": sorted(row["users"])}}},
+                upsert=True
+            ))
+        for i in range(0, len(ops), batch_size):
+            await self.subs_archive.bulk_write(ops[i:i + batch_size], ordered=False)
+        if ops:
+            deletes = [DeleteMany({"guild_id": gid, "date": {"$lt": c}}) for gid, c in cutoff.items()]
+            for i in range(0, len(deletes), batch_size):
+                await self.subs.bulk_write(deletes[i:i + batch_size], ordered=False)
+        return len(ops)
+
+    # 모든 변경은 upsert 한 번으로 끝냄. 문서가 없을 때 생기는 빈 필드는 읽는 쪽에서 기본값으로 처리
+    async def _update(self, guild_id: int, update: dict):
+        await self.coll.update_one({"_id": str(guild_id)}, update, upsert=True)
+
+    async def _get(self, guild_id: int, projection: dict | None = None) -> dict:
+        doc = await self.coll.find_one({"_id": str(guild_id)}, projection)
         return doc or {}
 
+    async def _view(self, guild_id: int) -> dict:
+        """채널/참가자만 프로젝션으로 읽어 캐시 (제출 기록은 가져오지 않음)."""
+        key = ("g", guild_id)
+        view = self.cache.get(key)
+        if view is _MISS:
+            doc = await self._get(guild_id, {"channel_id": 1, "participants": 1})
+            view = {"channel_id": doc.get("channel_id"), "participants": set(doc.get("participants", []))}
+            self.cache.set(key, view)
+        return view
+
+    async def _submitted(self, guild_id: int, date: str) -> set[str]:
+        # (guild_id, date, user_id) 인덱스만 타므로 그날 인증 건수에만 비례
+        cursor = self.subs.find({"guild_id": str(guild_id), "date": date}, {"_id": 0, "user_id": 1})
+        return {d["user_id"] async for d in cursor} | self._buffered_subs.get((str(guild_id), date), set())
+
+    async def _day(self, guild_id: int, date: str) -> set[str]:
+        key = ("d", guild_id, date)
+        day = self.cache.get(key)
+        if day is _MISS:
+            day = await self._submitted(guild_id, date)
+            self.cache.set(key, day)
+        return day
+
     async def set_channel(self, guild_id: int, channel_id: int):
-        await self._ensure_doc(guild_id)
-        await self.coll.update_one({"_id": str(guild_id)}, {"$set": {"channel_id": channel_id}})
+        await self._write("set_channel", guild_id, channel_id)
+        view = self.cache.peek(("g", guild_id))
+        if view is not None:
+            view["channel_id"] = channel_id
 
     async def get_channel(self, guild_id: int) -> int | None:
-        doc = await self._get(guild_id)
-        return doc.get("channel_id")
+        return (await self._view(guild_id))["channel_id"]
 
     async def join(self, guild_id: int, user_id: int):
         uid = str(user_id)
-        await self._ensure_doc(guild_id)
-        await self.coll.update_one({"_id": str(guild_id)}, {"$addToSet": {"participants": uid}})
-        doc = await self._get(guild_id)
-        if doc.get("debt", {}).get(uid) is None:
-            await self.coll.update_one({"_id": str(guild_id)}, {"$set": {f"debt.{uid}": 0}})
+        await self._write("join_many", guild_id, [user_id])
+        view = self.cache.peek(("g", guild_id))
+        if view is not None:
+            view["participants"].add(uid)
 
     async def leave(self, guild_id: int, user_id: int):
         uid = str(user_id)
-        await self._ensure_doc(guild_id)
-        await self.coll.update_one({"_id": str(guild_id)}, {"$pull": {"participants": uid}})
+        await self._write("leave_many", guild_id, [user_id])
+        view = self.cache.peek(("g", guild_id))
+        if view is not None:
+            view["participants"].discard(uid)
+
+    # 참가자/잔액은 모두 길드 문서 하나에 있으므로 여러 명이어도 업데이트 한 번
+    async def join_many(self, guild_id: int, user_ids: list[int]):
+        uids = [str(u) for u in user_ids]
+        if not uids:
+            return
+        await self._write("join_many", guild_id, list(user_ids))
+        view = self.cache.peek(("g", guild_id))
+        if view is not None:
+            view["participants"].update(uids)
+
+    async def leave_many(self, guild_id: int, user_ids: list[int]):
+        uids = [str(u) for u in user_ids]
+        if not uids:
+            return
+        await self._write("leave_many", guild_id, list(user_ids))
+        view = self.cache.peek(("g", guild_id))
+        if view is not None:
+            view["participants"].difference_update(uids)
+
+    async def add_penalties_many(self, guild_id: int, user_ids: list[int], amount: int = 1000,
+                                 kind: str = "manual", date: str | None = None) -> list[tuple[str, int]]:
+        """여러 사용자에게 amount 씩 부과. 원장은 insert_many 한 번, 잔액은 길드 문서 갱신 한 번."""
+        uids = [str(u) for u in user_ids]
+        if not uids:
+            return []
+        date = date or today_str(DEFAULT_TZ)
+        entries = [dict(ledger_entry(amount, kind, date), user_id=uid) for uid in uids]
+        projection = {f"debt.{uid}": 1 for uid in uids}
+        doc = await self._post(guild_id, entries[0]["id"], entries, projection)
+        if doc is None:
+            doc = await self._get(guild_id, projection)
+        return [(uid, int(doc.get("debt", {}).get(uid, 0))) for uid in uids]
 
     async def is_participant(self, guild_id: int, user_id: int) -> bool:
-        doc = await self._get(guild_id)
-        return str(user_id) in doc.get("participants", [])
+        return str(user_id) in (await self._view(guild_id))["participants"]
+
+    async def iter_routes(self):
+        """(guild_id, channel_id, participants, schedule) 를 길드마다 하나씩."""
+        async for doc in self.coll.find({}, {"channel_id": 1, "participants": 1, "schedule": 1}):
+            yield int(doc["_id"]), doc.get("channel_id"), doc.get("participants", []), doc.get("schedule")
+
+    async def get_schedule(self, guild_id: int) -> dict:
+        doc = await self._get(guild_id, {"schedule": 1})
+        return normalize_schedule(doc.get("schedule"))
+
+    async def set_schedule(self, guild_id: int, schedule: dict):
+        await self._write("set_schedule", guild_id, normalize_schedule(schedule))
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """key 를 ttl 초 동안 점유. 다른 owner 가 만료 전까지 잡고 있으면 False."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            await self.leases.update_one(
+                {"_id": key, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + datetime.timedelta(seconds=ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False  # 다른 프로세스가 유효한 점유를 가지고 있음
+        return True
 
-    async def mark_submission(self, guild_id: int, date: str, user_id: int):
+    async def release_lease(self, key: str, owner: str):
+        await self.leases.delete_one({"_id": key, "owner": owner})
+
+    async def claim_job(self, guild_id: int, job: str, date: str) -> bool:
+        """(job, date) 를 처음 실행하는 경우에만 True. 여러 프로세스가 동시에 호출해도 하나만 성공."""
+        field = f"job_runs.{job}"
+        try:
+            res = await self.coll.update_one(
+                {"_id": str(guild_id), "$or": [{field: {"$exists": False}}, {field: {"$lt": date}}]},
+                {"$set": {field: date}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False  # 문서는 있고 이미 실행됨 → upsert 가 같은 _id 로 삽입을 시도한 경우
+        return bool(res.modified_count or res.upserted_id)
+
+    async def mark_submission(self, guild_id: int, date: str, user_id: int) -> bool:
+        """새 인증이면 True. 이미 인증했거나 그 날짜가 이미 정산됐으면 False.
+
+        버퍼 모드에선 DB 를 보지 않고 받아 둔 뒤 True (정산된 날짜였다면 반영할 때 다음 날로 옮김)."""
         uid = str(user_id)
-        await self._ensure_doc(guild_id)
-        await self.coll.update_one({"_id": str(guild_id)}, {"$addToSet": {f"submissions.{date}": uid}})
+        day = self.cache.peek(("d", guild_id, date))
+        if self.buffer is not None:
+            if uid in self._buffered_subs.get((str(guild_id), date), ()) or (day is not None and uid in day):
+                return False
+            rec = self.buffer.append("mark_submission", (guild_id, date, user_id))
+            self._hold(rec)  # await 전에 표시해야 같은 사람의 동시 인증이 둘 다 통과하지 않음
+            await self.buffer.sync(rec)
+        else:
+            async with self._guild_locks(guild_id):
+                _, query, update = self._plan("mark_submission", (guild_id, date, user_id))
+                res = await self.subs.update_one(query, update, upsert=True)
+                if res.upserted_id is None or not await self._commit_submission(guild_id, date, user_id):
+                    return False
+        if day is not None:
+            day.add(uid)
+        return True
 
-    async def has_submitted(self, guild_id: int, date: str, user_id: int) -> bool:
-        doc = await self._get(guild_id)
-        return str(user_id) in doc.get("submissions", {}).get(date, [])
+    async def _commit_submission(self, guild_id: int, date: str, user_id: int) -> bool:
+        """방금 넣은 인증을 확정하고 통계에 반영. 그 날짜 정산에서 벌점을 받았다면 인증을 지우고 False.
 
-    async def apply_penalties_for_date(self, guild_id: int, date: str) -> list[tuple[str, int]]:
-        doc = await self._get(guild_id)
+        길드 문서에 대한 조건부 쓰기 한 번(정산 전일 때만 sub_seq 증가 + 통계)이 확정 시점. 인증 컬렉션을
+        읽은 뒤 이 쓰기가 끼어든 벌점 정산은 sub_seq 가 달라져 다시 계산함. 확정한 인증은 같은 쓰기에서
+        counted.<date> 에 남기므로 같은 인증을 다시 확정해도 한 번만 셈 (이미 확정됐으면 True)."""
+        uid = str(user_id)
+        projection = {f"stats.{uid}.{k}": 1 for k in STREAK_FIELDS}
+        doc = await self._get(guild_id, {**projection, "last_settled": 1, "job_runs.penalty": 1, f"counted.{date}": 1})
+        if uid in doc.get("counted", {}).get(date, ()):
+            return True
+        streak = advance_streak(doc.get("stats", {}).get(uid), date)
+        month = date[:7]
+        update = {
+            "$set": {f"stats.{uid}.{k}": v for k, v in streak.items()},
+            "$inc": {f"stats.{uid}.months.{month}.done": 1, f"trend.{month}.done": 1, "sub_seq": 1},
+            "$addToSet": {f"counted.{date}": uid},
+        }
+        once = {"_id": str(guild_id), f"counted.{date}": {"$ne": uid}}
+        if (self._settled(doc) or "") < date:
+            try:
+                res = await self.coll.update_one(
+                    {**once, "$or": [{"last_settled": {"$exists": False}}, {"last_settled": {"$lt": date}}]},
+                    update, upsert=True
+                )
+                if res.matched_count or res.upserted_id:
+                    return True
+            except DuplicateKeyError:
+                pass  # 문서는 있고 이미 정산됐거나 그새 확정됨
+            if uid in (await self._get(guild_id, {f"counted.{date}": 1})).get("counted", {}).get(date, ()):
+                return True
+        # 확정 전에 정산이 끝남: 정산이 이 인증을 봤다면(벌점 없음) 그대로 인정, 못 봤다면(벌점) 되돌림
+        pending = (await self._get(guild_id, {"pending_ledger": 1})).get("pending_ledger")
+        if pending:
+            await self._flush_pending(str(guild_id), pending)
+        if await self.ledger.find_one({"_id": f"penalty:{guild_id}:{date}:{uid}"}, {"_id": 1}):
+            await self.subs.delete_one({"guild_id": str(guild_id), "date": date, "user_id": uid})
+            return False
+        await self.coll.update_one(once, update)  # 이미 확정됐으면 맞는 문서가 없어 그대로
+        return True
+
+    async def _settle_buffered_submission(self, guild_id: int, date: str, user_id: int):
+        # 버퍼에서 반영된 인증: 받은 날짜가 그새 정산됐으면 on_message 와 같이 다음 날 인증으로.
+        # 확정이 한 번만 세므로 다시 시도하거나 그날 이미 인증했어도 그대로 반복하면 됨
+        async with self._guild_locks(guild_id):
+            while not await self._commit_submission(guild_id, date, user_id):
+                date = (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
+                _, query, update = self._plan("mark_submission", (guild_id, date, user_id))
+                await self.subs.update_one(query, update, upsert=True)
+
+    async def has_submitted(self, guild_id: int, date: str, user_id: int) -> bool:
+        """버퍼 모드에선 DB 를 기다리지 않음: 받아 둔 인증과 캐시로 답하고, 캐시에 없을 때만 잠깐 조회.
+        조회가 실패하거나 늦으면 '안 함'으로 답함 (중복은 mark_submission 과 반영 단계에서 걸러짐)."""
+        uid = str(user_id)
+        if self.buffer is None:
+            return uid in await self._day(guild_id, date)
+        if uid in self._buffered_subs.get((str(guild_id), date), ()):
+            return True
+        day = self.cache.get(("d", guild_id, date))
+        if day is not _MISS:
+            return uid in day
+        try:
+            return uid in await asyncio.wait_for(self._day(guild_id, date), self.buffer_read_timeout)
+        except (PyMongoError, asyncio.TimeoutError):
+            return False
+
+    @staticmethod
+    def _settled(doc: dict) -> str | None:
+        # 정산 기준점 도입 전에는 penalty 작업 실행 기록이 같은 의미
+        return doc.get("last_settled") or doc.get("job_runs", {}).get("penalty")
+
+    async def last_settled(self, guild_id: int) -> str | None:
+        return self._settled(await self._get(guild_id, {"last_settled": 1, "job_runs.penalty": 1}))
+
+    async def apply_penalties_for_date(self, guild_id: int, date: str, attempts: int = 5) -> list[tuple[str, int]]:
+        async with self._guild_locks(guild_id):
+            for _ in range(attempts):
+                changed = await self._try_settle(guild_id, date)
+                if changed is not None:
+                    return changed
+            raise RuntimeError(f"penalty {guild_id} {date}: 인증 기록과 계속 충돌해 정산하지 못함")
+
+    async def _try_settle(self, guild_id: int, date: str) -> list[tuple[str, int]] | None:
+        """정산 한 번 시도. 그 사이 인증이 확정돼(sub_seq 변경) 반영하지 못했으면 None."""
+        # 벌점 부과는 캐시가 아닌 DB 최신 상태 기준. sub_seq 는 인증 목록보다 먼저 읽어야 함
+        doc = await self._get(guild_id, {"participants": 1, "last_settled": 1, "job_runs.penalty": 1, "sub_seq": 1,
+                                         "pending_ledger": 1, "counted": 1})
+        if doc.get("pending_ledger"):
+            await self._flush_pending(str(guild_id), doc["pending_ledger"])
+        settled = self._settled(doc)
+        if (settled or "") >= date:
+            return []
+        if settled and not doc.get("last_settled"):
+            # 기존 실행 기록을 기준점으로 옮겨 두어야 아래 조건부 갱신이 날짜를 거꾸로 돌리지 않음
+            await self._update(guild_id, {"$set": {"last_settled": settled}})
         participants = set(doc.get("participants", []))
-        submitted = set(doc.get("submissions", {}).get(date, []))
+        submitted = await self._submitted(guild_id, date)
         missed = sorted(participants - submitted)
-        if not missed:
-            return []
-        inc = {f"debt.{uid}": 1000 for uid in missed}
-        await self.coll.update_one({"_id": str(guild_id)}, {"$inc": inc})
-        doc2 = await self._get(guild_id)
+        entries = [
+            dict(ledger_entry(1000, "penalty", date, f"penalty:{guild_id}:{date}:{uid}"), user_id=uid)
+            for uid in missed
+        ]
+        # 연속 기록 초기화와 월별 미인증 집계도 벌점과 같은 조건부 쓰기에서 (정확히 한 번)
+        prev = (await self._get(guild_id, {f"stats.{uid}.last": 1 for uid in missed})).get("stats", {})
+        month = date[:7]
+        extra = {
+            "$set": {f"stats.{uid}.streak": 0 for uid in missed if (prev.get(uid, {}).get("last") or "") < date},
+            "$inc": {f"stats.{uid}.months.{month}.missed": 1 for uid in missed},
+        }
+        if missed:
+            extra["$inc"][f"trend.{month}.missed"] = len(missed)
+        # 이전에 정산된 날짜의 확정 기록은 더 필요 없음 (정산은 버퍼가 빈 뒤에 하므로 다시 확정할 일이 없음)
+        extra["$unset"] = {f"counted.{d}": "" for d in doc.get("counted", {}) if d < date}
+        seq = doc.get("sub_seq")
+        doc2 = await self._post(guild_id, f"penalty:{date}", entries, {f"debt.{uid}": 1 for uid in missed},
+                                settle=date, extra={op: f for op, f in extra.items() if f},
+                                expect={"sub_seq": seq if seq is not None else {"$exists": False}})
+        if doc2 is None:
+            return None  # 인증이 끼어들었거나 다른 실행이 먼저 정산함 → 다시 읽어 판단
         return [(uid, int(doc2.get("debt", {}).get(uid, 0))) for uid in missed]
 
-    async def add_penalty(self, guild_id: int, user_id: int, amount: int = 1000) -> int:
-        """특정 사용자에게 amount만큼 벌점 부과하고 현재 총 벌점을 반환."""
+    async def add_penalty(self, guild_id: int, user_id: int, amount: int = 1000, kind: str = "manual",
+                          date: str | None = None) -> int:
+        """특정 사용자에게 amount만큼 벌점 부과(납부/환급은 음수)하고 현재 총 벌점을 반환.
+
+        date 는 원장 날짜(길드 시간대의 오늘). 없으면 기본 시간대(KST) 기준."""
         uid = str(user_id)
-        await self._ensure_doc(guild_id)
-        await self.coll.update_one({"_id": str(guild_id)}, {"$inc": {f"debt.{uid}": int(amount)}})
-        doc = await self._get(guild_id)
+        entry = dict(ledger_entry(amount, kind, date or today_str(DEFAULT_TZ)), user_id=uid)
+        doc = await self._post(guild_id, entry["id"], [entry], {f"debt.{uid}": 1})
+        if doc is None:
+            doc = await self._get(guild_id, {f"debt.{uid}": 1})
         return int(doc.get("debt", {}).get(uid, 0))
 
     async def get_debt(self, guild_id: int, user_id: int) -> int:
-        doc = await self._get(guild_id)
-        return int(doc.get("debt", {}).get(str(user_id), 0))
+        uid = str(user_id)
+        doc = await self._get(guild_id, {f"debt.{uid}": 1})
+        return int(doc.get("debt", {}).get(uid, 0))
 
     async def leaderboard(self, guild_id: int, limit: int = 10) -> list[tuple[str, int]]:
-        doc = await self._get(guild_id)
-        items = [(k, int(v)) for k, v in doc.get("debt", {}).items()]
-        items.sort(key=lambda x: x[1], reverse=True)
-        return items[:limit]
+        return (await self.leaderboard_with_total(guild_id, limit))[0]
 
     async def total_debt(self, guild_id: int) -> int:
-        doc = await self._get(guild_id)
-        return int(sum(int(v) for v in doc.get("debt", {}).values()))
+        return (await self.leaderboard_with_total(guild_id, 1))[1]
+
+    async def leaderboard_with_total(self, guild_id: int, limit: int = 10) -> tuple[list[tuple[str, int]], int]:
+        """상위 limit 명과 총 벌점을 서버 쪽 집계 한 번으로 조회."""
+        pipeline = [
+            {"$match": {"_id": str(guild_id)}},
+            {"$project": {"items": {"$objectToArray": {"$ifNull": ["$debt", {}]}}}},
+            {"$facet": {
+                "top": [
+                    {"$unwind": "$items"},
+                    {"$sort": {"items.v": -1}},
+                    {"$limit": limit},
+                    {"$project": {"_id": 0, "k": "$items.k", "v": "$items.v"}},
+                ],
+                "total": [{"$project": {"_id": 0, "sum": {"$sum": "$items.v"}}}],
+            }},
+        ]
+        rows = await self.coll.aggregate(pipeline).to_list(length=1)
+        if not rows:
+            return [], 0
+        top = [(r["k"], int(r["v"])) for r in rows[0]["top"]]
+        total = rows[0]["total"][0]["sum"] if rows[0]["total"] else 0
+        return top, int(total)
 
     async def pending_for_date(self, guild_id: int, date: str) -> list[str]:
-        doc = await self._get(guild_id)
-        participants = set(doc.get("participants", []))
-        submitted = set(doc.get("submissions", {}).get(date, []))
+        participants = (await self._view(guild_id))["participants"]
+        submitted = await self._day(guild_id, date)
         return sorted(participants - submitted)
 
-# 기존 파일 저장소 → MongoDB로 전환 (MONGODB_URI 없으면 파일 방식 사용)
+    async def get_stats(self, guild_id: int, user_id: int) -> dict:
+        """연속 인증 {streak, best, last, total} 과 월별 {YYYY-MM: {done, missed}} (months)."""
+        uid = str(user_id)
+        s = (await self._get(guild_id, {f"stats.{uid}": 1})).get("stats", {}).get(uid, {})
+        months = {m: {"done": v.get("done", 0), "missed": v.get("missed", 0)} for m, v in s.get("months", {}).items()}
+        return dict(streak_fields(s), months=months)
+
+    async def attendance_trend(self, guild_id: int, limit: int = 3) -> list[tuple[str, int, int]]:
+        """길드 전체의 최근 limit 개월 (월, 인증, 미인증), 최신순."""
+        trend = (await self._get(guild_id, {"trend": 1})).get("trend", {})
+        return [(m, trend[m].get("done", 0), trend[m].get("missed", 0)) for m in sorted(trend, reverse=True)[:limit]]
+
+# SQLite 저장소 (단일 호스트용, 외부 서버 없이 인덱스/내구성 확보)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id     INTEGER PRIMARY KEY,
+    channel_id   INTEGER,
+    schedule     TEXT,
+    last_settled TEXT
+);
+CREATE TABLE IF NOT EXISTS participants (
+    guild_id INTEGER NOT NULL,
+    user_id  INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS submissions (
+    guild_id INTEGER NOT NULL,
+    date     TEXT NOT NULL,
+    user_id  INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, date, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS submissions_archive (
+    guild_id INTEGER NOT NULL,
+    date     TEXT NOT NULL,
+    user_id  INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, date, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS debt (
+    guild_id INTEGER NOT NULL,
+    user_id  INTEGER NOT NULL,
+    amount   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS debt_rank ON debt (guild_id, amount DESC);
+CREATE TABLE IF NOT EXISTS ledger (
+    id       TEXT PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    user_id  INTEGER NOT NULL,
+    amount   INTEGER NOT NULL,
+    kind     TEXT NOT NULL,
+    date     TEXT NOT NULL,
+    ts       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ledger_user ON ledger (guild_id, user_id, date);
+CREATE INDEX IF NOT EXISTS ledger_date ON ledger (guild_id, date);
+CREATE TABLE IF NOT EXISTS job_runs (
+    guild_id INTEGER NOT NULL,
+    job      TEXT NOT NULL,
+    date     TEXT NOT NULL,
+    PRIMARY KEY (guild_id, job)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    key        TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS streaks (
+    guild_id INTEGER NOT NULL,
+    user_id  INTEGER NOT NULL,
+    streak   INTEGER NOT NULL DEFAULT 0,
+    best     INTEGER NOT NULL DEFAULT 0,
+    last     TEXT,
+    total    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS attendance (
+    guild_id INTEGER NOT NULL,
+    user_id  INTEGER NOT NULL,  -- 0: 길드 전체 합계
+    month    TEXT NOT NULL,
+    done     INTEGER NOT NULL DEFAULT 0,
+    missed   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id, month)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class SqliteStore:
+    """정규화된 테이블 + WAL 모드. 모든 쿼리는 전용 스레드 하나에서 실행되어 이벤트 루프를 막지 않음."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: sqlite3.Connection | None = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _tx(self, fn, *args):
+        """fn(conn, *args) 를 쓰기 트랜잭션 하나로 실행 (다른 프로세스와도 직렬화)."""
+        def run():
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return await self._run(run)
+
+    async def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        return await self._run(lambda: self._conn.execute(sql, params).fetchall())
+
+    def _connect(self):
+        # isolation_level=None: 트랜잭션은 _tx 에서 직접 관리
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL 에선 커밋마다 fsync 하지 않아도 DB 는 깨지지 않음
+        conn.executescript(SQLITE_SCHEMA)
+        self._conn = conn
+
+    async def load(self):
+        if self._conn is None:
+            await self._run(self._connect)
+            if not await self._query("SELECT 1 FROM meta WHERE key = 'stats_built'"):
+                # 통계 도입 전 데이터: 인증 기록과 원장으로 한 번 채움
+                await self.rebuild_stats()
+
+    async def save(self):  # 인터페이스 맞춤 (커밋마다 기록됨)
+        return
+
+    async def flush(self):
+        if self._conn is not None:
+            await self._run(lambda: self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)"))
+
+    # ---- 길드 설정 / 참가자 ----
+    async def get_channel(self, guild_id: int) -> int | None:
+        rows = await self._query("SELECT channel_id FROM guilds WHERE guild_id = ?", (guild_id,))
+        return rows[0][0] if rows else None
+
+    async def set_channel(self, guild_id: int, channel_id: int):
+        await self._tx(lambda c: c.execute(
+            "INSERT INTO guilds (guild_id, channel_id) VALUES (?, ?) "
+            "ON CONFLICT (guild_id) DO UPDATE SET channel_id = excluded.channel_id",
+            (guild_id, channel_id)
+        ))
+
+    async def join(self, guild_id: int, user_id: int):
+        def op(c):
+            c.execute("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)", (guild_id,))
+            c.execute("INSERT OR IGNORE INTO participants VALUES (?, ?)", (guild_id, user_id))
+            c.execute("INSERT OR IGNORE INTO debt (guild_id, user_id) VALUES (?, ?)", (guild_id, user_id))
+        await self._tx(op)
+
+    async def leave(self, guild_id: int, user_id: int):
+        await self._tx(lambda c: c.execute(
+            "DELETE FROM participants WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+        ))
+
+    async def join_many(self, guild_id: int, user_ids: list[int]):
+        rows = [(guild_id, u) for u in user_ids]
+        def op(c):
+            c.execute("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)", (guild_id,))
+            c.executemany("INSERT OR IGNORE INTO participants VALUES (?, ?)", rows)
+            c.executemany("INSERT OR IGNORE INTO debt (guild_id, user_id) VALUES (?, ?)", rows)
+        await self._tx(op)
+
+    async def leave_many(self, guild_id: int, user_ids: list[int]):
+        rows = [(guild_id, u) for u in user_ids]
+        await self._tx(lambda c: c.executemany(
+            "DELETE FROM participants WHERE guild_id = ? AND user_id = ?", rows
+        ))
+
+    async def add_penalties_many(self, guild_id: int, user_ids: list[int], amount: int = 1000,
+                                 kind: str = "manual", date: str | None = None) -> list[tuple[str, int]]:
+        """여러 사용자에게 amount 씩 부과하고 (user_id, 현재 벌점) 목록을 반환 (트랜잭션 하나)."""
+        date = date or today_str(DEFAULT_TZ)
+        entries = [(u, ledger_entry(amount, kind, date)) for u in user_ids]
+        def op(c):
+            for u, entry in entries:
+                self._post(c, guild_id, u, entry)
+            return [(str(u), self._balance(c, guild_id, u)) for u, _ in entries]
+        return await self._tx(op)
+
+    async def is_participant(self, guild_id: int, user_id: int) -> bool:
+        return bool(await self._query(
+            "SELECT 1 FROM participants WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+        ))
+
+    async def iter_routes(self):
+        """(guild_id, channel_id, participants, schedule) 를 길드마다 하나씩."""
+        def fetch():
+            members: dict[int, list[str]] = {}
+            for gid, uid in self._conn.execute("SELECT guild_id, user_id FROM participants"):
+                members.setdefault(gid, []).append(str(uid))
+            guilds = self._conn.execute("SELECT guild_id, channel_id, schedule FROM guilds").fetchall()
+            return guilds, members
+        guilds, members = await self._run(fetch)
+        for gid, channel_id, schedule in guilds:
+            yield gid, channel_id, members.get(gid, []), json.loads(schedule) if schedule else None
+
+    async def get_schedule(self, guild_id: int) -> dict:
+        rows = await self._query("SELECT schedule FROM guilds WHERE guild_id = ?", (guild_id,))
+        return normalize_schedule(json.loads(rows[0][0]) if rows and rows[0][0] else None)
+
+    async def set_schedule(self, guild_id: int, schedule: dict):
+        text = json.dumps(normalize_schedule(schedule), ensure_ascii=False)
+        await self._tx(lambda c: c.execute(
+            "INSERT INTO guilds (guild_id, schedule) VALUES (?, ?) "
+            "ON CONFLICT (guild_id) DO UPDATE SET schedule = excluded.schedule",
+            (guild_id, text)
+        ))
+
+    # ---- 예약 작업 ----
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        def op(c):
+            now = time.time()
+            cur = c.execute(
+                "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE "
+                "SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (key, owner, now + ttl, now)
+            )
+            return cur.rowcount > 0
+        return await self._tx(op)
+
+    async def release_lease(self, key: str, owner: str):
+        await self._tx(lambda c: c.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner)))
+
+    async def claim_job(self, guild_id: int, job: str, date: str) -> bool:
+        """(job, date) 를 처음 실행하는 경우에만 True. 같은 날짜의 중복 실행 방지."""
+        def op(c):
+            cur = c.execute(
+                "INSERT INTO job_runs VALUES (?, ?, ?) ON CONFLICT (guild_id, job) DO UPDATE "
+                "SET date = excluded.date WHERE job_runs.date < excluded.date",
+                (guild_id, job, date)
+            )
+            return cur.rowcount > 0
+        return await self._tx(op)
+
+    # ---- 인증 / 벌점 ----
+    async def has_submitted(self, guild_id: int, date: str, user_id: int) -> bool:
+        return bool(await self._query(
+            "SELECT 1 FROM submissions WHERE guild_id = ? AND date = ? AND user_id = ?", (guild_id, date, user_id)
+        ))
+
+    async def mark_submission(self, guild_id: int, date: str, user_id: int) -> bool:
+        """새 인증이면 True. 이미 인증했거나 그 날짜가 이미 정산됐으면 False."""
+        def op(c):
+            # 정산 기준점 확인과 기록이 같은 트랜잭션이라 벌점 정산과 엇갈리지 않음
+            row = c.execute("SELECT last_settled FROM guilds WHERE guild_id = ?", (guild_id,)).fetchone()
+            if row and row[0] and row[0] >= date:
+                return False
+            cur = c.execute("INSERT OR IGNORE INTO submissions VALUES (?, ?, ?)", (guild_id, date, user_id))
+            if not cur.rowcount:
+                return False
+            self._count(c, guild_id, user_id, date, True)
+            return True
+        return await self._tx(op)
+
+    async def pending_for_date(self, guild_id: int, date: str) -> list[str]:
+        rows = await self._query(
+            "SELECT p.user_id FROM participants p WHERE p.guild_id = ? AND NOT EXISTS ("
+            "SELECT 1 FROM submissions s WHERE s.guild_id = p.guild_id AND s.date = ? AND s.user_id = p.user_id)",
+            (guild_id, date)
+        )
+        return sorted(str(uid) for uid, in rows)
+
+    @staticmethod
+    def _post(c: sqlite3.Connection, guild_id: int, user_id: int, entry: dict) -> bool:
+        # 원장 추가와 잔액 갱신을 같은 트랜잭션에서. 이미 있는 기록(같은 id)이면 잔액도 건드리지 않음
+        cur = c.execute(
+            "INSERT OR IGNORE INTO ledger VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (entry["id"], guild_id, user_id, entry["amount"], entry["kind"], entry["date"], entry["ts"])
+        )
+        if cur.rowcount == 0:
+            return False
+        c.execute(
+            "INSERT INTO debt VALUES (?, ?, ?) ON CONFLICT (guild_id, user_id) "
+            "DO UPDATE SET amount = amount + excluded.amount",
+            (guild_id, user_id, entry["amount"])
+        )
+        return True
+
+    @staticmethod
+    def _count(c: sqlite3.Connection, guild_id: int, user_id: int, date: str, done: bool):
+        # 연속/월별 출석 집계를 인증·정산과 같은 트랜잭션에서 증분 갱신
+        row = c.execute(
+            "SELECT streak, best, last, total FROM streaks WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+        ).fetchone()
+        prev = dict(zip(STREAK_FIELDS, row)) if row else None
+        s = advance_streak(prev, date) if done else miss_streak(prev, date)
+        c.execute("INSERT OR REPLACE INTO streaks VALUES (?, ?, ?, ?, ?, ?)",
+                  (guild_id, user_id, s["streak"], s["best"], s["last"], s["total"]))
+        col = "done" if done else "missed"
+        c.executemany(
+            f"INSERT INTO attendance (guild_id, user_id, month, {col}) VALUES (?, ?, ?, 1) "
+            f"ON CONFLICT (guild_id, user_id, month) DO UPDATE SET {col} = {col} + 1",
+            [(guild_id, user_id, date[:7]), (guild_id, 0, date[:7])]
+        )
+
+    def _balance(self, c: sqlite3.Connection, guild_id: int, user_id: int) -> int:
+        row = c.execute("SELECT amount FROM debt WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)).fetchone()
+        return row[0] if row else 0
+
+    async def last_settled(self, guild_id: int) -> str | None:
+        rows = await self._query("SELECT last_settled FROM guilds WHERE guild_id = ?", (guild_id,))
+        return rows[0][0] if rows else None
+
+    async def apply_penalties_for_date(self, guild_id: int, date: str) -> list[tuple[str, int]]:
+        """전날(date)에 인증 안 한 참가자들에게 1000원씩 벌점 부과. 이미 정산된 날짜면 아무것도 하지 않음."""
+        def op(c):
+            # 기준점 확인·갱신과 벌점 증감이 같은 트랜잭션
+            cur = c.execute(
+                "INSERT INTO guilds (guild_id, last_settled) VALUES (?, ?) ON CONFLICT (guild_id) DO UPDATE "
+                "SET last_settled = excluded.last_settled "
+                "WHERE guilds.last_settled IS NULL OR guilds.last_settled < excluded.last_settled",
+                (guild_id, date)
+            )
+            if cur.rowcount == 0:
+                return []
+            missed = [uid for uid, in c.execute(
+                "SELECT p.user_id FROM participants p WHERE p.guild_id = ? AND NOT EXISTS ("
+                "SELECT 1 FROM submissions s WHERE s.guild_id = p.guild_id AND s.date = ? AND s.user_id = p.user_id)",
+                (guild_id, date)
+            )]
+            changed = []
+            for uid in sorted(missed):
+                if self._post(c, guild_id, uid, ledger_entry(1000, "penalty", date, f"penalty:{guild_id}:{date}:{uid}")):
+                    self._count(c, guild_id, uid, date, False)
+                    changed.append((str(uid), self._balance(c, guild_id, uid)))
+            return changed
+        return await self._tx(op)
+
+    async def add_penalty(self, guild_id: int, user_id: int, amount: int = 1000, kind: str = "manual",
+                          date: str | None = None) -> int:
+        """특정 사용자에게 amount만큼 벌점 부과(납부/환급은 음수)하고 현재 총 벌점을 반환.
+
+        date 는 원장 날짜(길드 시간대의 오늘). 없으면 기본 시간대(KST) 기준."""
+        entry = ledger_entry(amount, kind, date or today_str(DEFAULT_TZ))
+        def op(c):
+            self._post(c, guild_id, user_id, entry)
+            return self._balance(c, guild_id, user_id)
+        return await self._tx(op)
+
+    async def get_debt(self, guild_id: int, user_id: int) -> int:
+        rows = await self._query("SELECT amount FROM debt WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        return rows[0][0] if rows else 0
+
+    async def leaderboard(self, guild_id: int, limit: int = 10) -> list[tuple[str, int]]:
+        return (await self.leaderboard_with_total(guild_id, limit))[0]
+
+    async def total_debt(self, guild_id: int) -> int:
+        rows = await self._query("SELECT COALESCE(SUM(amount), 0) FROM debt WHERE guild_id = ?", (guild_id,))
+        return rows[0][0]
+
+    async def leaderboard_with_total(self, guild_id: int, limit: int = 10) -> tuple[list[tuple[str, int]], int]:
+        def fetch():
+            # (guild_id, amount DESC) 인덱스로 상위 limit 개만 읽음
+            top = self._conn.execute(
+                "SELECT user_id, amount FROM debt WHERE guild_id = ? ORDER BY amount DESC LIMIT ?", (guild_id, limit)
+            ).fetchall()
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM debt WHERE guild_id = ?", (guild_id,)
+            ).fetchone()[0]
+            return [(str(uid), amount) for uid, amount in top], total
+        return await self._run(fetch)
+
+    async def ledger_entries(self, guild_id: int, user_id: int | None = None, start: str = "", end: str = "9999",
+                             limit: int = 50) -> list[dict]:
+        """원장 기록을 최신순으로. start <= date < end (YYYY-MM-DD 또는 YYYY-MM)."""
+        sql = "SELECT id, user_id, amount, kind, date, ts FROM ledger WHERE guild_id = ? AND date >= ? AND date < ?"
+        params: tuple = (guild_id, start, end)
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params += (user_id,)
+        rows = await self._query(sql + " ORDER BY date DESC, ts DESC LIMIT ?", params + (limit,))
+        keys = ("id", "user_id", "amount", "kind", "date", "ts")
+        return [dict(zip(keys, (r[0], str(r[1]), *r[2:]))) for r in rows]
+
+    async def ledger_totals(self, guild_id: int, start: str, end: str) -> list[tuple[str, int]]:
+        """기간(start <= date < end) 동안 사용자별 증감 합계 (월별 정산용), 큰 순."""
+        rows = await self._query(
+            "SELECT user_id, SUM(amount) AS s FROM ledger WHERE guild_id = ? AND date >= ? AND date < ? "
+            "GROUP BY user_id HAVING s != 0 ORDER BY s DESC",
+            (guild_id, start, end)
+        )
+        return [(str(uid), s) for uid, s in rows]
+
+    async def get_stats(self, guild_id: int, user_id: int) -> dict:
+        """연속 인증 {streak, best, last, total} 과 월별 {YYYY-MM: {done, missed}} (months)."""
+        def fetch():
+            row = self._conn.execute(
+                "SELECT streak, best, last, total FROM streaks WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+            ).fetchone()
+            months = self._conn.execute(
+                "SELECT month, done, missed FROM attendance WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+            ).fetchall()
+            return row, months
+        row, months = await self._run(fetch)
+        s = streak_fields(dict(zip(STREAK_FIELDS, row)) if row else None)
+        return dict(s, months={m: {"done": d, "missed": x} for m, d, x in months})
+
+    async def attendance_trend(self, guild_id: int, limit: int = 3) -> list[tuple[str, int, int]]:
+        """길드 전체의 최근 limit 개월 (월, 인증, 미인증), 최신순."""
+        return [tuple(r) for r in await self._query(
+            "SELECT month, done, missed FROM attendance WHERE guild_id = ? AND user_id = 0 ORDER BY month DESC LIMIT ?",
+            (guild_id, limit)
+        )]
+
+    async def rebuild_stats(self) -> int:
+        """인증 기록(보관분 포함)과 원장의 미인증 벌점으로 통계를 다시 계산. 계산한 사용자 수를 반환."""
+        def op(c):
+            done: dict[tuple[int, int], list[str]] = {}
+            missed: dict[tuple[int, int], list[str]] = {}
+            for gid, date, uid in c.execute("SELECT guild_id, date, user_id FROM submissions "
+                                            "UNION SELECT guild_id, date, user_id FROM submissions_archive"):
+                done.setdefault((gid, uid), []).append(date)
+            for gid, uid, date in c.execute("SELECT guild_id, user_id, date FROM ledger WHERE kind = 'penalty'"):
+                missed.setdefault((gid, uid), []).append(date)
+            streaks, attendance = [], {}
+            for gid, uid in done.keys() | missed.keys():
+                s, months = replay_stats(done.get((gid, uid), []), missed.get((gid, uid), []))
+                streaks.append((gid, uid, s["streak"], s["best"], s["last"], s["total"]))
+                for month, m in months.items():
+                    attendance[(gid, uid, month)] = [m["done"], m["missed"]]
+                    t = attendance.setdefault((gid, 0, month), [0, 0])
+                    t[0] += m["done"]
+                    t[1] += m["missed"]
+            c.execute("DELETE FROM streaks")
+            c.execute("DELETE FROM attendance")
+            c.executemany("INSERT INTO streaks VALUES (?, ?, ?, ?, ?, ?)", streaks)
+            c.executemany("INSERT INTO attendance VALUES (?, ?, ?, ?, ?)", [(*k, *v) for k, v in attendance.items()])
+            c.execute("INSERT OR REPLACE INTO meta VALUES ('stats_built', ?)", (utc_now_iso(),))
+            return len(streaks)
+        return await self._tx(op)
+
+    async def archive_submissions(self, before: str) -> int:
+        """before(YYYY-MM-DD) 이전 인증 기록을 보관 테이블로 옮김. 아직 정산 안 된 날짜는 남김."""
+        # 길드별 기준일은 archive_cutoff 와 같음 (정산 기록이 없으면 before, 있으면 정산된 날짜까지)
+        where = ("date < ? AND date <= COALESCE("
+                 "(SELECT last_settled FROM guilds g WHERE g.guild_id = submissions.guild_id), ?)")
+        def op(c):
+            moved = c.execute(
+                f"SELECT COUNT(*) FROM (SELECT DISTINCT guild_id, date FROM submissions WHERE {where})", (before, before)
+            ).fetchone()[0]
+            c.execute(f"INSERT OR IGNORE INTO submissions_archive SELECT * FROM submissions WHERE {where}",
+                      (before, before))
+            c.execute(f"DELETE FROM submissions WHERE {where}", (before, before))
+            return moved
+        return await self._tx(op)
+
+# 기존 파일 저장소 → MongoDB로 전환 (MONGODB_URI 없으면 SQLITE_PATH, 둘 다 없으면 파일 방식 사용)
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_DB = os.getenv("MONGODB_DB", "studybot")
 MONGODB_COLL = os.getenv("MONGODB_COLL", "guilds")
+MONGODB_CACHE_TTL = float(os.getenv("MONGODB_CACHE_TTL", "60"))   # 초, 0 이면 캐시 끔
+MONGODB_CACHE_SIZE = int(os.getenv("MONGODB_CACHE_SIZE", "4096"))  # 최대 항목 수
+MONGODB_SUBS_COLL = os.getenv("MONGODB_SUBS_COLL", "submissions")
+# 설정하면 인증/참가/설정 변경을 이 파일에 먼저 기록하고 DB 에는 뒤에서 묶어서 반영 (DB 장애/지연 대비)
+MONGODB_BUFFER_PATH = os.getenv("MONGODB_BUFFER_PATH")
+MONGODB_BUFFER_BATCH = int(os.getenv("MONGODB_BUFFER_BATCH", "500"))
+# 벌점 정산 전에 버퍼가 비기를 기다리는 최대 시간(초). 넘기면 이번 정산은 건너뛰고 다음 정산 때 보충
+BUFFER_DRAIN_TIMEOUT = float(os.getenv("BUFFER_DRAIN_TIMEOUT", "300"))
+# 이 일수보다 오래된 인증 기록은 매일 CHECK_TIME 에 월별 묶음으로 보관 (0 이면 보관 안 함)
+SUBMISSION_ARCHIVE_DAYS = int(os.getenv("SUBMISSION_ARCHIVE_DAYS", "0"))
+# 샤딩: SHARD_COUNT 가 있으면 AutoShardedBot. SHARD_IDS(예: "0,1")로 이 프로세스가 맡을 샤드를 지정해
+# 여러 프로세스가 같은 MongoDB 를 공유하며 나눠 실행할 수 있음
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()] or None
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"  # 작업 점유(lease) 소유자 표시
+PENALTY_LEASE_TTL = float(os.getenv("PENALTY_LEASE_TTL", "600"))  # 초
+# 중단/장애로 밀린 벌점 정산을 시작 시 최대 며칠까지 보충할지
+PENALTY_CATCHUP_DAYS = int(os.getenv("PENALTY_CATCHUP_DAYS", "7"))
+
+def owns_guild(guild_id: int) -> bool:
+    """이 프로세스의 샤드가 맡은 길드인지 (디스코드 샤드 공식: (guild_id >> 22) % shard_count)."""
+    if not SHARD_COUNT or SHARD_IDS is None:
+        return True
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+# 예약 작업(벌점/리마인더)에서 동시에 처리할 최대 길드 수
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "16"))
+# SQLite 저장소 (MONGODB_URI 가 없고 SQLITE_PATH 가 있을 때)
+SQLITE_PATH = os.getenv("SQLITE_PATH")
+# 파일 저장소 저널 모드 (1/true 이면 data.json.log 에 변경분만 추가 기록)
+DATA_JOURNAL = os.getenv("DATA_JOURNAL", "").lower() in ("1", "true", "yes")
+DATA_COMPACT_INTERVAL = float(os.getenv("DATA_COMPACT_INTERVAL", "300"))  # 초
+# 지연 기록: 0 이면 변경마다 즉시 기록, 그 외엔 최대 이 시간(ms)만큼 모아서 한 번에 기록
+DATA_FLUSH_MS = int(os.getenv("DATA_FLUSH_MS", "0"))
 
 if MONGODB_URI:
     mongo_client = AsyncIOMotorClient(MONGODB_URI, uuidRepresentation="standard")
-    store = MongoStore(mongo_client, MONGODB_DB, MONGODB_COLL)
+    store = MongoStore(mongo_client, MONGODB_DB, MONGODB_COLL,
+                       cache_ttl=MONGODB_CACHE_TTL, cache_size=MONGODB_CACHE_SIZE,
+                       subs_coll_name=MONGODB_SUBS_COLL,
+                       buffer_path=MONGODB_BUFFER_PATH, buffer_batch=MONGODB_BUFFER_BATCH)
+elif SQLITE_PATH:
+    store = SqliteStore(SQLITE_PATH)
 else:
-    store = DataStore(DATA_FILE)
+    store = DataStore(DATA_FILE, journal=DATA_JOURNAL, compact_interval=DATA_COMPACT_INTERVAL,
+                      flush_interval=DATA_FLUSH_MS / 1000)
+store = instrument_store(store)
+
+# 지표 HTTP 엔드포인트 (METRICS_PORT 가 있을 때만, 기본은 로컬에서만 접근)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# on_message 빠른 경로용 채널/참가자 색인 (시작 시 저장소에서 채움)
+routes = RoutingIndex()
+
+# 나가는 메시지/반응은 모두 채널별 큐를 거침
+outbox = Outbox(
+    max_retries=int(os.getenv("OUTBOX_MAX_RETRIES", "4")),
+    coalesce_after=int(os.getenv("OUTBOX_COALESCE_AFTER", "3")),
+)
+
+async def submitted_users(guild_id: int, date: str) -> list[int]:
+    """date 에 이미 인증한 참가자 (참가자 - 미인증자)."""
+    pending = set(await store.pending_for_date(guild_id, date))
+    return sorted(int(uid) for uid in routes.participants.get(guild_id, ()) if uid not in pending)
+
+# digest 모드 길드의 인증 현황 메시지 (수정 간격, 초)
+digest = DigestBoard(outbox, interval=float(os.getenv("DIGEST_EDIT_INTERVAL", "10")), seed=submitted_users)
+
+# 벌점/랭킹 표의 사용자 이름 조회 (길드당 최대 한 번의 일괄 요청)
+member_names = MemberNameResolver(ttl=float(os.getenv("MEMBER_NAME_TTL", "600")))
+
+# 재사용 사진 검사 (PHOTO_CHECK=flag|reject, Pillow 가 없으면 꺼짐)
+PHOTO_CHECK = os.getenv("PHOTO_CHECK", "off").lower()
+photos = PhotoVerifier(
+    mode=PHOTO_CHECK,
+    max_distance=int(os.getenv("PHOTO_CHECK_DISTANCE", "6")),
+    keep_days=int(os.getenv("PHOTO_CHECK_DAYS", "30")),
+    fetch_concurrency=int(os.getenv("PHOTO_FETCH_CONCURRENCY", "4")),
+    workers=int(os.getenv("PHOTO_HASH_WORKERS", "2")),
+)
+if PHOTO_CHECK != "off" and not photos.enabled:
+    log.warning("PHOTO_CHECK=%s 이지만 Pillow 가 없어 사진 검사를 끕니다 (pip install Pillow)", PHOTO_CHECK)
+
+def _collect_runtime(m: Metrics):
+    # 내보낼 때마다 큐 깊이/카운터 현재값을 게이지로 복사
+    m.set("outbox_queue_depth", outbox.depth())
+    for result, n in outbox.counters.items():
+        m.set("outbox_messages_total", n, result=result)
+    for result, n in routes.counters.items():
+        m.set("on_message_routed_total", n, result=result)
+    m.set("member_name_api_calls_total", member_names.api_calls)
+    for result, n in photos.counters.items():
+        m.set("photo_checks_total", n, result=result)
+    m.set("photo_index_size", sum(len(ix) for ix in photos.indexes.values()))
+    for date, day in digest.daily.items():
+        m.set("digest_confirmations", day["confirmed"], date=date)
+        m.set("digest_api_calls", day["calls"], date=date)
+        m.set("digest_api_calls_saved", digest.saved(date), date=date)
+    if hasattr(store, "cache_stats"):
+        stats = store.cache_stats()
+        for k in ("hits", "misses", "size"):
+            m.set(f"store_cache_{k}", stats[k])
+    if hasattr(store, "buffer_stats"):
+        stats = store.buffer_stats()
+        m.set("store_buffer_depth", stats["depth"])
+        m.set("store_buffer_lag_seconds", stats["lag_seconds"])
+        for k in ("drained", "errors"):
+            if k in stats:
+                m.set(f"store_buffer_{k}_total", stats[k])
+
+metrics.add_collector(_collect_runtime)
 
 intents = discord.Intents.default()
 intents.message_content = True  # 인증 메시지/첨부 확인
-bot = commands.Bot(command_prefix="!", intents=intents)
+# 역할 단위 명령(!study-join @역할 등)에 역할 멤버 목록이 필요하면 켬 (Developer Portal 에서 Server Members Intent 도 활성화)
+intents.members = os.getenv("DISCORD_MEMBERS_INTENT", "").lower() in ("1", "true", "yes")
+
+class StudyBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def setup_hook(self):
+        # 게이트웨이 연결 전에 한 번만 실행 (on_ready 는 재연결마다 다시 불림)
+        t0 = time.perf_counter()
+        await store.load()
+        await routes.warm(store, owns=owns_guild)
+        log.info("store ready in %.3fs (%s)", time.perf_counter() - t0, type(store).__name__)
+        metrics.start_lag_sampler()
+        if METRICS_PORT:
+            await metrics.serve(METRICS_HOST, METRICS_PORT)
+        if SUBMISSION_ARCHIVE_DAYS > 0:
+            archive_old_submissions.start()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            photos.close()
+            await store.flush()  # 지연 기록 중인 변경을 종료 전에 저장
+
+if SHARD_COUNT:
+    bot = StudyBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = StudyBot(command_prefix="!", intents=intents)
 
 @bot.event
 async def on_ready():
-    await store.load()
-    if not daily_check.is_running():
-        daily_check.start()
-    # 리마인더 3종 시작
-    if not reminder_check_1h.is_running():
-        reminder_check_1h.start()
-    if not reminder_check_30m.is_running():
-        reminder_check_30m.start()
-    if not reminder_check_10m.is_running():
-        reminder_check_10m.start()
+    # 저장소/라우팅은 setup_hook 에서 이미 준비됨. 스케줄러만 길드 목록이 필요해 첫 ready 에서 시작
+    if not scheduler.running:
+        scheduler.start({g.id: routes.schedule(g.id) for g in bot.guilds if owns_guild(g.id)})
     print(f"Logged in as {bot.user} (ID: {bot.user.id})")
 
-@tasks.loop(time=CHECK_TIME)
-async def daily_check():
-    # 전날 인증 누락자 벌점 처리
-    for guild in bot.guilds:
-        ymd = yesterday_str(DEFAULT_TZ)
-        changed = await store.apply_penalties_for_date(guild.id, ymd)
-        if not changed:
-            continue
-        channel_id = await store.get_channel(guild.id)  # BUGFIX: await 추가
-        if channel_id:
-            channel = guild.get_channel(channel_id) or await guild.fetch_channel(channel_id)
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    if owns_guild(guild.id):
+        scheduler.plan_guild(guild.id, routes.schedule(guild.id))
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    scheduler.drop_guild(guild.id)
+
+# 예약 작업 공통: 길드별 작업을 제한된 동시성으로 실행하고 소요 시간을 집계
+last_job_reports: dict[str, dict] = {}
+
+async def fan_out(job: str, guilds, fn, concurrency: int | None = None) -> dict:
+    """guilds 마다 fn(guild)를 최대 concurrency 개씩 동시에 실행. 한 길드의 실패는 다른 길드에 영향 없음."""
+    sem = asyncio.Semaphore(concurrency or FANOUT_CONCURRENCY)
+    durations: list[float] = []
+    errors = 0
+
+    async def run(guild):
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
             try:
-                rows = []
-                mentions = []
-                for uid, debt in changed:
-                    try:
-                        member = guild.get_member(int(uid)) or await guild.fetch_member(int(uid))
-                        name = member.display_name if member else f"User {uid}"
-                    except discord.HTTPException:
-                        member = None
-                        name = f"User {uid}"
-                    rows.append([shorten(name, 20), fmt_won(debt)])
-                    mentions.append(f"<@{uid}>")
-                table = make_table(["사용자", "현재 벌점"], rows, [20, 12])
-                desc = (
-                    f"다음 인원에게 1,000원 벌점이 부과되었습니다. ({ymd})\n"
-                    f"{' '.join(mentions)}\n\n"
-                    f"{table}"
-                )
-                embed = make_embed(
-                    title=f"[{ymd}] 인증 누락 벌점 부과 알림",
-                    description=desc,
-                    color=COLOR_DANGER
-                )
-                await channel.send(embed=embed)
-            except discord.HTTPException:
-                pass
-
-# 공통 리마인더 발송 함수
-async def _send_pending_reminder(label: str):
-    # 05:00 이전엔 전날 미인증자 기준으로 안내
-    now = datetime.datetime.now(DEFAULT_TZ)
-    now_minutes = now.hour * 60 + now.minute
-    cutoff_minutes = CHECK_TIME.hour * 60 + CHECK_TIME.minute
-    target_date = yesterday_str(DEFAULT_TZ) if now_minutes < cutoff_minutes else today_str(DEFAULT_TZ)
-
-    for guild in bot.guilds:
-        channel_id = await store.get_channel(guild.id)
-        if not channel_id:
-            continue
-        pending = await store.pending_for_date(guild.id, target_date)
-        if not pending:
-            continue
-        channel = guild.get_channel(channel_id) or await guild.fetch_channel(channel_id)
-        mentions = "\n".join(f"- <@{uid}>" for uid in pending)
+                await fn(guild)
+            except Exception:
+                errors += 1
+                log.exception("%s: guild %s 처리 실패", job, guild.id)
+            finally:
+                durations.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(run(g) for g in guilds))
+    report = {
+        "job": job,
+        "guilds": len(durations),
+        "errors": errors,
+        "p50": percentile(durations, 50),
+        "p99": percentile(durations, 99),
+        "total": time.perf_counter() - t0,
+    }
+    last_job_reports[job] = report
+    kind = job.split()[0]  # "penalty 2025-01-01" -> "penalty"
+    metrics.observe("job_run_seconds", report["total"], job=kind)
+    metrics.inc("job_guild_errors_total", errors, job=kind)
+    for d in durations:
+        metrics.observe("job_guild_seconds", d, job=kind)
+    log.info(
+        "%s: guilds=%d errors=%d p50=%.3fs p99=%.3fs total=%.3fs",
+        job, report["guilds"], errors, report["p50"], report["p99"], report["total"]
+    )
+    return report
+
+async def get_text_channel(guild: discord.Guild, channel_id: int):
+    channel = guild.get_channel(channel_id)
+    if channel is None:
+        async with metrics.timed("discord_call_seconds", call="fetch_channel"):
+            channel = await guild.fetch_channel(channel_id)
+    return channel
+
+async def _penalize_guild(guild: discord.Guild, ymd: str):
+    changed = await store.apply_penalties_for_date(guild.id, ymd)
+    if not changed:
+        return
+    channel_id = await store.get_channel(guild.id)  # BUGFIX: await 추가
+    if channel_id:
+        channel = await get_text_channel(guild, channel_id)
+        rows = []
+        mentions = []
+        names = await member_names.resolve_many(guild, [uid for uid, _ in changed])
+        for uid, debt in changed:
+            rows.append([shorten(names[uid], 20), fmt_won(debt)])
+            mentions.append(f"<@{uid}>")
+        table = make_table(["사용자", "현재 벌점"], rows, [20, 12])
         desc = (
-            f"미인증 인원: {len(pending)}명\n"
-            f"마감 안내: 새벽 5시(05:00) 마감, 05:00에 벌점 부과\n\n"
-            f"{mentions}"
+            f"다음 인원에게 1,000원 벌점이 부과되었습니다. ({ymd})\n"
+            f"{' '.join(mentions)}\n\n"
+            f"{table}"
         )
         embed = make_embed(
-            title=f"벌점 부과 {label} 알림 ({target_date})",
+            title=f"[{ymd}] 인증 누락 벌점 부과 알림",
             description=desc,
-            color=COLOR_WARN
+            color=COLOR_DANGER
         )
-        try:
-            await channel.send(embed=embed)
-        except discord.HTTPException:
-            pass
+        outbox.send(channel, embed)
 
-# 1시간 전(23:05)
-@tasks.loop(time=REMINDER_TIME_1H)
-async def reminder_check_1h():
-    await _send_pending_reminder("1시간 전")
+async def _remind_guild(guild: discord.Guild, minutes: int, target_date: str):
+    channel_id = await store.get_channel(guild.id)
+    if not channel_id:
+        return
+    pending = await store.pending_for_date(guild.id, target_date)
+    if not pending:
+        return
+    schedule = routes.schedule(guild.id)
+    channel = await get_text_channel(guild, channel_id)
+    mentions = "\n".join(f"- <@{uid}>" for uid in pending)
+    desc = (
+        f"미인증 인원: {len(pending)}명\n"
+        f"마감 안내: {schedule['cutoff']}({schedule['tz']}) 마감, {schedule['cutoff']}에 벌점 부과\n\n"
+        f"{mentions}"
+    )
+    embed = make_embed(
+        title=f"벌점 부과 {reminder_label(minutes)} 알림 ({target_date})",
+        description=desc,
+        color=COLOR_WARN
+    )
+    outbox.send(channel, embed)
 
-# 30분 전(23:35)
-@tasks.loop(time=REMINDER_TIME_30M)
-async def reminder_check_30m():
-    await _send_pending_reminder("30분 전")
+async def _run_guild_job(guild: discord.Guild, job: str, date: str):
+    if job != "penalty":
+        # 같은 (길드, 작업, 날짜)는 재시작/재계획 후에도 한 번만 실행
+        if await store.claim_job(guild.id, job, date):
+            await _remind_guild(guild, job_offset(job), date)
+        return
+    # 벌점은 점유(lease)를 잡은 프로세스 하나만 실행. 샤드 재배치 중 두 프로세스가 같은 길드를 봐도 안전
+    lease = f"penalty:{guild.id}"
+    if not await store.acquire_lease(lease, INSTANCE_ID, PENALTY_LEASE_TTL):
+        return
+    try:
+        # 마지막 정산 다음 날부터 밀린 날짜를 순서대로. 날짜마다 정산 기준점이 벌점과 함께 기록되므로
+        # 중간에 죽어도 다음 실행이 남은 날짜부터 이어서 처리하고, 이미 정산된 날짜는 건너뜀
+        for day in unsettled_dates(await store.last_settled(guild.id), date, PENALTY_CATCHUP_DAYS):
+            await _penalize_guild(guild, day)
+    finally:
+        await store.release_lease(lease, INSTANCE_ID)
+
+async def run_scheduled(job: str, date: str, guild_ids: list[int]):
+    if job == "penalty" and hasattr(store, "wait_drained"):
+        # 마감 전에 버퍼로 받아 둔 인증이 DB 에 반영된 뒤에 정산 (안 그러면 인증한 사람도 벌점)
+        if not await store.wait_drained(BUFFER_DRAIN_TIMEOUT):
+            log.warning("penalty %s: 쓰기 버퍼가 %.0fs 안에 비지 않아 정산을 미룸 (다음 정산 때 보충)",
+                        date, BUFFER_DRAIN_TIMEOUT)
+            return
+    guilds = [g for g in map(bot.get_guild, guild_ids) if g is not None and owns_guild(g.id)]
+    await fan_out(f"{job} {date}", guilds, lambda guild: _run_guild_job(guild, job, date))
+
+class DeadlineScheduler:
+    """모든 길드의 마감/리마인더를 (발화 시각, 길드, 작업) 우선순위 큐 하나로 처리."""
+
+    def __init__(self, handler):
+        self.handler = handler  # async handler(job, date, guild_ids)
+        # (발화 시각, 순번, guild_id, 작업, 날짜, 세대, 다음 회차 예약 여부)
+        self._heap: list[tuple[float, int, int, str, str, int, bool]] = []
+        self._gen: dict[int, int] = {}  # guild_id -> 계획 세대 (재계획 시 이전 항목 무효화)
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._schedules: dict[int, dict] = {}
+        self._running: set[asyncio.Task] = set()  # 실행 중인 핸들러 (참조를 잡아 둬야 GC 되지 않음)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, schedules: dict[int, dict]):
+        for guild_id, schedule in schedules.items():
+            self.plan_guild(guild_id, schedule)
+        self._task = asyncio.create_task(self._loop())
+
+    def plan_guild(self, guild_id: int, schedule: dict, now: datetime.datetime | None = None):
+        """길드의 다음 작업들을 큐에 넣음. 재시작 직후엔 마감 전인 지난 회차도 즉시 실행 대상으로."""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        gen = self._gen[guild_id] = self._gen.get(guild_id, 0) + 1
+        self._schedules[guild_id] = schedule
+        current = submission_date(schedule, now)
+        previous = (datetime.date.fromisoformat(current) - datetime.timedelta(days=1)).isoformat()
+        late_reminder = None
+        for job in schedule_jobs(schedule):
+            # 지나간 직전 회차: 벌점은 항상 보충(그 이전 밀린 날짜는 핸들러가 정산 기준점부터 이어서 처리),
+            # 리마인더는 아직 마감 전인 가장 최근 것 하나만. 중복은 claim_job / 정산 기준점이 막음
+            missed = [d for d in (previous, current) if job_fire_time(schedule, job, d) <= now]
+            if missed and job == "penalty":
+                self._push(now.timestamp(), guild_id, job, missed[-1], gen, repeat=False)
+            elif missed and job_fire_time(schedule, "penalty", missed[-1]) > now:
+                fired = job_fire_time(schedule, job, missed[-1])
+                if late_reminder is None or fired > late_reminder[0]:
+                    late_reminder = (fired, job, missed[-1])
+            date = current
+            while job_fire_time(schedule, job, date) <= now:
+                date = (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
+            self._push(job_fire_time(schedule, job, date).timestamp(), guild_id, job, date, gen)
+        if late_reminder:
+            self._push(now.timestamp(), guild_id, late_reminder[1], late_reminder[2], gen, repeat=False)
+        self._wake.set()
+
+    def drop_guild(self, guild_id: int):
+        self._gen[guild_id] = self._gen.get(guild_id, 0) + 1
+        self._schedules.pop(guild_id, None)
+
+    def _push(self, fire_at: float, guild_id: int, job: str, date: str, gen: int, repeat: bool = True):
+        heapq.heappush(self._heap, (fire_at, next(self._seq), guild_id, job, date, gen, repeat))
+
+    async def _loop(self):
+        while True:
+            self._wake.clear()
+            if not self._heap:
+                await self._wake.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                # 더 이른 작업이 새로 들어오면 깨어나서 다시 계산
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due: dict[tuple[str, str], list[int]] = {}
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, guild_id, job, date, gen, repeat = heapq.heappop(self._heap)
+                if gen != self._gen.get(guild_id):
+                    continue  # 재계획/탈퇴로 무효가 된 항목
+                due.setdefault((job, date), []).append(guild_id)
+                if repeat:  # 같은 작업의 다음 회차 예약 (밀린 회차 보충 항목은 제외)
+                    nxt = (datetime.date.fromisoformat(date) + datetime.timedelta(days=1)).isoformat()
+                    fire = job_fire_time(self._schedules[guild_id], job, nxt).timestamp()
+                    self._push(fire, guild_id, job, nxt, gen)
+            for (job, date), guild_ids in due.items():
+                task = asyncio.create_task(self.handler(job, date, guild_ids), name=f"scheduled {job} {date}")
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+                task.add_done_callback(log_task_failure)
+
+scheduler = DeadlineScheduler(run_scheduled)
 
-# 10분 전(23:55)
-@tasks.loop(time=REMINDER_TIME_10M)
-async def reminder_check_10m():
-    await _send_pending_reminder("10분 전")
+@tasks.loop(time=CHECK_TIME)
+async def archive_old_submissions():
+    before = (datetime.datetime.now(DEFAULT_TZ).date() - datetime.timedelta(days=SUBMISSION_ARCHIVE_DAYS)).isoformat()
+    await store.archive_submissions(before)
 
 @bot.event
 async def on_message(message: discord.Message):
@@ -405,48 +3116,78 @@ async def on_message(message: discord.Message):
 
     # 명령어 처리 먼저
     await bot.process_commands(message)
-    channel_id = await store.get_channel(message.guild.id)
-    if not channel_id or message.channel.id != channel_id:
-        return
-    if not await store.is_participant(message.guild.id, message.author.id):
+    # 인증 채널/이미지/참가자 여부는 메모리 색인으로 판단 (저장소 조회 없음)
+    if not routes.accepts(message):
         return
 
-    has_image = any(is_image_attachment(att) for att in message.attachments)
-    if not has_image:
-        return
-
-    # 새벽(05:00 이전) 인증은 전날로 집계
-    now = datetime.datetime.now(DEFAULT_TZ)
-    now_minutes = now.hour * 60 + now.minute
-    cutoff_minutes = CHECK_TIME.hour * 60 + CHECK_TIME.minute
-    date = yesterday_str(DEFAULT_TZ) if now_minutes < cutoff_minutes else today_str(DEFAULT_TZ)
+    # 마감 시각(기본 05:00) 이전 인증은 전날로 집계
+    date = submission_date(routes.schedule(message.guild.id))
 
     if await store.has_submitted(message.guild.id, date, message.author.id):
         return
 
-    await store.mark_submission(message.guild.id, date, message.author.id)
-    try:
-        await message.add_reaction("✅")
-        embed = make_embed(
-            title="오늘 인증 완료",
-            description=f"{message.author.mention}의 {date} 인증이 기록되었습니다.",
-            color=COLOR_OK
-        )
-        embed.set_author(name=message.author.display_name, icon_url=message.author.display_avatar.url)
-        await message.reply(embed=embed, mention_author=False)
-    except discord.HTTPException:
-        pass
+    if photos.mode == "reject":
+        # 이 메시지의 확인만 검사를 기다림 (다운로드/해시는 루프 밖이라 다른 메시지 처리는 막지 않음)
+        matches = await photos.check(message, date)
+        if matches:
+            outbox.react(message, "🚫")
+            outbox.reply(message, reused_photo_embed(message, matches, rejected=True))
+            return
+    if not await store.mark_submission(message.guild.id, date, message.author.id):
+        # 같은 사람의 사진이 동시에 들어왔거나 그 날짜가 이미 정산됨 (검사하는 사이 마감이 지났거나,
+        # 정산이 끝난 날 마감 시각을 늦춘 경우) → 정산 안 된 첫 날짜의 인증으로
+        settled = await store.last_settled(message.guild.id)
+        if not settled or settled < date:
+            return
+        date = (datetime.date.fromisoformat(settled) + datetime.timedelta(days=1)).isoformat()
+        if not await store.mark_submission(message.guild.id, date, message.author.id):
+            return  # 그날은 이미 인증함
+    outbox.react(message, "✅")
+    if photos.mode == "flag":
+        photos.spawn(_flag_reused_photo(message, date))
+    if routes.schedule(message.guild.id)["confirm"] == "digest":
+        # 반응은 그대로 두고 답장 대신 현황 메시지에 모아서 반영
+        digest.add(message, date, len(routes.participants.get(message.guild.id, ())))
+        return
+    embed = make_embed(
+        title="오늘 인증 완료",
+        description=f"{message.author.mention}의 {date} 인증이 기록되었습니다.",
+        color=COLOR_OK
+    )
+    embed.set_author(name=message.author.display_name, icon_url=message.author.display_avatar.url)
+    outbox.reply(message, embed, coalesce=True)  # 몰릴 땐 여러 명의 확인을 한 메시지로
+
+def reused_photo_embed(message: discord.Message, matches: list[dict], rejected: bool) -> discord.Embed:
+    prev = matches[0]
+    desc = (
+        f"{message.author.mention}의 사진이 {prev['date']}에 <@{prev['user_id']}> 님이 올린 "
+        f"[사진]({prev['url']})과 거의 같습니다."
+    )
+    if rejected:
+        desc += "\n새로 찍은 사진으로 다시 인증해 주세요."
+    return make_embed(
+        title="🚫 인증 거부: 재사용 사진" if rejected else "⚠️ 재사용 사진 의심",
+        description=desc,
+        color=COLOR_DANGER if rejected else COLOR_WARN
+    )
+
+async def _flag_reused_photo(message: discord.Message, date: str):
+    matches = await photos.check(message, date)
+    if matches:
+        outbox.react(message, "⚠️")
+        outbox.reply(message, reused_photo_embed(message, matches, rejected=False))
 
 @bot.command(name="study-channel")
 @commands.has_permissions(manage_guild=True)
 async def study_channel(ctx: commands.Context, channel: discord.TextChannel):
     await store.set_channel(ctx.guild.id, channel.id)
+    routes.set_channel(ctx.guild.id, channel.id)
     embed = make_embed(
         title="🔧 인증 채널 설정 완료",
         description=f"이제부터 {channel.mention} 에서 인증을 받습니다.",
         color=COLOR_INFO
     )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
 
 @study_channel.error
 async def study_channel_error(ctx: commands.Context, error):
@@ -462,55 +3203,192 @@ async def study_channel_error(ctx: commands.Context, error):
             description="`!study-channel #인증채널`",
             color=COLOR_MUTED
         )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
+
+@bot.command(name="study-schedule")
+@commands.has_permissions(manage_guild=True)
+async def study_schedule(ctx: commands.Context, cutoff: str | None = None, tz: str | None = None, *reminders: int):
+    current = routes.schedule(ctx.guild.id)
+    if tz is not None and tz.isdigit():
+        # 타임존 없이 분만 준 경우 (!study-schedule 05:00 60 30) → 첫 숫자도 리마인더
+        tz, reminders = None, (int(tz), *reminders)
+    if cutoff is not None:
+        try:
+            t = parse_hhmm(cutoff)
+            ZoneInfo(tz or current["tz"])
+        except (ValueError, ZoneInfoNotFoundError):
+            raise commands.BadArgument(cutoff)
+        if any(not 0 < m < 24 * 60 for m in reminders):
+            raise commands.BadArgument("reminders")
+        current = normalize_schedule({
+            **current,
+            "cutoff": f"{t.hour:02d}:{t.minute:02d}",
+            "tz": tz or current["tz"],
+            "reminders": list(reminders) or current["reminders"],
+        })
+        await store.set_schedule(ctx.guild.id, current)
+        routes.set_schedule(ctx.guild.id, current)
+        scheduler.plan_guild(ctx.guild.id, current)
+    reminders_text = ", ".join(reminder_label(m) for m in current["reminders"]) or "없음"
+    embed = make_embed(
+        title="⏰ 마감 설정" + (" 변경 완료" if cutoff is not None else ""),
+        description=(
+            f"마감: 매일 {current['cutoff']} ({current['tz']})\n"
+            f"리마인더: {reminders_text}\n"
+            f"마감 이전 인증은 전날로 집계되고, 마감 시각에 전날 미인증자에게 벌점이 부과됩니다."
+        ),
+        color=COLOR_INFO
+    )
+    outbox.reply(ctx.message, embed)
+
+@study_schedule.error
+async def study_schedule_error(ctx: commands.Context, error):
+    if isinstance(error, commands.MissingPermissions):
+        embed = make_embed(
+            title="⛔ 권한 부족",
+            description="이 명령은 서버 관리 권한이 필요합니다.",
+            color=COLOR_DANGER
+        )
+    else:
+        embed = make_embed(
+            title="ℹ️ 사용법",
+            description="`!study-schedule [HH:MM] [타임존] [리마인더(분) ...]`\n"
+                        "예: `!study-schedule 05:00 Asia/Seoul 60 30 10`, `!study-schedule 05:00 60 30` (타임존 유지)",
+            color=COLOR_MUTED
+        )
+    outbox.reply(ctx.message, embed)
+
+@bot.command(name="study-confirm")
+@commands.has_permissions(manage_guild=True)
+async def study_confirm(ctx: commands.Context, mode: str | None = None):
+    """인증 확인 방식: reply(인증마다 답장) / digest(현황 메시지 하나를 주기적으로 수정)"""
+    current = routes.schedule(ctx.guild.id)
+    if mode is not None:
+        if mode.lower() not in CONFIRM_MODES:
+            raise commands.BadArgument(mode)
+        current = normalize_schedule({**current, "confirm": mode.lower()})
+        await store.set_schedule(ctx.guild.id, current)
+        routes.set_schedule(ctx.guild.id, current)
+    if current["confirm"] == "digest":
+        desc = f"인증마다 ✅ 반응만 달고, 오늘 인증 현황 메시지 하나를 최대 {digest.interval:g}초마다 수정합니다."
+    else:
+        desc = "인증마다 ✅ 반응과 확인 답장을 보냅니다."
+    embed = make_embed(
+        title="📨 인증 확인 방식" + (" 변경 완료" if mode is not None else "") + f": {current['confirm']}",
+        description=desc,
+        color=COLOR_INFO
+    )
+    outbox.reply(ctx.message, embed)
+
+@study_confirm.error
+async def study_confirm_error(ctx: commands.Context, error):
+    if isinstance(error, commands.MissingPermissions):
+        embed = make_embed(
+            title="⛔ 권한 부족",
+            description="이 명령은 서버 관리 권한이 필요합니다.",
+            color=COLOR_DANGER
+        )
+    else:
+        embed = make_embed(
+            title="ℹ️ 사용법",
+            description="`!study-confirm [reply|digest]`",
+            color=COLOR_MUTED
+        )
+    outbox.reply(ctx.message, embed)
+
+def expand_targets(targets) -> tuple[list[discord.Member], int]:
+    """멘션/역할을 중복 없는 멤버 목록으로 펼침. 봇 계정은 빼고 그 수를 함께 반환."""
+    members: dict[int, discord.Member] = {}
+    for t in targets:
+        for m in (t.members if isinstance(t, discord.Role) else [t]):
+            members.setdefault(m.id, m)
+    humans = [m for m in members.values() if not m.bot]
+    return humans, len(members) - len(humans)
+
+def mention_list(members: list[discord.Member], limit: int = 30) -> str:
+    text = " ".join(m.mention for m in members[:limit])
+    return text + (f" 외 {len(members) - limit}명" if len(members) > limit else "")
+
+def needs_manage_guild(ctx: commands.Context, targets) -> bool:
+    # 본인 외의 사용자나 역할을 대상으로 하면 관리자 권한 필요
+    return any(isinstance(t, discord.Role) or t.id != ctx.author.id for t in targets) \
+        and not ctx.author.guild_permissions.manage_guild
 
 @bot.command(name="study-join")
-async def study_join(ctx: commands.Context, member: discord.Member | None = None):
-    target = member or ctx.author
-
-    # 다른 사람을 추가하려면 관리자 권한 필요
-    if member and member.id != ctx.author.id:
-        if not ctx.author.guild_permissions.manage_guild:
-            embed = make_embed(
-                title="⛔ 권한 부족",
-                description="다른 사용자를 참가시키려면 서버 관리 권한이 필요합니다.",
-                color=COLOR_DANGER
-            )
-            await ctx.reply(embed=embed, mention_author=False)
-            return
+async def study_join(ctx: commands.Context, *targets: discord.Member | discord.Role):
+    if needs_manage_guild(ctx, targets):
+        embed = make_embed(
+            title="⛔ 권한 부족",
+            description="다른 사용자를 참가시키려면 서버 관리 권한이 필요합니다.",
+            color=COLOR_DANGER
+        )
+        outbox.reply(ctx.message, embed)
+        return
 
+    members, bots = expand_targets(targets or [ctx.author])
     # 봇 계정 방지
-    if target.bot:
+    if not members:
         embed = make_embed(
             title="⚠️ 참가 불가",
-            description="봇 계정은 참가시킬 수 없습니다.",
+            description="봇 계정은 참가시킬 수 없습니다." if bots else "참가시킬 사용자가 없습니다.",
             color=COLOR_WARN
         )
-        await ctx.reply(embed=embed, mention_author=False)
+        outbox.reply(ctx.message, embed)
         return
 
-    await store.join(ctx.guild.id, target.id)
-    if target.id == ctx.author.id:
+    await store.join_many(ctx.guild.id, [m.id for m in members])
+    for m in members:
+        routes.join(ctx.guild.id, m.id)
+    if len(members) == 1 and members[0].id == ctx.author.id:
         desc = f"{ctx.author.mention} 스터디에 참가되었습니다.\n매일 인증 채널에 사진을 올려 인증해 주세요!"
+    elif len(members) == 1:
+        desc = f"{members[0].mention} 이(가) 스터디에 참가되었습니다. (추가: {ctx.author.mention})"
     else:
-        desc = f"{target.mention} 이(가) 스터디에 참가되었습니다. (추가: {ctx.author.mention})"
+        desc = f"{len(members)}명이 스터디에 참가되었습니다. (추가: {ctx.author.mention})\n{mention_list(members)}"
+    if bots:
+        desc += f"\n봇 계정 {bots}개는 제외했습니다."
 
     embed = make_embed(
         title="참가 처리 완료",
         description=desc,
         color=COLOR_OK
     )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
 
 @bot.command(name="study-leave")
-async def study_leave(ctx: commands.Context):
-    await store.leave(ctx.guild.id, ctx.author.id)
+async def study_leave(ctx: commands.Context, *targets: discord.Member | discord.Role):
+    if needs_manage_guild(ctx, targets):
+        embed = make_embed(
+            title="⛔ 권한 부족",
+            description="다른 사용자를 제외하려면 서버 관리 권한이 필요합니다.",
+            color=COLOR_DANGER
+        )
+        outbox.reply(ctx.message, embed)
+        return
+    members, _ = expand_targets(targets or [ctx.author])
+    await store.leave_many(ctx.guild.id, [m.id for m in members])
+    for m in members:
+        routes.leave(ctx.guild.id, m.id)
+    if len(members) == 1 and members[0].id == ctx.author.id:
+        desc = f"{ctx.author.mention} 스터디에서 제외되었습니다."
+    else:
+        desc = f"{len(members)}명이 스터디에서 제외되었습니다.\n{mention_list(members)}"
     embed = make_embed(
         title="👋 탈퇴 완료",
-        description=f"{ctx.author.mention} 스터디에서 제외되었습니다.",
+        description=desc,
+        color=COLOR_MUTED
+    )
+    outbox.reply(ctx.message, embed)
+
+@study_join.error
+@study_leave.error
+async def study_membership_error(ctx: commands.Context, error):
+    embed = make_embed(
+        title="ℹ️ 사용법",
+        description="`!study-join [@사용자 ...|@역할]`, `!study-leave [@사용자 ...|@역할]`",
         color=COLOR_MUTED
     )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
 
 @bot.command(name="study-status")
 async def study_status(ctx: commands.Context, member: discord.Member | None = None):
@@ -522,12 +3400,12 @@ async def study_status(ctx: commands.Context, member: discord.Member | None = No
         description=f"{member.mention} — {fmt_won(debt)}",
         color=color
     )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
 
 @bot.command(name="study-check")
 async def study_check(ctx: commands.Context, member: discord.Member | None = None):
     member = member or ctx.author
-    date = today_str(DEFAULT_TZ)
+    date = submission_date(routes.schedule(ctx.guild.id))  # 길드의 시간대/마감 기준 (on_message 와 같은 날짜)
     done = await store.has_submitted(ctx.guild.id, date, member.id)
     if done:
         embed = make_embed(
@@ -541,58 +3419,98 @@ async def study_check(ctx: commands.Context, member: discord.Member | None = Non
             description=f"{member.mention}은(는) 오늘({date}) 아직 인증하지 않았습니다.",
             color=COLOR_WARN
         )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
+
+def attendance_rate(done: int, missed: int) -> str:
+    return f"{done / (done + missed):.0%}" if done + missed else "-"
+
+@bot.command(name="study-stats")
+async def study_stats(ctx: commands.Context, member: discord.Member | None = None):
+    """연속 인증/출석 통계 (인증·정산 때 갱신해 둔 집계만 읽음)"""
+    member = member or ctx.author
+    stats = await store.get_stats(ctx.guild.id, member.id)
+    trend = await store.attendance_trend(ctx.guild.id, limit=3)
+    month = submission_date(routes.schedule(ctx.guild.id))[:7]  # 통계는 인증 날짜 기준으로 집계됨
+    m = stats["months"].get(month, {"done": 0, "missed": 0})
+    embed = make_embed(
+        title="인증 통계",
+        description=f"{member.mention} — 마지막 인증 {stats['last'] or '없음'}",
+        color=COLOR_OK if stats["streak"] else COLOR_INFO
+    )
+    embed.add_field(name="연속 인증", value=f"{stats['streak']}일 (최장 {stats['best']}일)", inline=True)
+    embed.add_field(name="누적 인증", value=f"{stats['total']}일", inline=True)
+    embed.add_field(
+        name=f"이번 달 ({month})",
+        value=f"인증 {m['done']} · 미인증 {m['missed']} · 출석률 {attendance_rate(m['done'], m['missed'])}",
+        inline=False
+    )
+    if trend:
+        embed.add_field(
+            name="서버 출석률",
+            value=" · ".join(f"{mon} {attendance_rate(d, x)}" for mon, d, x in trend),
+            inline=False
+        )
+    outbox.reply(ctx.message, embed)
 
 @bot.command(name="study-leaderboard")
 async def study_leaderboard(ctx: commands.Context):
-    top = await store.leaderboard(ctx.guild.id, limit=10)
+    top, total = await store.leaderboard_with_total(ctx.guild.id, limit=10)
     if not top:
         embed = make_embed(
             title="벌점 랭킹",
             description="아직 집계된 기록이 없습니다.",
             color=COLOR_MUTED
         )
-        await ctx.reply(embed=embed, mention_author=False)
+        outbox.reply(ctx.message, embed)
         return
 
     rows = []
+    names = await member_names.resolve_many(ctx.guild, [uid for uid, _ in top])
     for i, (uid, debt) in enumerate(top, start=1):
-        try:
-            member = ctx.guild.get_member(int(uid)) or await ctx.guild.fetch_member(int(uid))
-            name = member.display_name if member else f"User {uid}"
-        except discord.HTTPException:
-            name = f"User {uid}"
-        rows.append([str(i), shorten(name, 20), fmt_won(debt)])
+        rows.append([str(i), shorten(names[uid], 20), fmt_won(debt)])
 
     table = make_table(headers=["순위", "사용자", "벌점"], rows=rows, widths=[4, 20, 12])
-    total = await store.total_debt(ctx.guild.id)
     embed = make_embed(
         title="벌점 랭킹 Top 10",
         description=table,
         color=COLOR_INFO
     )
     embed.add_field(name="총 벌점", value=fmt_won(total), inline=False)
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
 
 @bot.command(name="minus")
 @commands.has_permissions(manage_guild=True)
-async def minus(ctx: commands.Context, member: discord.Member):
-    """지정 사용자에게 즉시 1,000원 벌점 부과"""
-    if member.bot:
+async def minus(ctx: commands.Context, *targets: discord.Member | discord.Role):
+    """지정 사용자(여러 명/역할 가능)에게 즉시 1,000원씩 벌점 부과"""
+    if not targets:
+        raise commands.MissingRequiredArgument(ctx.command.clean_params["targets"])
+    members, bots = expand_targets(targets)
+    if not members:
         embed = make_embed(
             title="⚠️ 대상 불가",
-            description="봇 계정에는 벌점을 부과할 수 없습니다.",
+            description="봇 계정에는 벌점을 부과할 수 없습니다." if bots else "벌점을 부과할 사용자가 없습니다.",
             color=COLOR_WARN
         )
-        await ctx.reply(embed=embed, mention_author=False)
+        outbox.reply(ctx.message, embed)
         return
-    new_debt = await store.add_penalty(ctx.guild.id, member.id, 1000)
+    changed = await store.add_penalties_many(ctx.guild.id, [m.id for m in members], 1000, date=guild_today(ctx.guild.id))
+    if len(members) == 1:
+        desc = f"{members[0].mention} 1,000원 벌점이 부과되었습니다.\n현재 벌점: {fmt_won(changed[0][1])}"
+    else:
+        rows = [[shorten(m.display_name, 20), fmt_won(debt)] for m, (_, debt) in zip(members, changed)]
+        desc = (
+            f"{len(members)}명에게 1,000원씩 벌점이 부과되었습니다.\n"
+            f"{mention_list(members)}\n\n"
+            f"{make_table(['사용자', '현재 벌점'], rows[:25], [20, 12])}"
+        )
+    if bots:
+        desc += f"\n봇 계정 {bots}개는 제외했습니다."
     embed = make_embed(
         title="벌점 부과",
-        description=f"{member.mention} 1,000원 벌점이 부과되었습니다.\n현재 벌점: {fmt_won(new_debt)}",
+        description=desc,
         color=COLOR_DANGER
     )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
 
 @minus.error
 async def minus_error(ctx: commands.Context, error):
@@ -605,10 +3523,114 @@ async def minus_error(ctx: commands.Context, error):
     else:
         embed = make_embed(
             title="ℹ️ 사용법",
-            description="`!minus @사용자`",
+            description="`!minus @사용자 [@사용자 ...]` 또는 `!minus @역할`",
+            color=COLOR_MUTED
+        )
+    outbox.reply(ctx.message, embed)
+
+LEDGER_KINDS = {"penalty": "미인증", "manual": "수동 부과", "payment": "납부", "refund": "환급", "opening": "기초 잔액"}
+
+def guild_today(guild_id: int) -> str:
+    """길드 시간대 기준 오늘 (원장 날짜, '이번 달' 기준)."""
+    return today_str(ZoneInfo(routes.schedule(guild_id)["tz"]))
+
+def month_range(month: str | None, today: str | None = None) -> tuple[str, str]:
+    """'YYYY-MM' → (월 첫날, 다음 달 첫날). 없으면 이번 달 (today 기준, 기본 KST)."""
+    month = month or (today or today_str(DEFAULT_TZ))[:7]
+    first = datetime.date.fromisoformat(month + "-01")  # 형식이 틀리면 ValueError
+    nxt = (first.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return first.isoformat(), nxt.isoformat()
+
+@bot.command(name="study-history")
+async def study_history(ctx: commands.Context, member: discord.Member | None = None, month: str | None = None):
+    member = member or ctx.author
+    start, end = month_range(month, guild_today(ctx.guild.id))
+    entries = await store.ledger_entries(ctx.guild.id, member.id, start, end, limit=200)
+    debt = await store.get_debt(ctx.guild.id, member.id)
+    rows = [[e["date"][5:], LEDGER_KINDS.get(e["kind"], e["kind"]), fmt_won(e["amount"])] for e in entries[:20]]
+    table = make_table(["날짜", "구분", "금액"], rows, [6, 10, 12]) if rows else "기록이 없습니다."
+    embed = make_embed(
+        title=f"벌점 내역 ({start[:7]})",
+        description=f"{member.mention}\n{table}",
+        color=COLOR_INFO
+    )
+    embed.add_field(name="이번 기간 합계", value=fmt_won(sum(e["amount"] for e in entries)), inline=True)
+    embed.add_field(name="현재 벌점", value=fmt_won(debt), inline=True)
+    outbox.reply(ctx.message, embed)
+
+@bot.command(name="study-settlement")
+@commands.has_permissions(manage_guild=True)
+async def study_settlement(ctx: commands.Context, month: str | None = None):
+    """월별 정산: 기간 동안 사용자별 벌점 증감 합계"""
+    start, end = month_range(month, guild_today(ctx.guild.id))
+    totals = await store.ledger_totals(ctx.guild.id, start, end)
+    names = await member_names.resolve_many(ctx.guild, [uid for uid, _ in totals[:25]])
+    rows = [[shorten(names[uid], 20), fmt_won(amount)] for uid, amount in totals[:25]]
+    table = make_table(["사용자", "합계"], rows, [20, 12]) if rows else "기록이 없습니다."
+    embed = make_embed(title=f"월별 정산 ({start[:7]})", description=table, color=COLOR_INFO)
+    embed.add_field(name="총액", value=fmt_won(sum(amount for _, amount in totals)), inline=False)
+    outbox.reply(ctx.message, embed)
+
+@study_history.error
+@study_settlement.error
+async def ledger_command_error(ctx: commands.Context, error):
+    if isinstance(error, commands.MissingPermissions):
+        embed = make_embed(
+            title="⛔ 권한 부족",
+            description="이 명령은 서버 관리 권한이 필요합니다.",
+            color=COLOR_DANGER
+        )
+    else:
+        embed = make_embed(
+            title="ℹ️ 사용법",
+            description="`!study-history [@사용자] [YYYY-MM]`, `!study-settlement [YYYY-MM]`",
             color=COLOR_MUTED
         )
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
+
+@bot.command(name="study-metrics")
+@commands.has_permissions(manage_guild=True)
+async def study_metrics(ctx: commands.Context):
+    _collect_runtime(metrics)
+    def ms(seconds: float) -> str:
+        return "∞" if seconds == float("inf") else f"{seconds * 1000:g}"
+
+    ops = sorted(
+        (key for key in metrics.histograms if key[0] in ("store_op_seconds", "discord_call_seconds")),
+        key=lambda key: metrics.count(key[0], **dict(key[1])), reverse=True
+    )[:10]
+    rows = []
+    for name, labels in ops:
+        lb = dict(labels)
+        op = lb.get("op") or lb.get("call")
+        errors = metrics.counters.get((name.removesuffix("_seconds") + "_errors_total", labels), 0)
+        rows.append([
+            shorten(op, 18), str(metrics.count(name, **lb)), str(int(errors)),
+            f"≤{ms(metrics.quantile(name, 0.5, **lb))}/{ms(metrics.quantile(name, 0.99, **lb))}"
+        ])
+    table = make_table(["호출", "횟수", "오류", "p50/p99(ms)"], rows, [18, 7, 4, 14]) if rows else "아직 기록 없음"
+    lag = metrics.gauges.get(("event_loop_lag_last_seconds", ()), 0.0)
+    desc = (
+        f"{table}\n"
+        f"이벤트 루프 지연: 최근 {lag * 1000:.1f}ms, p99 ≤{ms(metrics.quantile('event_loop_lag_seconds', 0.99))}ms\n"
+        f"전송 큐: 대기 {outbox.depth()}건, " + ", ".join(f"{k} {v}" for k, v in outbox.counters.items()) + "\n"
+        f"메시지 분류: " + ", ".join(f"{k} {v}" for k, v in routes.counters.items())
+    )
+    if hasattr(store, "buffer_stats") and store.buffer is not None:
+        b = store.buffer_stats()
+        desc += f"\n쓰기 버퍼: 대기 {b['depth']}건, 지연 {b['lag_seconds']:.1f}s, 반영 실패 {b['errors']}회"
+    if digest.daily:
+        desc += "\n인증 현황(digest) 절약 호출: " + ", ".join(
+            f"{d[5:]} {digest.saved(d)}" for d in sorted(digest.daily)[-3:]
+        )
+    embed = make_embed(title="📈 봇 지표", description=desc, color=COLOR_INFO)
+    for job, r in list(last_job_reports.items())[-3:]:
+        embed.add_field(
+            name=job,
+            value=f"길드 {r['guilds']} · 오류 {r['errors']} · p50 {r['p50']:.2f}s · p99 {r['p99']:.2f}s · 총 {r['total']:.2f}s",
+            inline=False
+        )
+    outbox.reply(ctx.message, embed)
 
 @bot.command(name="study-help")
 async def study_help(ctx: commands.Context):
@@ -616,24 +3638,32 @@ async def study_help(ctx: commands.Context):
         "```\n"
         "명령어\n"
         "!study-channel #채널      인증 채널 설정 (관리자)\n"
-        "!study-join [@유저]       스터디 참가 (본인/지정 사용자)\n"
-        "!study-leave              스터디 탈퇴\n"
+        "!study-schedule [HH:MM] [타임존] [분...]  마감/리마인더 설정 (관리자)\n"
+        "!study-confirm [reply|digest]  인증 확인 방식 (관리자)\n"
+        "!study-join [@유저...|@역할]   스터디 참가 (본인/지정 사용자)\n"
+        "!study-leave [@유저...|@역할]  스터디 탈퇴 (다른 사용자는 관리자)\n"
         "!study-status [@유저]     현재 벌점 확인\n"
         "!study-check  [@유저]     오늘 인증 여부 확인\n"
+        "!study-stats  [@유저]     연속 인증/월별 출석 통계\n"
         "!study-leaderboard        벌점 랭킹\n"
-        "!minus @유저              지정 유저에게 즉시 1,000원 벌점 (관리자)\n"
+        "!study-history [@유저] [YYYY-MM]  월별 벌점 내역\n"
+        "!study-settlement [YYYY-MM]  월별 정산 (관리자)\n"
+        "!minus @유저...|@역할     지정 유저에게 즉시 1,000원 벌점 (관리자)\n"
+        "!study-metrics            저장소/디스코드 호출 지표 (관리자)\n"
         "```\n"
         "인증은 설정된 채널에 이미지(사진)를 올리면 자동 처리됩니다.\n"
-        "전날 미인증자에게는 다음날 05:00(KST)에 1,000원 벌점이 부과됩니다."
+        "전날 미인증자에게는 다음날 마감 시각(기본 05:00 KST)에 1,000원 벌점이 부과됩니다."
     )
     embed = make_embed(title="공부봇 사용법", description=desc, color=COLOR_INFO)
-    await ctx.reply(embed=embed, mention_author=False)
+    outbox.reply(ctx.message, embed)
 
 def main():
     token = os.getenv("DISCORD_TOKEN")
     if not token:
         raise RuntimeError("환경변수 DISCORD_TOKEN 을 설정하세요.")
-    bot.run(token)
+    if SHARD_IDS is not None and not (MONGODB_URI or SQLITE_PATH):
+        raise RuntimeError("SHARD_IDS 로 여러 프로세스를 띄우려면 공유 저장소(MONGODB_URI 또는 SQLITE_PATH)가 필요합니다.")
+    bot.run(token, root_logger=True)  # studybot 로거도 discord 로그 형식으로 출력
 
 if __name__ == "__main__":
     main()                # 변경
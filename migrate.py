@@ -0,0 +1,400 @@
+"""studyBot 저장소 이전/백업 도구 (data.json <-> MongoDB).
+
+    python migrate.py import data.json              # data.json → MONGODB_URI
+    python migrate.py export backup.json            # MONGODB_URI → JSON 스냅샷 (백업)
+    python migrate.py verify data.json              # 두 쪽의 건수/체크섬만 비교
+
+data.json 은 길드 한 줄씩 읽어 컬렉션별로 모은 뒤 --batch-size 단위 bulk_write 로 보내고,
+동시에 최대 --parallel 개의 묶음을 보냅니다. 내보내기는 길드별 커서로 읽어 한 줄씩 쓰므로
+데이터가 커도 메모리는 (동시에 읽는) 길드 몇 개 분량만 씁니다.
+--checkpoint-every 길드마다 진행 위치를 <파일>.ckpt 에 남기고, 중단 후 같은 명령을 다시 실행하면
+그 다음 길드부터 이어서 합니다 (모든 쓰기가 upsert 라 겹쳐서 다시 써도 안전). 끝나면 두 쪽의
+길드/인증/원장 건수와 길드별 체크섬을 비교합니다. 다른 클러스터로 옮길 때는 export 후 import.
+
+봇을 멈춘 상태에서 실행하세요 (MONGODB_BUFFER_PATH 를 쓰면 버퍼가 빈 뒤에). 점유(lease)처럼 실행 중에만
+의미 있는 상태는 옮기지 않습니다.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+import bot
+
+# 길드 문서에 그대로 옮기는 필드 (posted/sub_seq 등 실행 중 동시성 제어용 필드는 제외)
+GUILD_FIELDS = ("channel_id", "participants", "schedule", "debt", "last_settled", "job_runs", "stats", "trend")
+# 파일 저장소는 길드 안에서만 유일한 결정적 원장 id 를 씀 → MongoDB 에선 길드 id 를 붙임
+SCOPED_KINDS = ("penalty", "opening")
+
+def scoped_id(gid: str, entry_id: str) -> str:
+    kind, sep, rest = entry_id.partition(":")
+    if sep and kind in SCOPED_KINDS and not rest.startswith(gid + ":"):
+        return f"{kind}:{gid}:{rest}"
+    return entry_id
+
+def local_id(gid: str, entry_id: str) -> str:
+    kind, sep, rest = entry_id.partition(":")
+    if sep and kind in SCOPED_KINDS and rest.startswith(gid + ":"):
+        return f"{kind}:{rest[len(gid) + 1:]}"
+    return entry_id
+
+# ---- 파일 저장소 (스트리밍) ----
+async def settle_snapshot(path: str):
+    """저널이 남아 있거나 이전 형식/원장·통계 도입 전 파일이면 DataStore 로 한 번 열어 스냅샷에 합침.
+
+    봇이 시작할 때 하는 처리와 같아서, 이후엔 스냅샷을 한 줄씩 읽기만 하면 됨."""
+    # 압축 후에도 빈 로그 파일은 남으므로 내용이 있을 때만 합칠 것이 있음
+    journal = any(os.path.exists(path + ext) and os.path.getsize(path + ext) for ext in (".log", ".log.old"))
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            header = json.loads(f.readline())
+        except json.JSONDecodeError:
+            header = None
+    if (not journal and isinstance(header, dict) and header.get("format") == bot.SNAPSHOT_FORMAT
+            and header.get("ledger_opened") and header.get("stats_built")):
+        return
+    store = bot.DataStore(path, journal=journal)
+    await store.load()
+    await store.save()
+    if store._compactor is not None:
+        store._compactor.cancel()
+    if store._journal_fp is not None:
+        store._journal_fp.close()
+    print(f"{path}: 저널/이전 형식을 스냅샷에 합침")
+
+def iter_snapshot(path: str, skip: int = 0, header: bool = True):
+    """(guild_id, 길드 본문) 을 파일 순서대로. 앞의 skip 개 길드는 파싱하지 않고 건너뜀."""
+    with open(path, "r", encoding="utf-8") as f:
+        if header:
+            f.readline()
+        n = 0
+        for line in f:
+            gid, sep, body = line.rstrip("\n").partition("\t")
+            if not sep:
+                continue
+            n += 1
+            if n > skip:
+                yield gid, json.loads(body)
+
+class SnapshotWriter:
+    """길드 줄을 <out>.part 에 이어 쓰고, 끝나면 라우팅 요약 헤더를 붙여 <out> 으로 교체."""
+
+    def __init__(self, out: str, offset: int = 0):
+        self.out = out
+        self.part = out + ".part"
+        mode = "r+" if offset and os.path.exists(self.part) else "w"
+        self._fp = open(self.part, mode, encoding="utf-8")
+        self._fp.seek(offset)
+        self._fp.truncate()  # 마지막 체크포인트 뒤에 쓰다 만 줄은 버림
+
+    def write(self, gid: str, g: dict):
+        self._fp.write(f"{gid}\t{json.dumps(g, ensure_ascii=False, separators=(',', ':'))}\n")
+
+    def offset(self) -> int:
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        return self._fp.tell()
+
+    def finish(self):
+        self._fp.close()
+        routes = {}
+        for gid, g in iter_snapshot(self.part, header=False):
+            routes[gid] = [g.get("channel_id"), g.get("participants", []), g.get("schedule")]
+        header = {"ledger_opened": True, "stats_built": True, "format": bot.SNAPSHOT_FORMAT, "routes": routes}
+        tmp = self.out + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as out, open(self.part, "r", encoding="utf-8") as body:
+            out.write(json.dumps(header, ensure_ascii=False, separators=(",", ":")) + "\n")
+            while chunk := body.read(1 << 20):
+                out.write(chunk)
+        os.replace(tmp, self.out)
+        os.remove(self.part)
+
+# ---- MongoDB ----
+def make_store(args) -> bot.MongoStore:
+    if not args.uri:
+        raise SystemExit("MONGODB_URI 또는 --uri 가 필요합니다.")
+    client = AsyncIOMotorClient(args.uri, uuidRepresentation="standard")
+    return bot.MongoStore(client, args.db, args.coll, cache_ttl=0, subs_coll_name=args.subs_coll)
+
+async def mongo_guild_ids(store: bot.MongoStore) -> list[str]:
+    """길드 문서가 없더라도 인증/원장이 남은 길드까지 포함해 정렬된 id 목록 (재개 순서 고정용)."""
+    ids = {d["_id"] async for d in store.coll.find({}, {"_id": 1})}
+    ids.update(await store.subs.distinct("guild_id"))
+    ids.update(await store.subs_archive.distinct("guild_id"))
+    ids.update(await store.ledger.distinct("guild_id"))
+    ids.discard(None)  # 원장의 표식 문서(__opened__ 등)
+    return sorted(ids)
+
+async def read_mongo_guild(store: bot.MongoStore, gid: str) -> dict:
+    """한 길드를 파일 저장소의 길드 본문 형식으로. 컬렉션마다 커서로 읽음."""
+    doc = await store.coll.find_one({"_id": gid}, {f: 1 for f in (*GUILD_FIELDS, "pending_ledger")}) or {}
+    if doc.get("pending_ledger"):
+        await store._flush_pending(gid, doc["pending_ledger"])  # 잔액엔 반영됐지만 원장에 아직 안 들어간 기록
+    g = {"channel_id": doc.get("channel_id"), "participants": doc.get("participants", []),
+         "debt": doc.get("debt", {}), "ledger": {}, "submissions": {}}
+    for f in GUILD_FIELDS:
+        if f in doc and f not in g:
+            g[f] = doc[f]
+    cursor = store.subs.find({"guild_id": gid}, {"_id": 0, "date": 1, "user_id": 1}).sort([("date", 1), ("user_id", 1)])
+    async for d in cursor:
+        g["submissions"].setdefault(d["date"], []).append(d["user_id"])
+    async for d in store.subs_archive.find({"guild_id": gid}, {"_id": 0, "month": 1, "days": 1}).sort("month", 1):
+        g.setdefault("archive", {})[d["month"]] = {date: sorted(uids) for date, uids in sorted(d["days"].items())}
+    cursor = store.ledger.find({"guild_id": gid}).sort([("date", 1), ("ts", 1)])
+    async for e in cursor:
+        g["ledger"].setdefault(e["user_id"], []).append({
+            "id": local_id(gid, e["_id"]), "amount": e["amount"], "kind": e["kind"], "date": e["date"], "ts": e.get("ts"),
+        })
+    return g
+
+async def iter_mongo(store: bot.MongoStore, gids: list[str], parallel: int):
+    """(guild_id, 길드 본문) 을 id 순서대로. parallel 개 길드씩 동시에 읽음."""
+    for i in range(0, len(gids), parallel):
+        chunk = gids[i:i + parallel]
+        for gid, g in zip(chunk, await asyncio.gather(*(read_mongo_guild(store, gid) for gid in chunk))):
+            yield gid, g
+
+def guild_ops(store: bot.MongoStore, gid: str, g: dict):
+    """길드 본문 하나를 (컬렉션, UpdateOne) 목록으로. 모두 upsert 라 몇 번 실행해도 결과가 같음."""
+    fields = {f: g[f] for f in GUILD_FIELDS if f in g}
+    yield store.coll, UpdateOne({"_id": gid}, {"$set": fields}, upsert=True)
+    for date, uids in g.get("submissions", {}).items():
+        for uid in uids:
+            yield store.subs, UpdateOne({"guild_id": gid, "date": date, "user_id": uid},
+                                        {"$setOnInsert": {"migrated": True}}, upsert=True)
+    for month, days in g.get("archive", {}).items():
+        yield store.subs_archive, UpdateOne(
+            {"_id": f"{gid}:{month}"},
+            {"$set": {"guild_id": gid, "month": month},
+             "$addToSet": {f"days.{date}": {"$each": sorted(uids)} for date, uids in days.items()}},
+            upsert=True
+        )
+    for uid, entries in g.get("ledger", {}).items():
+        for e in entries:
+            entry = dict(e, guild_id=gid, user_id=uid)
+            entry["_id"] = scoped_id(gid, entry.pop("id"))
+            yield store.ledger, UpdateOne({"_id": entry["_id"]}, {"$setOnInsert": entry}, upsert=True)
+
+class BulkWriter:
+    """컬렉션별로 모아 batch_size 마다 bulk_write(ordered=False). 동시에 parallel 묶음까지 보내고,
+    그 이상은 add 가 기다리므로 메모리에 쌓이는 양이 제한됨."""
+
+    def __init__(self, batch_size: int, parallel: int):
+        self.batch_size = batch_size
+        self._slots = asyncio.Semaphore(parallel)
+        self._pending: dict[str, tuple] = {}  # 컬렉션 이름 -> (컬렉션, [UpdateOne, ...])
+        self._tasks: set[asyncio.Task] = set()
+        self._errors: list[BaseException] = []
+        self.counters = {"ops": 0, "batches": 0, "upserted": 0}
+
+    async def add(self, coll, op: UpdateOne):
+        _, ops = self._pending.setdefault(coll.name, (coll, []))
+        ops.append(op)
+        if len(ops) >= self.batch_size:
+            await self._send(coll.name)
+
+    async def _send(self, name: str):
+        coll, ops = self._pending.pop(name)
+        await self._slots.acquire()
+        if self._errors:
+            self._slots.release()
+            raise self._errors[0]
+        task = asyncio.create_task(self._write(coll, ops))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, coll, ops: list):
+        try:
+            res = await coll.bulk_write(ops, ordered=False)
+            self.counters["ops"] += len(ops)
+            self.counters["batches"] += 1
+            self.counters["upserted"] += len(res.upserted_ids)
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        """모아 둔 것까지 모두 보내고 끝날 때까지 기다림. 실패한 묶음이 있으면 그 오류를 올림."""
+        for name in list(self._pending):
+            await self._send(name)
+        await asyncio.gather(*list(self._tasks))
+        if self._errors:
+            raise self._errors[0]
+
+# ---- 체크포인트 ----
+class Checkpoint:
+    """진행 위치를 JSON 파일에 원자적으로 기록. 다른 작업/원본의 체크포인트면 처음부터."""
+
+    def __init__(self, path: str, job: dict, restart: bool = False):
+        self.path = path
+        self.job = job
+        self.state: dict = {}
+        if not restart and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("job") == job:
+                self.state = saved.get("state", {})
+            else:
+                print(f"{path}: 다른 작업의 체크포인트라 처음부터 시작")
+
+    def save(self, **state):
+        self.state = state
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"job": self.job, "state": state}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def progress(done: int, total: int | None, t0: float, extra: str = ""):
+    rate = done / (time.perf_counter() - t0 or 1e-9)
+    of = f"/{total}" if total is not None else ""
+    print(f"  {done}{of} guilds ({rate:.0f}/s){extra}", flush=True)
+
+# ---- 검증 ----
+def guild_digest(gid: str, g: dict) -> tuple[dict, str]:
+    """건수와 체크섬. 보관 여부/저장 순서/원장 id 형식처럼 저장소마다 다른 부분은 정규화해서 비교."""
+    subs = {f"{d} {u}" for d, uids in g.get("submissions", {}).items() for u in uids}
+    subs.update(f"{d} {u}" for days in g.get("archive", {}).values() for d, uids in days.items() for u in uids)
+    ledger = sorted(
+        [uid, local_id(gid, e["id"]), e["amount"], e["kind"], e["date"], e.get("ts")]
+        for uid, entries in g.get("ledger", {}).items() for e in entries
+    )
+    body = {f: g.get(f) for f in GUILD_FIELDS}
+    body["participants"] = sorted(g.get("participants", []))
+    body["debt"] = {u: v for u, v in g.get("debt", {}).items() if v}  # 0 원 항목은 저장소마다 있거나 없음
+    body["submissions"] = sorted(subs)
+    body["ledger"] = ledger
+    text = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    counts = {"submissions": len(subs), "ledger": len(ledger), "participants": len(body["participants"])}
+    return counts, hashlib.sha256(text.encode()).hexdigest()
+
+async def summarize(records) -> tuple[dict, dict[str, str]]:
+    """(guild_id, 길드 본문) 스트림의 전체 건수와 길드별 체크섬."""
+    totals = {"guilds": 0, "submissions": 0, "ledger": 0, "participants": 0}
+    digests = {}
+    async for gid, g in records:
+        counts, digests[gid] = guild_digest(gid, g)
+        totals["guilds"] += 1
+        for k, v in counts.items():
+            totals[k] += v
+    return totals, digests
+
+async def _stream(items):
+    for item in items:
+        yield item
+
+async def verify(path: str, store: bot.MongoStore, parallel: int) -> bool:
+    print("검증: 건수와 길드별 체크섬 비교")
+    a_totals, a = await summarize(_stream(iter_snapshot(path)))
+    b_totals, b = await summarize(iter_mongo(store, await mongo_guild_ids(store), parallel))
+    for k in a_totals:
+        mark = "OK" if a_totals[k] == b_totals[k] else "불일치"
+        print(f"  {k:<13} json={a_totals[k]:<10} mongo={b_totals[k]:<10} {mark}")
+    combined = [hashlib.sha256("".join(f"{g}:{d}\n" for g, d in sorted(x.items())).encode()).hexdigest() for x in (a, b)]
+    print(f"  checksum      json={combined[0][:16]} mongo={combined[1][:16]}")
+    diff = sorted(g for g in a.keys() | b.keys() if a.get(g) != b.get(g))
+    if diff:
+        print(f"  다른 길드 {len(diff)}개: {', '.join(diff[:20])}{' …' if len(diff) > 20 else ''}")
+    return not diff and a_totals == b_totals
+
+# ---- 명령 ----
+async def run_import(args) -> bool:
+    await settle_snapshot(args.path)
+    store = make_store(args)
+    await store.load()  # 인덱스와 원장/통계 표식 (가져온 원장과 통계를 다시 만들지 않도록)
+    st = os.stat(args.path)
+    ckpt = Checkpoint(args.checkpoint or args.path + ".ckpt",
+                      {"cmd": "import", "source": os.path.abspath(args.path), "size": st.st_size,
+                       "mtime": st.st_mtime, "target": [args.db, args.coll, args.subs_coll]}, args.restart)
+    done = ckpt.state.get("guilds", 0)
+    if done:
+        print(f"체크포인트에서 이어서: 길드 {done}개 완료")
+    writer = BulkWriter(args.batch_size, args.parallel)
+    t0 = time.perf_counter()
+    for gid, g in iter_snapshot(args.path, skip=done):
+        for coll, op in guild_ops(store, gid, g):
+            await writer.add(coll, op)
+        done += 1
+        if done % args.checkpoint_every == 0:
+            await writer.drain()  # 여기까지 모두 반영된 뒤에만 위치를 남김
+            ckpt.save(guilds=done)
+            progress(done, None, t0, f", {writer.counters['ops']} ops")
+    await writer.drain()
+    ckpt.save(guilds=done)
+    progress(done, None, t0, f", {writer.counters['ops']} ops in {writer.counters['batches']} batches")
+    ok = args.no_verify or await verify(args.path, store, args.parallel)
+    if ok:
+        ckpt.clear()
+    return ok
+
+async def run_export(args) -> bool:
+    store = make_store(args)
+    gids = await mongo_guild_ids(store)
+    ckpt = Checkpoint(args.checkpoint or args.path + ".ckpt",
+                      {"cmd": "export", "source": [args.uri, args.db, args.coll, args.subs_coll],
+                       "target": os.path.abspath(args.path)}, args.restart)
+    last, offset = ckpt.state.get("last"), ckpt.state.get("offset", 0)
+    if not os.path.exists(args.path + ".part"):
+        last, offset = None, 0  # 이어 쓸 중간 파일이 없으면 처음부터
+    todo = [gid for gid in gids if last is None or gid > last]
+    if last is not None:
+        print(f"체크포인트에서 이어서: {last} 까지 완료")
+    out = SnapshotWriter(args.path, offset)
+    t0 = time.perf_counter()
+    done = 0
+    async for gid, g in iter_mongo(store, todo, args.parallel):
+        out.write(gid, g)
+        done += 1
+        if done % args.checkpoint_every == 0:
+            ckpt.save(last=gid, offset=out.offset())
+            progress(done, len(todo), t0)
+    out.offset()
+    out.finish()
+    progress(done, len(todo), t0)
+    ok = args.no_verify or await verify(args.path, store, args.parallel)
+    if ok:
+        ckpt.clear()
+    return ok
+
+async def run_verify(args) -> bool:
+    await settle_snapshot(args.path)
+    return await verify(args.path, make_store(args), args.parallel)
+
+def main():
+    p = argparse.ArgumentParser(description="studyBot data.json <-> MongoDB 이전/백업")
+    p.add_argument("command", choices=["import", "export", "verify"],
+                   help="import: JSON → MongoDB, export: MongoDB → JSON, verify: 비교만")
+    p.add_argument("path", help="data.json (import/verify) 또는 내보낼 파일 (export)")
+    p.add_argument("--uri", default=bot.MONGODB_URI, help="기본: MONGODB_URI")
+    p.add_argument("--db", default=bot.MONGODB_DB)
+    p.add_argument("--coll", default=bot.MONGODB_COLL)
+    p.add_argument("--subs-coll", default=bot.MONGODB_SUBS_COLL)
+    p.add_argument("--batch-size", type=int, default=1000, help="bulk_write 한 번에 보낼 최대 연산 수")
+    p.add_argument("--parallel", type=int, default=4, help="동시에 보낼 묶음 / 동시에 읽을 길드 수")
+    p.add_argument("--checkpoint", help="체크포인트 파일 (기본: <path>.ckpt)")
+    p.add_argument("--checkpoint-every", type=int, default=100, help="진행 위치를 남길 길드 간격")
+    p.add_argument("--restart", action="store_true", help="체크포인트를 무시하고 처음부터")
+    p.add_argument("--no-verify", action="store_true", help="끝난 뒤 건수/체크섬 비교 생략")
+    args = p.parse_args()
+
+    run = {"import": run_import, "export": run_export, "verify": run_verify}[args.command]
+    try:
+        ok = asyncio.run(run(args))
+    except (OSError, PyMongoError) as e:
+        print(f"중단됨: {e!r}\n같은 명령을 다시 실행하면 마지막 체크포인트부터 이어서 합니다.", file=sys.stderr)
+        return 2
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())